@@ -0,0 +1,132 @@
+"""
+Load scenarios for the movie recommendation API.
+
+Each scenario is a Locust tag, so the runner can drive them one at a time:
+retrieve, trending, paging, discover, recommendations, posters and writes. Users log in as the
+accounts created by `manage.py seed_benchmark_data`.
+
+Environment:
+    BENCH_USERS      number of seeded users to log in as (default 1000)
+    BENCH_MOVIES     size of the seeded movie catalog (default 10000)
+    BENCH_PASSWORD   password given to the seeder (default benchmark-pass)
+    BENCH_WAIT       think time between tasks in seconds (default 0)
+    BENCH_SAMPLES    if set, raw samples are written here as JSON on test stop
+"""
+
+import itertools
+import json
+import os
+import random
+
+from locust import HttpUser, constant, events, tag, task
+
+
+USERS = int(os.environ.get('BENCH_USERS', 1000))
+MOVIES = int(os.environ.get('BENCH_MOVIES', 10000))
+PASSWORD = os.environ.get('BENCH_PASSWORD', 'benchmark-pass')
+WAIT = float(os.environ.get('BENCH_WAIT', 0))
+SAMPLES_PATH = os.environ.get('BENCH_SAMPLES')
+
+GENRE_IDS = [28, 12, 16, 35, 80, 99, 18, 10751, 14, 36, 27, 10402, 9648, 10749, 878, 53, 10752, 37]
+MOVIE_IDS = list(range(1, MOVIES + 1))
+MOVIE_CUM_WEIGHTS = list(itertools.accumulate(1.0 / rank ** 1.1 for rank in MOVIE_IDS))
+
+samples = []
+
+
+@events.request.add_listener
+def record_sample(request_type, name, response_time, response=None, exception=None, **kwargs):
+    db_queries = None
+    if response is not None and response.headers.get('X-DB-Query-Count') is not None:
+        db_queries = int(response.headers['X-DB-Query-Count'])
+    samples.append({
+        'name': name,
+        'response_time_ms': response_time,
+        'db_queries': db_queries,
+        'failed': exception is not None,
+    })
+
+
+@events.test_stop.add_listener
+def dump_samples(environment, **kwargs):
+    if SAMPLES_PATH:
+        with open(SAMPLES_PATH, 'w') as fh:
+            json.dump(samples, fh)
+
+
+def skewed_movie_id():
+    """Pick a movie with the same Zipf-like skew the seeder used for ratings."""
+    return random.choices(MOVIE_IDS, cum_weights=MOVIE_CUM_WEIGHTS)[0]
+
+
+class ApiUser(HttpUser):
+    wait_time = constant(WAIT)
+
+    def on_start(self):
+        index = random.randrange(USERS)
+        response = self.client.post(
+            '/api/token/',
+            json={'email': f"bench{index}@bench.local", 'password': PASSWORD},
+            name='/api/token/',
+        )
+        response.raise_for_status()
+        data = response.json()
+        self.user_id = data['user_id']
+        self.client.headers['Authorization'] = f"Bearer {data['access']}"
+
+    @tag('retrieve')
+    @task(5)
+    def retrieve_movie(self):
+        self.client.get(f"/api/movies/{skewed_movie_id()}/", name='/api/movies/[tmdb_id]/')
+
+    @tag('trending')
+    @task(3)
+    def trending(self):
+        window = random.choice(['day', 'week'])
+        self.client.get(f"/api/movies/trending/?time_window={window}", name='/api/movies/trending/')
+
+    @tag('discover')
+    @task(2)
+    def discover(self):
+        genres = ','.join(map(str, random.sample(GENRE_IDS, random.randint(1, 2))))
+        self.client.get(f"/api/movies/discover/?genres={genres}", name='/api/movies/discover/')
+
+    @tag('paging')
+    @task(2)
+    def paging(self):
+        # Sequential browsing: with prefetch, pages after the first should be cache hits.
+        window = random.choice(['day', 'week'])
+        for page in range(1, 6):
+            self.client.get(
+                f"/api/movies/trending/?time_window={window}&page={page}",
+                name=f"/api/movies/trending/?page={page}",
+            )
+
+    @tag('recommendations')
+    @task(2)
+    def recommendations(self):
+        self.client.get('/api/recommendations/', name='/api/recommendations/')
+
+    @tag('posters')
+    @task(3)
+    def poster(self):
+        # Stub poster names; after the first fetch of each, served from the local cache.
+        width = random.choice(['w185', 'w342', 'w500'])
+        self.client.get(f"/api/posters/{width}/stub{skewed_movie_id()}.jpg", name=f"/api/posters/{width}/[name]")
+
+    @tag('writes')
+    @task(1)
+    def rate_movie(self):
+        payload = {'user': self.user_id, 'tmdb_id': skewed_movie_id(), 'rating': random.randint(1, 10)}
+        with self.client.post('/api/ratings/', json=payload, name='/api/ratings/', catch_response=True) as response:
+            # A 400 here is the unique (user, tmdb_id) constraint, which is expected under load.
+            if response.status_code in (201, 400):
+                response.success()
+
+    @tag('writes')
+    @task(1)
+    def add_to_watchlist(self):
+        payload = {'user': self.user_id, 'tmdb_id': random.choice(MOVIE_IDS)}
+        with self.client.post('/api/watchlist/', json=payload, name='/api/watchlist/', catch_response=True) as response:
+            if response.status_code in (201, 400):
+                response.success()
@@ -0,0 +1,152 @@
+"""
+Run the load scenarios one at a time and write a JSON report.
+
+Expects the API (started with BENCHMARK_MODE=True and TMDB_BASE_URL pointing at
+the stub) and benchmarks/tmdb_stub.py to be running already. Each scenario runs
+in its own Locust process so per-request upstream calls can be read from the
+stub's counters.
+
+Usage:
+    python benchmarks/run.py --host http://127.0.0.1:8000 --users 50 --duration 60
+    python benchmarks/run.py --compare benchmarks/reports/<old>.json benchmarks/reports/<new>.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+SCENARIOS = ['retrieve', 'trending', 'paging', 'discover', 'recommendations', 'posters', 'writes']
+HERE = Path(__file__).resolve().parent
+IGNORED_NAMES = {'/api/token/'}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100.0 * len(sorted_values)) - 1))
+    return round(sorted_values[index], 2)
+
+
+def stub_call(stub_url, path, method='GET'):
+    request = urllib.request.Request(f"{stub_url}{path}", method=method)
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def summarize(samples, duration, upstream_calls):
+    samples = [s for s in samples if s['name'] not in IGNORED_NAMES]
+    times = sorted(s['response_time_ms'] for s in samples)
+    queries = [s['db_queries'] for s in samples if s['db_queries'] is not None]
+    count = len(samples)
+    return {
+        'requests': count,
+        'failures': sum(1 for s in samples if s['failed']),
+        'rps': round(count / duration, 2) if duration else None,
+        'p50_ms': percentile(times, 50),
+        'p95_ms': percentile(times, 95),
+        'p99_ms': percentile(times, 99),
+        'db_queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        'upstream_calls_per_request': round(upstream_calls / count, 3) if count else None,
+    }
+
+
+def run_scenario(args, scenario):
+    stub_call(args.stub, '/__reset', method='POST')
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as fh:
+        samples_path = fh.name
+
+    env = dict(os.environ, BENCH_SAMPLES=samples_path)
+    command = [
+        sys.executable, '-m', 'locust',
+        '-f', str(HERE / 'locustfile.py'),
+        '--headless', '--only-summary',
+        '--host', args.host,
+        '-u', str(args.users),
+        '-r', str(args.spawn_rate or args.users),
+        '-t', f"{args.duration}s",
+        '--tags', scenario,
+    ]
+    started = time.monotonic()
+    subprocess.run(command, env=env, check=False)
+    elapsed = time.monotonic() - started
+
+    try:
+        with open(samples_path) as fh:
+            samples = json.load(fh)
+    finally:
+        os.unlink(samples_path)
+
+    upstream = stub_call(args.stub, '/__stats').get('total', 0)
+    return summarize(samples, min(elapsed, args.duration), upstream)
+
+
+def compare(old_path, new_path):
+    old = json.loads(Path(old_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    metrics = ['rps', 'p50_ms', 'p95_ms', 'p99_ms', 'db_queries_per_request', 'upstream_calls_per_request']
+    print(f"{'scenario':<16}{'metric':<28}{old['commit']:>12}{new['commit']:>12}{'change':>10}")
+    for scenario, new_stats in new['scenarios'].items():
+        old_stats = old['scenarios'].get(scenario, {})
+        for metric in metrics:
+            before, after = old_stats.get(metric), new_stats.get(metric)
+            change = ''
+            if before and after is not None:
+                change = f"{(after - before) / before * 100:+.1f}%"
+            print(f"{scenario:<16}{metric:<28}{str(before):>12}{str(after):>12}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='http://127.0.0.1:8000')
+    parser.add_argument('--stub', default='http://127.0.0.1:8001')
+    parser.add_argument('--users', type=int, default=20, help="Concurrent simulated users.")
+    parser.add_argument('--spawn-rate', type=int, default=None)
+    parser.add_argument('--duration', type=int, default=30, help="Seconds per scenario.")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--output', default=None, help="Report path (defaults to benchmarks/reports/<commit>.json).")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Compare two reports and exit.")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'config': {
+            'host': args.host,
+            'users': args.users,
+            'duration_s': args.duration,
+        },
+        'scenarios': {},
+    }
+    for scenario in args.scenarios:
+        print(f"Running scenario: {scenario}")
+        report['scenarios'][scenario] = run_scenario(args, scenario)
+
+    output = Path(args.output) if args.output else HERE / 'reports' / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(json.dumps(report['scenarios'], indent=2))
+    print(f"Report written to {output}")
+
+
+if __name__ == '__main__':
+    main()
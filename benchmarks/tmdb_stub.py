@@ -0,0 +1,199 @@
+"""
+Local stand-in for the TMDb API used by the load tests.
+
+Serves the endpoints TMDbAPI calls (movie details, trending, discover and genres)
+and the poster images the poster proxy fetches, with deterministic synthetic
+data, configurable latency and a configurable error rate. Call counts are exposed on /__stats so the benchmark runner can
+report upstream calls per request.
+
+Usage:
+    python benchmarks/tmdb_stub.py --port 8001 --latency-ms 80 --jitter-ms 40 --error-rate 0.01
+    TMDB_BASE_URL=http://127.0.0.1:8001/3 TMDB_IMAGE_URL=http://127.0.0.1:8001/t/p python manage.py runserver
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+GENRES = {
+    28: 'Action', 12: 'Adventure', 16: 'Animation', 35: 'Comedy', 80: 'Crime',
+    99: 'Documentary', 18: 'Drama', 10751: 'Family', 14: 'Fantasy', 36: 'History',
+    27: 'Horror', 10402: 'Music', 9648: 'Mystery', 10749: 'Romance',
+    878: 'Science Fiction', 53: 'Thriller', 10752: 'War', 37: 'Western',
+}
+PAGE_SIZE = 20
+
+MOVIE_RE = re.compile(r'^/3/movie/(\d+)$')
+TRENDING_RE = re.compile(r'^/3/trending/movie/(day|week)$')
+DISCOVER_RE = re.compile(r'^/3/discover/movie$')
+GENRES_RE = re.compile(r'^/3/genre/movie/list$')
+IMAGE_RE = re.compile(r'^/t/p/w(\d+)/([A-Za-z0-9_-]+\.jpg)$')
+
+
+def movie_summary(tmdb_id):
+    """Deterministic list-style result, as returned by trending/discover."""
+    rng = random.Random(tmdb_id)
+    genre_ids = rng.sample(sorted(GENRES), rng.randint(1, 3))
+    return {
+        'id': tmdb_id,
+        'title': f"Stub Movie {tmdb_id}",
+        'release_date': f"{rng.randint(1950, 2025)}-01-01",
+        'overview': "Synthetic movie served by the TMDb stub.",
+        'poster_path': f"/stub{tmdb_id}.jpg",
+        'genre_ids': genre_ids,
+        'popularity': round(1000.0 / tmdb_id, 3),
+    }
+
+
+def movie_details(tmdb_id):
+    """Deterministic detail-style result, as returned by /movie/{id}."""
+    data = movie_summary(tmdb_id)
+    data['genres'] = [{'id': genre_id, 'name': GENRES[genre_id]} for genre_id in data.pop('genre_ids')]
+    return data
+
+
+def poster_image(width, name):
+    """Deterministic stand-in for a JPEG poster, about as large as TMDb's at that width."""
+    rng = random.Random(f"{width}/{name}")
+    return b'\xff\xd8\xff\xe0' + rng.randbytes(width * width // 4)
+
+
+class StubState:
+    """Configuration and call counters shared by all handler threads."""
+
+    def __init__(self, latency_ms, jitter_ms, error_rate, catalog_size, seed):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.catalog_size = catalog_size
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def record(self, route):
+        with self.lock:
+            self.calls[route] += 1
+            self.calls['total'] += 1
+            return self.rng.random(), self.rng.random()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.calls)
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_image(self, content):
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_POST(self):
+        if self.path == '/__reset':
+            self.state.reset()
+            return self._send(200, {'reset': True})
+        return self._send(404, {'status_message': 'Not found'})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == '/__stats':
+            return self._send(200, self.state.snapshot())
+
+        routes = (
+            ('movie', MOVIE_RE), ('trending', TRENDING_RE), ('discover', DISCOVER_RE), ('genres', GENRES_RE),
+            ('image', IMAGE_RE),
+        )
+        for route, pattern in routes:
+            match = pattern.match(url.path)
+            if match:
+                break
+        else:
+            return self._send(404, {'status_message': 'Not found'})
+
+        error_roll, jitter_roll = self.state.record(route)
+        time.sleep(self.state.latency + self.state.jitter * jitter_roll)
+        if error_roll < self.state.error_rate:
+            return self._send(503, {'status_message': 'Stub injected failure'})
+
+        if route == 'image':
+            return self._send_image(poster_image(int(match.group(1)), match.group(2)))
+        page = int(query.get('page', ['1'])[0])
+        if route == 'genres':
+            return self._send(200, {'genres': [{'id': genre_id, 'name': name} for genre_id, name in GENRES.items()]})
+        if route == 'movie':
+            tmdb_id = int(match.group(1))
+            if not 1 <= tmdb_id <= self.state.catalog_size:
+                return self._send(404, {'status_message': 'Not found'})
+            return self._send(200, movie_details(tmdb_id))
+
+        if route == 'trending':
+            # Weekly trending rotates more slowly than daily.
+            offset = 0 if match.group(1) == 'week' else PAGE_SIZE // 2
+            start = offset + (page - 1) * PAGE_SIZE + 1
+            ids = range(start, start + PAGE_SIZE)
+        else:
+            wanted = {int(g) for g in query.get('with_genres', [''])[0].split(',') if g}
+            ids = []
+            tmdb_id = (page - 1) * PAGE_SIZE * 4 + 1
+            while len(ids) < PAGE_SIZE and tmdb_id <= self.state.catalog_size:
+                if wanted <= set(movie_summary(tmdb_id)['genre_ids']):
+                    ids.append(tmdb_id)
+                tmdb_id += 1
+
+        results = [movie_summary(i) for i in ids if i <= self.state.catalog_size]
+        total_pages = max(1, self.state.catalog_size // PAGE_SIZE)
+        return self._send(200, {'page': page, 'results': results, 'total_pages': total_pages})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=25.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--catalog-size', type=int, default=10000,
+                        help="Highest tmdb_id the stub knows about; match seed_benchmark_data --movies.")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    StubHandler.state = StubState(args.latency_ms, args.jitter_ms, args.error_rate, args.catalog_size, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"TMDb stub listening on http://{args.host}:{args.port}/3")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+from movie_recommendation.celery import app as celery_app
+
+__all__ = ('celery_app',)
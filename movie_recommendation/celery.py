@@ -0,0 +1,16 @@
+"""
+Celery application for the movie_recommendation project.
+
+Start a worker with:
+    celery -A movie_recommendation worker -l info
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'movie_recommendation.settings')
+
+app = Celery('movie_recommendation')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
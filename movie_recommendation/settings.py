@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from datetime import timedelta
 from pathlib import Path
+from celery.schedules import crontab
+from django.core.exceptions import ImproperlyConfigured
 import environ
 import os
 
@@ -29,7 +31,7 @@ environ.Env.read_env(os.path.join(BASE_DIR, '.env'))
 SECRET_KEY = env('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = env('DEBUG')
+DEBUG = env.bool('DEBUG')
 
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS')
 
@@ -56,15 +58,35 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Stateless JWT builds request.user from token claims (movies.auth.ClaimsUser),
+    # so authentication costs no DB query. Session auth is kept for the browsable API.
     'DEFAULT_AUTHENTICATION_CLASSES': [
-         'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
-    ]
+    ],
+    # GCRA throttles (movies/throttling.py). Anonymous clients are keyed by IP, users by id;
+    # the upstream budget covers actions that can call TMDb (discover, trending, uncached retrieve).
+    'DEFAULT_THROTTLE_CLASSES': [
+        'movies.throttling.RequestRateThrottle',
+        'movies.throttling.UpstreamRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'request_anon': env('THROTTLE_RATE_ANON', default='120/min'),
+        'request_user': env('THROTTLE_RATE_USER', default='600/min'),
+        'upstream_anon': env('THROTTLE_RATE_UPSTREAM_ANON', default='20/min'),
+        'upstream_user': env('THROTTLE_RATE_UPSTREAM_USER', default='120/min'),
+    },
+    # Proxies in front of the app; the client IP is taken from X-Forwarded-For accordingly.
+    'NUM_PROXIES': env.int('NUM_PROXIES', default=None),
 }
+# Throttle state is shared through Redis when set, kept per process otherwise.
+THROTTLE_REDIS_URL = env('THROTTLE_REDIS_URL', default=None)
 
 # Middleware
 MIDDLEWARE = [
+    'movies.middleware.PerformanceMiddleware',
+    'movies.middleware.LoadSheddingMiddleware',
+    'movies.routers.PrimaryForWritesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,6 +96,28 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Performance instrumentation (see movies/middleware.py and /metrics)
+PERFORMANCE_SERVER_TIMING = env.bool('PERFORMANCE_SERVER_TIMING', default=True)
+# Bearer token required to scrape /metrics. Without one, /metrics is only served in
+# DEBUG or to staff sessions.
+METRICS_TOKEN = env('METRICS_TOKEN', default=None)
+# Request profiling (see movies/profiling.py and /api/profiles/)
+PROFILING_ENABLED = env.bool('PROFILING_ENABLED', default=False)
+PROFILING_THRESHOLD_MS = env.int('PROFILING_THRESHOLD_MS', default=1000)
+PROFILING_SAMPLE_INTERVAL_MS = env.int('PROFILING_SAMPLE_INTERVAL_MS', default=5)
+PROFILING_DIR = env('PROFILING_DIR', default=str(BASE_DIR / 'profiles'))
+PROFILING_MAX_PROFILES = env.int('PROFILING_MAX_PROFILES', default=50)
+# Load shedding (see movies.middleware.LoadSheddingMiddleware): 503 + Retry-After when a
+# request queued longer than LOAD_SHED_MAX_QUEUE_MS behind the proxy (needs its
+# X-Request-Start header), or a process has too many requests in flight (threaded or
+# async workers only) or its recent latency is over target. 0 disables.
+LOAD_SHED_MAX_QUEUE_MS = env.int('LOAD_SHED_MAX_QUEUE_MS', default=1000)
+LOAD_SHED_MAX_IN_FLIGHT = env.int('LOAD_SHED_MAX_IN_FLIGHT', default=64)
+LOAD_SHED_LATENCY_MS = env.int('LOAD_SHED_LATENCY_MS', default=0)
+LOAD_SHED_RETRY_AFTER = env.int('LOAD_SHED_RETRY_AFTER', default=1)
+# Benchmark mode adds per-request DB query counts to responses for the load tests.
+BENCHMARK_MODE = env.bool('BENCHMARK_MODE', default=False)
+
 ROOT_URLCONF = 'movie_recommendation.urls'
 
 TEMPLATES = [
@@ -112,9 +156,45 @@ DATABASES = {
         'PASSWORD': env('DB_PASSWORD'),
         'HOST': env('DB_HOST'),
         'PORT': env('DB_PORT'),
+        # Keep connections open between requests and check them before reuse
+        'CONN_MAX_AGE': env.int('DB_CONN_MAX_AGE', default=60),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Native connection pool; requires psycopg 3 with the pool extra (psycopg[pool])
+if env.bool('DB_POOL', default=False):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': env.int('DB_POOL_MIN_SIZE', default=2),
+            'max_size': env.int('DB_POOL_MAX_SIZE', default=10),
+        },
+    }
+
+# Read replicas, as database URLs (postgres://... or sqlite:///... for local testing)
+for index, url in enumerate(env.list('DB_REPLICA_URLS', default=[])):
+    replica = env.db_url_config(url)
+    replica.setdefault('CONN_MAX_AGE', DATABASES['default']['CONN_MAX_AGE'])
+    replica.setdefault('CONN_HEALTH_CHECKS', True)
+    replica['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f'replica_{index}'] = replica
+
+DATABASE_ROUTERS = ['movies.routers.ReadReplicaRouter']
+
+# Hash partitions of the Rating table on PostgreSQL (see movies/partitioning.py).
+# Read when the table is partitioned; changing it later needs a new backfill.
+RATING_PARTITIONS = env.int('RATING_PARTITIONS', default=16)
+
+# Seconds a user's reads stay on the primary after they write
+REPLICA_STICKY_SECONDS = env.int('REPLICA_STICKY_SECONDS', default=10)
+
+# Admin changelists (see movies/admin.py) show the planner's row estimate on PostgreSQL;
+# estimates below this are replaced by an exact COUNT(*).
+ADMIN_EXACT_COUNT_BELOW = env.int('ADMIN_EXACT_COUNT_BELOW', default=10000)
+# Movies per background job queued by the admin's bulk actions
+ADMIN_ACTION_BATCH_SIZE = env.int('ADMIN_ACTION_BATCH_SIZE', default=1000)
+
 
 
 
@@ -165,11 +245,14 @@ AUTH_USER_MODEL = 'movies.User'
 SIMPLE_JWT = {
     'USER_ID_FIELD': 'user_id',
     'USER_ID_CLAIM': 'user_id',
-    'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
+    # Staff flags are read from access token claims (movies.auth.ClaimsUser) and
+    # re-read on refresh, so this bounds how long a revoked right keeps working.
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=env.int('ACCESS_TOKEN_LIFETIME_MINUTES', default=10)),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     # 'ROTATE_REFRESH_TOKENS': False,
     # 'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_USER_CLASS': 'movies.auth.ClaimsUser',
 }
 
 
@@ -177,6 +260,7 @@ SIMPLE_JWT = {
 
 SWAGGER_SETTINGS = {
     'USE_SESSION_AUTH': False,
+    'SPEC_URL': 'schema-json',
     'SECURITY_DEFINITIONS': {
         'Bearer': {
             'type': 'apiKey',
@@ -188,10 +272,100 @@ SWAGGER_SETTINGS = {
 
 REDOC_SETTINGS = {
     'LAZY_RENDERING': False,
+    'SPEC_URL': 'schema-json',
 }
 
+# Pre-generated OpenAPI schema (see `manage.py generate_openapi_schema`); the YAML copy
+# sits next to it. Only DEBUG introspects the views per request.
+OPENAPI_SCHEMA_PATH = env('OPENAPI_SCHEMA_PATH', default=str(BASE_DIR / 'openapi.json'))
+OPENAPI_SCHEMA_MAX_AGE = env.int('OPENAPI_SCHEMA_MAX_AGE', default=3600)
+
 # TMDB API settings
 TMDB_API_KEY = env('TMDB_API_KEY')
+# Point this at benchmarks/tmdb_stub.py to load-test without hitting TMDb.
+TMDB_BASE_URL = env('TMDB_BASE_URL', default='https://api.themoviedb.org/3')
+# Seconds before a TMDb call is abandoned, so a hung connection cannot wedge a worker
+# or the background prefetch and hydration pools.
+TMDB_TIMEOUT = env.float('TMDB_TIMEOUT', default=10.0)
+# Serving trending/discover page k warms page k + 1 in the background, up to this page.
+TMDB_PREFETCH_MAX_PAGE = env.int('TMDB_PREFETCH_MAX_PAGE', default=5)
+TMDB_PREFETCH_CONCURRENCY = env.int('TMDB_PREFETCH_CONCURRENCY', default=2)
+
+# Poster image proxy (see movies/posters.py). Posters are fetched from TMDB_IMAGE_URL by
+# POSTER_FETCHER once per width and kept in an LRU disk cache of POSTER_CACHE_MAX_MB.
+TMDB_IMAGE_URL = env('TMDB_IMAGE_URL', default='https://image.tmdb.org/t/p')
+POSTER_FETCHER = env('POSTER_FETCHER', default='movies.posters.HTTPPosterFetcher')
+POSTER_CACHE_DIR = env('POSTER_CACHE_DIR', default=str(BASE_DIR / 'poster_cache'))
+POSTER_CACHE_MAX_MB = env.int('POSTER_CACHE_MAX_MB', default=2048)
+# Widths TMDb pre-generates that the proxy serves and MovieSerializer links
+POSTER_WIDTHS = env.list('POSTER_WIDTHS', default=['w92', 'w154', 'w185', 'w342', 'w500', 'w780'])
+POSTER_MAX_AGE = env.int('POSTER_MAX_AGE', default=31536000)
+
+# Celery settings
+CELERY_BROKER_URL = env('CELERY_BROKER_URL', default='redis://localhost:6379/0')
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Run with `celery -A movie_recommendation beat`
+CELERY_BEAT_SCHEDULE = {
+    'precompute-recommendations': {
+        'task': 'movies.tasks.precompute_recommendations',
+        'schedule': crontab(hour=3, minute=0),
+    },
+}
 
-# Caching settings
+# Write-behind ingestion of TMDb payloads into Movie (see movies/ingest.py)
+# 'celery' (production default) publishes each request's payloads to the broker, so
+# they survive crashes and restarts; it needs a Celery worker. 'thread' batches them
+# in process and loses what is pending if the process dies; 'sync' writes inline.
+MOVIE_INGEST_BACKEND = env('MOVIE_INGEST_BACKEND', default='celery')
+# Movies per ingest task or per write-behind batch
+MOVIE_INGEST_BATCH_SIZE = env.int('MOVIE_INGEST_BATCH_SIZE', default=100)
+MOVIE_INGEST_FLUSH_INTERVAL_MS = env.int('MOVIE_INGEST_FLUSH_INTERVAL_MS', default=500)
+
+# Background fetch of full details for movies seen in trending/discover (see movies/hydration.py)
+# 'thread', 'celery', 'sync' or 'off'
+MOVIE_HYDRATION_BACKEND = env('MOVIE_HYDRATION_BACKEND', default='thread')
+MOVIE_HYDRATION_CONCURRENCY = env.int('MOVIE_HYDRATION_CONCURRENCY', default=4)
+MOVIE_HYDRATION_MAX_PENDING = env.int('MOVIE_HYDRATION_MAX_PENDING', default=1000)
+MOVIE_HYDRATION_DEDUP_SECONDS = env.int('MOVIE_HYDRATION_DEDUP_SECONDS', default=300)
+MOVIE_HYDRATION_RATE_LIMIT = env('MOVIE_HYDRATION_RATE_LIMIT', default='20/s')
+
+# Local trending from our own rating/watchlist activity (see movies/trending.py)
+# Without a Redis URL, scores are kept in process and saved to TRENDING_STATE_PATH
+# once a minute; that fallback is for a single process, so set the URL for several workers.
+TRENDING_REDIS_URL = env('TRENDING_REDIS_URL', default=None)
+TRENDING_STATE_PATH = env('TRENDING_STATE_PATH', default=str(BASE_DIR / 'trending_state.json'))
+TRENDING_MAX_MEMBERS = env.int('TRENDING_MAX_MEMBERS', default=10000)
+
+# Item-item recommender statistics (see movies/recommender/itemitem.py)
+# Without a Redis URL, they are kept in process and saved to RECOMMENDER_STATE_PATH
+# once a minute; that fallback is for a single process, so set the URL for several workers.
+RECOMMENDER_REDIS_URL = env('RECOMMENDER_REDIS_URL', default=None)
+RECOMMENDER_STATE_PATH = env('RECOMMENDER_STATE_PATH', default=str(BASE_DIR / 'recommender_state.pickle'))
+
+# Matrix-factorization embeddings (see movies/recommender/embeddings.py)
+# Written by `manage.py train_embeddings`. EMBEDDINGS_NPROBE is the IVF recall/latency knob.
+EMBEDDINGS_PATH = env('EMBEDDINGS_PATH', default=str(BASE_DIR / 'embeddings.npz'))
+EMBEDDINGS_NPROBE = env.int('EMBEDDINGS_NPROBE', default=8)
+
+# Precomputed per-user recommendations (see movies/recommender/precompute.py)
+# Stored in the UserRecommendation table unless a Redis URL is set.
+PRECOMPUTED_RECS_REDIS_URL = env('PRECOMPUTED_RECS_REDIS_URL', default=None)
+PRECOMPUTED_RECS_TTL = env.int('PRECOMPUTED_RECS_TTL', default=2 * 24 * 3600)
 
+# Caching settings
+# Redis cache shared by every process (django-redis). Without it each process keeps
+# its own local-memory cache, which is only right for a single process.
+CACHE_REDIS_URL = env('CACHE_REDIS_URL', default=None)
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        },
+    }
+elif len(DATABASES) > 1 and not DEBUG:
+    # The read-your-writes pins (movies/routers.py) live in the cache and must be
+    # seen by every worker, or a user's next read may hit a lagging replica.
+    raise ImproperlyConfigured("DB_REPLICA_URLS requires CACHE_REDIS_URL.")
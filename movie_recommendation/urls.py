@@ -17,20 +17,19 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
 from rest_framework import permissions
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from movies.auth import CustomTokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView
+from movies.auth import CustomTokenObtainPairView, CustomTokenRefreshView
+from movies.schema import API_INFO, DocsSchemaGenerator
+from movies.views import metrics, openapi_schema
 
 
+# The UIs load the spec from the pre-generated schema below (SPEC_URL in settings).
 schema_view = get_schema_view(
-    openapi.Info(
-        title="Movie Recommendation API",
-        default_version='v1',
-        description="API for movie recommendations with TMDb integration",
-    ),
+    API_INFO,
     public=True,
     permission_classes=(permissions.AllowAny,),
+    generator_class=DocsSchemaGenerator,
 )
 
 
@@ -43,6 +42,8 @@ urlpatterns = [
 
     # Documentation endpoints
     path('api/docs/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('swagger.json', openapi_schema, {'fmt': 'json'}, name='schema-json'),
+    path('swagger.yaml', openapi_schema, {'fmt': 'yaml'}, name='schema-yaml'),
 
     # rest_framework authentication
     path('api-auth/', include('rest_framework.urls')),
@@ -50,5 +51,8 @@ urlpatterns = [
     # JWT authentication endpoints
     
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/refresh/', CustomTokenRefreshView.as_view(), name='token_refresh'),
+
+    # Prometheus metrics
+    path('metrics', metrics, name='metrics'),
 ]
@@ -1,9 +1,87 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from django.db.models import Q
 from movies.models import Movie, Rating, User, Watchlist
+from movies.pagination import EstimatedCountPaginator
 
 # Register your models here.
 
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Base admin for tables expected to grow to millions of rows.
+
+    - Counts come from EstimatedCountPaginator; the unfiltered total is not
+      counted again next to filtered results.
+    - Search only issues lookups an index can answer (see search_lookups).
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def search_lookups(self, term):
+        """Filter kwargs for one search term, or None when it cannot match."""
+        return None
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        lookups = self.search_lookups(term)
+        if lookups is None:
+            return queryset.none(), False
+        return queryset.filter(**lookups), False
+
+
+class MovieRatingSearchMixin:
+    """
+    Search for per-user movie rows:
+    - a number matches tmdb_id exactly;
+    - anything else matches the user's email exactly, through its unique index.
+    """
+
+    search_help_text = "TMDb id, or the user's full email."
+
+    def search_lookups(self, term):
+        if term.isdigit():
+            return {'tmdb_id': int(term)}
+        return {'user__email': term}
+
+
+def _enqueue(task, tmdb_ids):
+    """Send distinct tmdb_ids to `task` in ADMIN_ACTION_BATCH_SIZE batches. Returns (ids, jobs)."""
+    batch_size = getattr(settings, 'ADMIN_ACTION_BATCH_SIZE', 1000)
+    batch, total, jobs = [], 0, 0
+    for tmdb_id in tmdb_ids.iterator(chunk_size=batch_size):
+        batch.append(tmdb_id)
+        if len(batch) == batch_size:
+            task.delay(batch)
+            total, jobs, batch = total + len(batch), jobs + 1, []
+    if batch:
+        task.delay(batch)
+        total, jobs = total + len(batch), jobs + 1
+    return total, jobs
+
+
+@admin.action(description="Recompute average ratings of the selected movies (background)")
+def recompute_average_ratings(modeladmin, request, queryset):
+    from movies.tasks import recompute_average_ratings as task
+
+    tmdb_ids = queryset.order_by('tmdb_id').values_list('tmdb_id', flat=True).distinct()
+    total, jobs = _enqueue(task, tmdb_ids)
+    modeladmin.message_user(request, f"Queued average recomputation for {total} movies in {jobs} jobs.", messages.SUCCESS)
+
+
+@admin.action(description="Refresh the selected movies from TMDb (background)")
+def refresh_from_tmdb(modeladmin, request, queryset):
+    from movies.tasks import refresh_movies as task
+
+    tmdb_ids = queryset.order_by('tmdb_id').values_list('tmdb_id', flat=True).distinct()
+    total, jobs = _enqueue(task, tmdb_ids)
+    modeladmin.message_user(request, f"Queued TMDb refresh for {total} movies in {jobs} jobs.", messages.SUCCESS)
+
+
 class CustomUserAdmin(UserAdmin):
     fieldsets = UserAdmin.fieldsets + (
         ('Additional Info', {'fields': ('phone_number', 'preferences')}),
@@ -11,8 +89,53 @@ class CustomUserAdmin(UserAdmin):
     )
     readonly_fields = ('created_at', 'updated_at')
     list_display = ('user_id', 'username', 'email', 'phone_number', 'created_at')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_help_text = "Start of the username or email (case-sensitive)."
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Prefix match on username or email, which the unique indexes serve.
+        Also drives the user autocomplete on the rating and watchlist forms.
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        return queryset.filter(Q(username__startswith=term) | Q(email__startswith=term)), False
+
+
+@admin.register(Movie)
+class MovieAdmin(LargeTableAdmin):
+    list_display = ('tmdb_id', 'title', 'release_year', 'average_rating', 'popularity', 'hydrated_at')
+    search_fields = ('tmdb_id',)
+    search_help_text = "TMDb id."
+    readonly_fields = ('genre_mask', 'cached_at', 'hydrated_at')
+    actions = [recompute_average_ratings, refresh_from_tmdb]
+
+    def search_lookups(self, term):
+        return {'tmdb_id': int(term)} if term.isdigit() else None
+
+
+@admin.register(Rating)
+class RatingAdmin(MovieRatingSearchMixin, LargeTableAdmin):
+    list_display = ('id', 'user', 'tmdb_id', 'rating', 'timestamp')
+    list_select_related = ('user',)
+    # Primary key order, (user_id, id), so a page is read off the index without a sort.
+    ordering = ('user_id', 'id')
+    # Range lookups on rating_time_brin (PostgreSQL); ?timestamp__gte=...&timestamp__lt=... also works.
+    list_filter = (('timestamp', admin.DateFieldListFilter),)
+    search_fields = ('tmdb_id', 'user__email')
+    autocomplete_fields = ('user',)
+    actions = [recompute_average_ratings]
+
+
+@admin.register(Watchlist)
+class WatchlistAdmin(MovieRatingSearchMixin, LargeTableAdmin):
+    list_display = ('id', 'user', 'tmdb_id', 'added_at')
+    list_select_related = ('user',)
+    list_filter = (('added_at', admin.DateFieldListFilter),)
+    search_fields = ('tmdb_id', 'user__email')
+    autocomplete_fields = ('user',)
+
 
 admin.site.register(User, CustomUserAdmin)
-admin.site.register(Movie)
-admin.site.register(Rating)
-admin.site.register(Watchlist)
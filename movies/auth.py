@@ -1,5 +1,11 @@
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from rest_framework_simplejwt.views import TokenObtainPairView
+import uuid
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from movies.models import User
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -14,6 +20,9 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         # Add custom claims to the token if needed
         token['user_id'] = str(user.id)
         token['username'] = user.username
+        # Lets ClaimsUser answer permission checks without a DB lookup
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
         return token
     
     def validate(self, attrs):
@@ -26,4 +35,59 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     """
     Custom view for token pair authentication.
     """
-    serializer_class = CustomTokenObtainPairSerializer
\ No newline at end of file
+    serializer_class = CustomTokenObtainPairSerializer
+
+
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh serializer that re-reads the staff flags from the database.
+
+    The refresh token carries the flags from login, and simplejwt copies its
+    claims into each new access token. Re-reading them here means a change in
+    staff rights reaches clients within one ACCESS_TOKEN_LIFETIME, not one
+    refresh token lifetime. Inactive users are refused by simplejwt itself.
+    """
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        access = AccessToken(data['access'], verify=False)
+        user = User.objects.only('is_staff', 'is_superuser').get(user_id=access[api_settings.USER_ID_CLAIM])
+        access['is_staff'] = user.is_staff
+        access['is_superuser'] = user.is_superuser
+        data['access'] = str(access)
+        return data
+
+
+class CustomTokenRefreshView(TokenRefreshView):
+    """
+    Token refresh view that re-issues the staff claims.
+    """
+    serializer_class = CustomTokenRefreshSerializer
+
+
+class ClaimsUser(TokenUser):
+    """
+    Lightweight user built from access token claims, without a DB query.
+
+    - Exposes `id`, `user_id`, `username`, `is_staff` and `is_superuser`.
+    - Staff flags are as of token issue or the last refresh, so changes apply
+      within ACCESS_TOKEN_LIFETIME, which is kept to minutes for that reason.
+    - Use `get_full_user()` where a real `User` instance is required.
+    """
+
+    @cached_property
+    def user_id(self):
+        return uuid.UUID(str(self.token[api_settings.USER_ID_CLAIM]))
+
+
+def get_full_user(user):
+    """
+    Return the `User` row for an authenticated request user.
+    Token users are loaded by primary key once per request, never from a shared
+    cache, as the row holds the password hash.
+    """
+    if isinstance(user, User):
+        return user
+    if '_full_user' not in user.__dict__:
+        user._full_user = User.objects.get(user_id=user.user_id)
+    return user._full_user
@@ -0,0 +1,311 @@
+import logging
+import threading
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+
+from movies.models import Movie, Rating, User, UserGenreAffinity
+
+
+logger = logging.getLogger(__name__)
+
+# TMDb movie genres. Position in this tuple is the bit in Movie.genre_mask, so
+# it must never be reordered; new TMDb genres are appended (up to 63).
+GENRE_IDS = (
+    28, 12, 16, 35, 80, 99, 18, 10751, 14, 36,
+    27, 10402, 9648, 10749, 878, 10770, 53, 10752, 37,
+)
+# English names, used until the live list has been fetched from TMDb.
+DEFAULT_NAMES = {
+    28: 'Action', 12: 'Adventure', 16: 'Animation', 35: 'Comedy', 80: 'Crime',
+    99: 'Documentary', 18: 'Drama', 10751: 'Family', 14: 'Fantasy', 36: 'History',
+    27: 'Horror', 10402: 'Music', 9648: 'Mystery', 10749: 'Romance',
+    878: 'Science Fiction', 10770: 'TV Movie', 53: 'Thriller', 10752: 'War', 37: 'Western',
+}
+N_GENRES = len(GENRE_IDS)
+# Where TMDbAPI.get_genres caches TMDb's /genre/movie/list.
+GENRES_CACHE_KEY = 'tmdb_genres'
+
+# A rating's pull on its genres, centered so low ratings push affinity down:
+# 1 -> -1.0, 10 -> +1.0.
+RATING_CENTER = 5.5
+RATING_SCALE = 4.5
+# Pseudo-count added to each genre's rating count, so one rating moves a
+# genre's affinity less than many consistent ones.
+SMOOTHING = 2.0
+# Weight of a genre listed in preferences['favorite_genres'] (or
+# preferences['disliked_genres'], negated).
+PREFERENCE_WEIGHT = 1.0
+
+
+class GenreVocabulary:
+    """
+    TMDb genre ids <-> names <-> bit positions.
+
+    - Ids map to bits by their position in GENRE_IDS, so masks are stable
+      across processes and TMDb name changes.
+    - Names come from TMDb's /genre/movie/list when available.
+    """
+
+    def __init__(self, names):
+        self.names = {genre_id: names.get(genre_id, DEFAULT_NAMES[genre_id]) for genre_id in GENRE_IDS}
+        self.ids_by_name = {name.lower(): genre_id for genre_id, name in self.names.items()}
+        self.bits = {genre_id: bit for bit, genre_id in enumerate(GENRE_IDS)}
+
+    def resolve(self, genre):
+        """A TMDb genre id from an id or a (case-insensitive) name; None if unknown."""
+        if isinstance(genre, str) and not genre.isdigit():
+            return self.ids_by_name.get(genre.strip().lower())
+        try:
+            genre_id = int(genre)
+        except (TypeError, ValueError):
+            return None
+        return genre_id if genre_id in self.bits else None
+
+    def mask(self, genres):
+        """Bitmask for an iterable of genre ids or names; unknown genres are ignored."""
+        mask = 0
+        for genre in genres:
+            genre_id = self.resolve(genre)
+            if genre_id is not None:
+                mask |= 1 << self.bits[genre_id]
+        return mask
+
+    def ids(self, mask):
+        return [genre_id for bit, genre_id in enumerate(GENRE_IDS) if mask >> bit & 1]
+
+    def names_for(self, mask):
+        return [self.names[genre_id] for genre_id in self.ids(mask)]
+
+
+_vocabulary = None
+_vocabulary_lock = threading.Lock()
+
+
+def get_vocabulary():
+    """
+    The genre vocabulary, built once per process. Names come from the TMDb
+    list cached by TMDbAPI.get_genres when present; this never calls TMDb, so
+    it is safe on the ingest path. Bits do not depend on the names.
+    """
+    global _vocabulary
+    if _vocabulary is None:
+        with _vocabulary_lock:
+            if _vocabulary is None:
+                cached = cache.get(GENRES_CACHE_KEY) or []
+                _vocabulary = GenreVocabulary({genre['id']: genre['name'] for genre in cached})
+    return _vocabulary
+
+
+def genre_mask(tmdb_data):
+    """Bitmask for a TMDb payload: `genres` on details, `genre_ids` on list results."""
+    if 'genres' in tmdb_data:
+        return get_vocabulary().mask(genre['id'] for genre in tmdb_data['genres'])
+    return get_vocabulary().mask(tmdb_data.get('genre_ids', []))
+
+
+def mask_matrix(masks):
+    """(n, N_GENRES) 0/1 float32 matrix for an array of genre masks."""
+    masks = np.asarray(masks, dtype=np.int64)
+    return ((masks[:, None] >> np.arange(N_GENRES)) & 1).astype(np.float32)
+
+
+def rating_signal(rating):
+    return (rating - RATING_CENTER) / RATING_SCALE
+
+
+def preference_vector(preferences):
+    """Vector from preferences['favorite_genres'] and ['disliked_genres'] (ids or names)."""
+    vector = np.zeros(N_GENRES, dtype=np.float32)
+    if not isinstance(preferences, dict):
+        return vector
+    vocabulary = get_vocabulary()
+    for key, sign in (('favorite_genres', 1.0), ('disliked_genres', -1.0)):
+        genres = preferences.get(key) or []
+        if isinstance(genres, (str, int)):
+            genres = [genres]
+        mask = vocabulary.mask(genres)
+        vector += sign * PREFERENCE_WEIGHT * mask_matrix([mask])[0]
+    return vector
+
+
+def _vector(blob):
+    # Rows written before a genre was appended are shorter; pad with zeros.
+    vector = np.zeros(N_GENRES, dtype=np.float32)
+    if blob:
+        stored = np.frombuffer(bytes(blob), dtype='<f4')[:N_GENRES]
+        vector[:len(stored)] = stored
+    return vector
+
+
+def _pack(vector):
+    return np.asarray(vector, dtype='<f4').tobytes()
+
+
+def compose(preference, sums, counts):
+    """Affinity from its parts; always finite, whatever drift the stored parts carry."""
+    affinity = preference + sums / (np.maximum(counts, 0.0) + SMOOTHING)
+    return np.nan_to_num(affinity, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def get_affinity(user_id):
+    """The user's genre-affinity vector (length N_GENRES), or None if they have no profile."""
+    row = UserGenreAffinity.objects.filter(user_id=user_id).values_list('affinity', flat=True).first()
+    return None if row is None else np.nan_to_num(_vector(row), nan=0.0, posinf=0.0, neginf=0.0)
+
+
+@transaction.atomic
+def _update(user_id, preferences=None, sums_delta=None, counts_delta=None):
+    profile = UserGenreAffinity.objects.select_for_update().filter(user_id=user_id).first()
+    if profile is None:
+        if preferences is None:
+            preferences = User.objects.filter(user_id=user_id).values_list('preferences', flat=True).first()
+        profile = UserGenreAffinity(user_id=user_id, preference=_pack(preference_vector(preferences)))
+    preference, sums, counts = _vector(profile.preference), _vector(profile.sums), _vector(profile.counts)
+    if preferences is not None:
+        preference = preference_vector(preferences)
+    if sums_delta is not None:
+        # A rating can be reverted with a different mask than it was added with
+        # (a movie hydrated or re-genred in between). Keep counts >= 0 and
+        # |sums| <= counts, which every signal in [-1, 1] satisfies;
+        # rebuild_affinities removes what drift remains.
+        counts = np.maximum(counts + counts_delta, 0.0)
+        sums = np.clip(sums + sums_delta, -counts, counts)
+    profile.preference, profile.sums, profile.counts = _pack(preference), _pack(sums), _pack(counts)
+    profile.affinity = _pack(compose(preference, sums, counts))
+    profile.save()
+
+
+def record_rating(user_id, tmdb_id, old_rating=None, new_rating=None):
+    """
+    Incremental update for a rating being created (old_rating None), changed,
+    or deleted (new_rating None). Costs one movie read and one row update.
+    Failures are logged, not raised.
+    """
+    try:
+        mask = Movie.objects.filter(tmdb_id=tmdb_id).values_list('genre_mask', flat=True).first()
+        if not mask:
+            return
+        onehot = mask_matrix([mask])[0]
+        signal = (rating_signal(new_rating) if new_rating is not None else 0.0) \
+            - (rating_signal(old_rating) if old_rating is not None else 0.0)
+        count = (new_rating is not None) - (old_rating is not None)
+        _update(user_id, sums_delta=signal * onehot, counts_delta=count * onehot)
+    except Exception as e:
+        logger.error(f"Genre affinity update failed for movie {tmdb_id}: {str(e)}")
+
+
+def update_preferences(user_id, preferences):
+    """Recompute the preference part of a user's profile after their preferences change."""
+    try:
+        _update(user_id, preferences=preferences)
+    except Exception as e:
+        logger.error(f"Genre affinity update failed for user {user_id}: {str(e)}")
+
+
+def affinity_scores(movies, affinity):
+    """Mean affinity over each movie's genres, as one (n, G) @ (G,) product."""
+    matrix = mask_matrix([movie.genre_mask for movie in movies])
+    genre_counts = np.maximum(matrix.sum(axis=1), 1.0)
+    return matrix @ affinity / genre_counts
+
+
+def rerank(movies, affinity, base_scores=None, weight=1.0, min_affinity=None):
+    """
+    Re-rank movies by base score + weight * genre affinity; `base_scores`
+    defaults to the current order. With `min_affinity`, movies scoring below
+    it on affinity alone are dropped. Returns (movies, affinity scores).
+    """
+    if not movies or affinity is None:
+        return movies, None
+    scores = affinity_scores(movies, affinity)
+    if base_scores is None:
+        # Linear decay from 1 to 0 keeps the upstream order as a tie-breaker.
+        base_scores = np.linspace(1.0, 0.0, len(movies))
+    combined = np.asarray(base_scores, dtype=np.float32) + weight * scores
+    order = np.argsort(-combined, kind='stable')
+    if min_affinity is not None:
+        order = order[scores[order] >= min_affinity]
+    return [movies[i] for i in order], scores[order]
+
+
+def backfill_movie_masks(batch_size=5000):
+    """Set genre_mask on stored movies from their genre names. Returns rows updated."""
+    vocabulary = get_vocabulary()
+    updated = 0
+    batch = []
+    for tmdb_id, names, mask in Movie.objects.order_by().values_list('tmdb_id', 'genres', 'genre_mask').iterator(
+        chunk_size=batch_size
+    ):
+        new_mask = vocabulary.mask(names or [])
+        if new_mask != mask:
+            batch.append(Movie(tmdb_id=tmdb_id, genre_mask=new_mask))
+        if len(batch) >= batch_size:
+            Movie.objects.bulk_update(batch, ['genre_mask'])
+            updated += len(batch)
+            batch = []
+    if batch:
+        Movie.objects.bulk_update(batch, ['genre_mask'])
+        updated += len(batch)
+    return updated
+
+
+def rebuild_affinities(batch_size=5000):
+    """
+    Recompute every user's profile from preferences and all ratings, with the
+    per-genre sums done as one scatter-add over the whole Rating table.
+    """
+    masks = dict(Movie.objects.exclude(genre_mask=0).values_list('tmdb_id', 'genre_mask'))
+    user_ids, tmdb_masks, signals = [], [], []
+    for user_id, tmdb_id, rating in Rating.objects.order_by().values_list('user_id', 'tmdb_id', 'rating').iterator(
+        chunk_size=10000
+    ):
+        mask = masks.get(tmdb_id)
+        if mask:
+            user_ids.append(str(user_id))
+            tmdb_masks.append(mask)
+            signals.append(rating_signal(rating))
+
+    users, index = np.unique(np.asarray(user_ids, dtype=str), return_inverse=True) if user_ids else ([], [])
+    sums = np.zeros((len(users), N_GENRES), dtype=np.float32)
+    counts = np.zeros((len(users), N_GENRES), dtype=np.float32)
+    if user_ids:
+        onehot = mask_matrix(tmdb_masks)
+        np.add.at(sums, index, onehot * np.asarray(signals, dtype=np.float32)[:, None])
+        np.add.at(counts, index, onehot)
+    positions = {user_id: i for i, user_id in enumerate(users)}
+
+    profiles = []
+    written = 0
+    zeros = np.zeros(N_GENRES, dtype=np.float32)
+    for user_id, preferences in User.objects.order_by().values_list('user_id', 'preferences').iterator(
+        chunk_size=batch_size
+    ):
+        position = positions.get(str(user_id))
+        preference = preference_vector(preferences)
+        user_sums = sums[position] if position is not None else zeros
+        user_counts = counts[position] if position is not None else zeros
+        profiles.append(UserGenreAffinity(
+            user_id=user_id,
+            preference=_pack(preference),
+            sums=_pack(user_sums),
+            counts=_pack(user_counts),
+            affinity=_pack(compose(preference, user_sums, user_counts)),
+        ))
+        if len(profiles) >= batch_size:
+            written += _save_profiles(profiles)
+            profiles = []
+    if profiles:
+        written += _save_profiles(profiles)
+    return written
+
+
+def _save_profiles(profiles):
+    UserGenreAffinity.objects.bulk_create(
+        profiles,
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['preference', 'sums', 'counts', 'affinity', 'updated_at'],
+    )
+    return len(profiles)
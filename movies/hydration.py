@@ -0,0 +1,128 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from movies.ingest import enqueue_movies, upsert_movies
+
+
+logger = logging.getLogger(__name__)
+
+
+def _marker(tmdb_id):
+    return f"hydrating_{tmdb_id}"
+
+
+def claim(tmdb_ids, ttl):
+    """
+    Return the ids not already being hydrated, marking them as claimed.
+    cache.add is atomic, so with a shared cache only one process claims each id.
+    """
+    return [tmdb_id for tmdb_id in tmdb_ids if cache.add(_marker(tmdb_id), 1, ttl)]
+
+
+def fetch_and_store(tmdb_id, write=enqueue_movies, refresh=False):
+    """Fetch full details (cached by TMDbAPI for 24h unless `refresh`) and store them."""
+    from movies.tmdb import TMDbAPI
+
+    write([TMDbAPI.get_movie_details(tmdb_id, refresh=refresh)])
+
+
+class HydrationQueue:
+    """
+    Background fetches of full TMDb details for movies seen only in list results.
+
+    - At most `concurrency` fetches run at once, from a bounded thread pool.
+    - At most `max_pending` fetches wait; ids offered beyond that are dropped
+      and picked up the next time a list endpoint serves them, so a burst of
+      new titles cannot exceed the TMDb rate limit.
+    - Duplicate ids are dropped by the claim markers in the cache.
+    """
+
+    def __init__(self, fetch, concurrency=4, max_pending=1000):
+        self.fetch = fetch
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='movie-hydration')
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, tmdb_ids):
+        queued = 0
+        for tmdb_id in tmdb_ids:
+            with self._lock:
+                if self._pending >= self.max_pending:
+                    cache.delete(_marker(tmdb_id))
+                    continue
+                self._pending += 1
+            self._executor.submit(self._run, tmdb_id)
+            queued += 1
+        return queued
+
+    def _run(self, tmdb_id):
+        try:
+            self.fetch(tmdb_id)
+        except Exception as e:
+            # Release the claim so a later list hit can retry.
+            cache.delete(_marker(tmdb_id))
+            logger.warning(f"Hydration of movie {tmdb_id} failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+            close_old_connections()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def _get_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = HydrationQueue(
+                    fetch_and_store,
+                    concurrency=getattr(settings, 'MOVIE_HYDRATION_CONCURRENCY', 4),
+                    max_pending=getattr(settings, 'MOVIE_HYDRATION_MAX_PENDING', 1000),
+                )
+    return _queue
+
+
+def hydrate_missing(movies):
+    """
+    Queue full-detail fetches for movies without them, per MOVIE_HYDRATION_BACKEND.
+
+    - 'thread': fetched by a bounded pool in this process (default).
+    - 'celery': one rate-limited task per movie.
+    - 'sync': fetched and stored immediately (useful in tests).
+    - 'off': disabled.
+    Returns the number of movies queued.
+    """
+    backend = getattr(settings, 'MOVIE_HYDRATION_BACKEND', 'thread')
+    if backend == 'off':
+        return 0
+    missing = [movie.tmdb_id for movie in movies if movie.hydrated_at is None]
+    if not missing:
+        return 0
+    claimed = claim(missing, getattr(settings, 'MOVIE_HYDRATION_DEDUP_SECONDS', 300))
+    if not claimed:
+        return 0
+
+    if backend == 'sync':
+        for tmdb_id in claimed:
+            try:
+                fetch_and_store(tmdb_id, write=upsert_movies)
+            except Exception as e:
+                cache.delete(_marker(tmdb_id))
+                logger.warning(f"Hydration of movie {tmdb_id} failed: {str(e)}")
+        return len(claimed)
+    if backend == 'celery':
+        from movies.tasks import hydrate_movie
+
+        for tmdb_id in claimed:
+            hydrate_movie.delay(tmdb_id)
+        return len(claimed)
+    return _get_queue().submit(claimed)
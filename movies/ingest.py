@@ -0,0 +1,246 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from movies.genres import genre_mask
+from movies.models import Movie
+
+
+logger = logging.getLogger(__name__)
+
+# Fields refreshed from list results (trending/discover), which carry genre ids but no names.
+LIST_FIELDS = ['title', 'release_year', 'overview', 'poster_path', 'popularity', 'cached_at', 'genre_mask']
+# Fields refreshed from a full /movie/{id} payload.
+DETAIL_FIELDS = LIST_FIELDS + ['genres', 'hydrated_at']
+
+
+def extract_year(release_date):
+    """Extract the year from a TMDb release date string."""
+    if not release_date:
+        return None
+    try:
+        return int(release_date[:4])
+    except (ValueError, TypeError):
+        return None
+
+
+def movie_fields(tmdb_data):
+    """Map a TMDb movie payload onto Movie field values."""
+    fields = {
+        'title': tmdb_data.get('title', ''),
+        'release_year': extract_year(tmdb_data.get('release_date')),
+        'overview': tmdb_data.get('overview', ''),
+        'poster_path': tmdb_data.get('poster_path') or '',
+        'popularity': tmdb_data.get('popularity', 0.0),
+        'cached_at': timezone.now(),
+        'genre_mask': genre_mask(tmdb_data),
+    }
+    if 'genres' in tmdb_data:
+        fields['genres'] = [g['name'] for g in tmdb_data['genres']]
+        fields['hydrated_at'] = fields['cached_at']
+    return fields
+
+
+def build_movies(payloads):
+    """
+    Build unsaved Movie instances for a list of TMDb payloads.
+    Stored average ratings (and genres and hydration state, for list payloads)
+    are read in one query.
+    """
+    ids = [data['id'] for data in payloads]
+    stored = {
+        tmdb_id: (average_rating, genres, hydrated_at)
+        for tmdb_id, average_rating, genres, hydrated_at in Movie.objects.filter(tmdb_id__in=ids)
+        .values_list('tmdb_id', 'average_rating', 'genres', 'hydrated_at')
+    }
+    movies = []
+    for data in payloads:
+        average_rating, genres, hydrated_at = stored.get(data['id'], (0.0, [], None))
+        fields = {'genres': genres, 'hydrated_at': hydrated_at, **movie_fields(data)}
+        movies.append(Movie(tmdb_id=data['id'], average_rating=average_rating, **fields))
+    return movies
+
+
+def upsert_movies(payloads):
+    """
+    Insert or update Movie rows for TMDb payloads with one statement per shape.
+
+    Detail payloads refresh genres; list payloads leave stored genres alone.
+    Payloads without a usable release year are skipped, as the column is required.
+    """
+    by_fields = {tuple(LIST_FIELDS): [], tuple(DETAIL_FIELDS): []}
+    for data in payloads:
+        fields = movie_fields(data)
+        if fields['release_year'] is None:
+            logger.warning(f"Skipping ingest of movie {data.get('id')}: no release year")
+            continue
+        key = tuple(DETAIL_FIELDS) if 'genres' in fields else tuple(LIST_FIELDS)
+        by_fields[key].append(Movie(tmdb_id=data['id'], **fields))
+
+    for update_fields, movies in by_fields.items():
+        if movies:
+            Movie.objects.bulk_create(
+                movies,
+                update_conflicts=True,
+                unique_fields=['tmdb_id'],
+                update_fields=list(update_fields),
+            )
+    return sum(len(movies) for movies in by_fields.values())
+
+
+def coalesce(payloads):
+    """
+    Merge payloads by tmdb_id, later ones over earlier ones, so a burst of
+    trending hits for one movie becomes one row write. Returns a dict by id.
+    """
+    merged = {}
+    for data in payloads:
+        previous = merged.get(data['id'])
+        merged[data['id']] = {**previous, **data} if previous else data
+    return merged
+
+
+class WriteBehindBuffer:
+    """
+    Coalescing buffer that hands TMDb payloads to `flush` in batches.
+
+    - Payloads are merged by tmdb_id while they wait (see coalesce()).
+    - A background thread flushes every `interval` seconds, or as soon as
+      `max_items` distinct movies are pending.
+    - A failed batch is merged back under newer payloads and retried with
+      exponential backoff up to `max_backoff` seconds.
+    - Pending items are flushed at interpreter exit. Anything still pending
+      when the process dies is lost, so this only suits data that TMDb can
+      serve again, as with the 'thread' backend.
+    """
+
+    def __init__(self, flush, max_items=100, interval=0.5, max_backoff=30.0):
+        self.flush = flush
+        self.max_items = max_items
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.backoff = 0.0
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        atexit.register(self.drain)
+
+    def add(self, payloads):
+        with self._cond:
+            for tmdb_id, data in coalesce(payloads).items():
+                previous = self._pending.get(tmdb_id)
+                self._pending[tmdb_id] = {**previous, **data} if previous else data
+            if len(self._pending) >= self.max_items:
+                self._cond.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='movie-write-behind', daemon=True)
+                self._thread.start()
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _take(self):
+        with self._cond:
+            items, self._pending = list(self._pending.values()), {}
+        return items
+
+    def _requeue(self, items):
+        """Put a failed batch back; payloads added since then win over it."""
+        with self._cond:
+            self._pending = coalesce([*items, *self._pending.values()])
+            self.backoff = min(self.max_backoff, max(self.interval, self.backoff * 2))
+
+    def _run(self):
+        while True:
+            if self.backoff:
+                time.sleep(self.backoff)
+            else:
+                with self._cond:
+                    if len(self._pending) < self.max_items:
+                        self._cond.wait(self.interval)
+            self.drain()
+
+    def drain(self):
+        """Flush everything pending. Returns False if the flush failed and was re-queued."""
+        items = self._take()
+        if not items:
+            return True
+        try:
+            self.flush(items)
+        except Exception as e:
+            self._requeue(items)
+            logger.error(f"Write-behind flush of {len(items)} movies failed, retrying in {self.backoff:.1f}s: {str(e)}")
+            return False
+        finally:
+            close_old_connections()
+        self.backoff = 0.0
+        return True
+
+
+def _flush_to_database(payloads):
+    upsert_movies(payloads)
+
+
+def publish_movies(payloads):
+    """
+    Publish payloads to the broker as ingest_movies tasks of at most
+    MOVIE_INGEST_BATCH_SIZE movies. A batch the broker does not accept is
+    upserted inline, so no write is dropped.
+    """
+    # Imported lazily so the web process only needs Celery when this backend is used.
+    from kombu.exceptions import OperationalError
+    from movies.tasks import ingest_movies
+
+    items = list(coalesce(payloads).values())
+    batch_size = getattr(settings, 'MOVIE_INGEST_BATCH_SIZE', 100)
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        try:
+            ingest_movies.delay(batch)
+        except OperationalError as e:
+            logger.error(f"Publishing {len(batch)} movies to the broker failed, writing them inline: {str(e)}")
+            upsert_movies(batch)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def _get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = WriteBehindBuffer(
+                    _flush_to_database,
+                    max_items=getattr(settings, 'MOVIE_INGEST_BATCH_SIZE', 100),
+                    interval=getattr(settings, 'MOVIE_INGEST_FLUSH_INTERVAL_MS', 500) / 1000.0,
+                )
+    return _buffer
+
+
+def enqueue_movies(payloads):
+    """
+    Queue TMDb payloads for ingestion into Movie, per MOVIE_INGEST_BACKEND.
+
+    - 'celery' (default): published to the broker from the request as acks-late
+      tasks, so they survive web and worker crashes once the request returns.
+    - 'thread': coalesced and upserted by a background thread in this process;
+      writes still pending when the process dies are lost.
+    - 'sync': upserted immediately (useful in tests and management commands).
+    """
+    if not payloads:
+        return
+    backend = getattr(settings, 'MOVIE_INGEST_BACKEND', 'celery')
+    if backend == 'sync':
+        upsert_movies(payloads)
+    elif backend == 'celery':
+        publish_movies(payloads)
+    else:
+        _get_buffer().add(payloads)
@@ -0,0 +1,238 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+class RequestStats:
+    """
+    Per-request timings collected by PerformanceMiddleware.
+
+    - DB query count and time, recorded by a connection execute wrapper.
+    - Upstream (TMDb) call count and time, recorded by TMDbAPI.
+    - Cache hits and misses per key family (movie, trending, discover, ...).
+    - Time spent in serializer to_representation.
+    - Optionally, the individual queries and upstream calls (see enable_trace).
+    """
+
+    __slots__ = ('route', 'db_queries', 'db_time', 'upstream_calls', 'upstream_time',
+                 'serialize_time', 'cache', 'trace')
+
+    def __init__(self):
+        self.route = None
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.upstream_calls = 0
+        self.upstream_time = 0.0
+        self.serialize_time = 0.0
+        self.cache = {}
+        self.trace = None
+
+    def enable_trace(self):
+        """Start keeping every query and upstream call, e.g. for a profile."""
+        if self.trace is None:
+            self.trace = {'queries': [], 'upstream': []}
+        return self.trace
+
+    def record_query(self, sql, duration):
+        self.db_queries += 1
+        self.db_time += duration
+        if self.trace is not None:
+            self.trace['queries'].append({'sql': sql, 'duration_ms': round(duration * 1000, 3)})
+
+
+_current = ContextVar('request_stats', default=None)
+
+
+def start_request():
+    """Begin collecting stats for the current request and return the holder."""
+    stats = RequestStats()
+    token = _current.set(stats)
+    return stats, token
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current_stats():
+    """Stats for the request being handled, or None outside a request."""
+    return _current.get()
+
+
+class Counter:
+    """Monotonic counter with labels, in Prometheus text format."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, self._labels(labels), value
+
+    def _labels(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}' if pairs else ''
+
+
+class Histogram(Counter):
+    """Cumulative histogram with labels, in Prometheus text format."""
+
+    kind = 'histogram'
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {labels: (list(e[0]), e[1], e[2]) for labels, e in self._values.items()}
+        for labels, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f"{self.name}_bucket", self._labels(labels, [('le', le)]), cumulative
+            yield f"{self.name}_sum", self._labels(labels), total
+            yield f"{self.name}_count", self._labels(labels), count
+
+
+class Registry:
+    """Holds every metric exposed on /metrics."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.register(Histogram(
+    'movies_http_request_duration_seconds', "Total time spent handling a request.", ('route', 'method', 'status')))
+REQUEST_DB_TIME = registry.register(Histogram(
+    'movies_http_request_db_seconds', "Time spent in database queries per request.", ('route',)))
+REQUEST_DB_QUERIES = registry.register(Histogram(
+    'movies_http_request_db_queries', "Database queries issued per request.", ('route',),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100)))
+REQUEST_UPSTREAM_TIME = registry.register(Histogram(
+    'movies_http_request_upstream_seconds', "Time spent calling TMDb per request.", ('route',)))
+REQUEST_SERIALIZE_TIME = registry.register(Histogram(
+    'movies_http_request_serialize_seconds', "Time spent serializing per request.", ('route',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)))
+UPSTREAM_CALLS = registry.register(Counter(
+    'movies_upstream_calls_total', "Calls made to TMDb.", ('endpoint', 'status')))
+CACHE_REQUESTS = registry.register(Counter(
+    'movies_cache_requests_total', "Cache lookups by key family.", ('family', 'result')))
+THROTTLED_REQUESTS = registry.register(Counter(
+    'movies_throttled_requests_total', "Requests rejected with 429 by throttle scope.", ('scope',)))
+SHED_REQUESTS = registry.register(Counter(
+    'movies_shed_requests_total', "Requests rejected with 503 by the load shedder.", ('reason',)))
+
+
+def cache_family(key):
+    """Key family used for cache metrics: 'movie_550' -> 'movie'."""
+    return key.split('_', 1)[0]
+
+
+def record_cache(key, hit):
+    family = cache_family(key)
+    result = 'hit' if hit else 'miss'
+    CACHE_REQUESTS.inc((family, result))
+    stats = _current.get()
+    if stats is not None:
+        counts = stats.cache.setdefault(family, [0, 0])
+        counts[0 if hit else 1] += 1
+
+
+def record_upstream(endpoint, status, duration):
+    UPSTREAM_CALLS.inc((endpoint, str(status)))
+    stats = _current.get()
+    if stats is not None:
+        stats.upstream_calls += 1
+        stats.upstream_time += duration
+        if stats.trace is not None:
+            stats.trace['upstream'].append({
+                'endpoint': endpoint,
+                'status': status,
+                'duration_ms': round(duration * 1000, 3),
+            })
+
+
+@contextmanager
+def timed_serialization():
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialize_time += time.perf_counter() - started
+
+
+class InstrumentedSerializerMixin:
+    """Serializer mixin that adds to_representation time to the request stats."""
+
+    def to_representation(self, instance):
+        with timed_serialization():
+            return super().to_representation(instance)
+
+
+def observe_request(stats, method, status, duration):
+    route = stats.route or 'unmatched'
+    REQUEST_DURATION.observe((route, method, str(status)), duration)
+    REQUEST_DB_TIME.observe((route,), stats.db_time)
+    REQUEST_DB_QUERIES.observe((route,), stats.db_queries)
+    REQUEST_UPSTREAM_TIME.observe((route,), stats.upstream_time)
+    REQUEST_SERIALIZE_TIME.observe((route,), stats.serialize_time)
+
+
+def server_timing(stats, duration):
+    """Build a Server-Timing header value from the request stats."""
+    entries = [
+        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.db_queries} queries"',
+        f'tmdb;dur={stats.upstream_time * 1000:.1f};desc="{stats.upstream_calls} calls"',
+        f'serialize;dur={stats.serialize_time * 1000:.1f}',
+    ]
+    for family, (hits, misses) in sorted(stats.cache.items()):
+        entries.append(f'cache-{family};desc="hit={hits} miss={misses}"')
+    entries.append(f'total;dur={duration * 1000:.1f}')
+    return ', '.join(entries)
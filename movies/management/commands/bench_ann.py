@@ -0,0 +1,109 @@
+import json
+import statistics
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from movies.recommender.ann import ExactIndex, IVFIndex
+
+
+class Command(BaseCommand):
+    """
+    Benchmark IVF retrieval against exhaustive search.
+
+    For each nprobe, reports recall@k (the share of the exact top-k that the
+    index returns) and query latency percentiles, next to the exhaustive
+    baseline. Uses the trained model at EMBEDDINGS_PATH, or with --synthetic a
+    clustered random catalog of the given size, so it can run before any
+    training data exists.
+    """
+
+    help = "Benchmark ANN recall@k and latency against exhaustive search."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=20)
+        parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--lists', type=int, default=None, help="IVF cells for --synthetic.")
+        parser.add_argument('--synthetic', type=int, default=None, metavar='ITEMS',
+                            help="Benchmark a synthetic catalog of this many items.")
+        parser.add_argument('--factors', type=int, default=64, help="Dimensions for --synthetic.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default=None, help="Write the JSON report here.")
+
+    def _synthetic(self, options, rng):
+        # Latent factors cluster around tastes; uniform noise would make every
+        # index look equally bad.
+        items, factors = options['synthetic'], options['factors']
+        centers = rng.standard_normal((max(items // 500, 1), factors))
+        vectors = centers[rng.integers(len(centers), size=items)] + 0.5 * rng.standard_normal((items, factors))
+        queries = centers[rng.integers(len(centers), size=options['queries'])]
+        queries = queries + 0.5 * rng.standard_normal(queries.shape)
+        index = IVFIndex.build(vectors, np.arange(items), n_lists=options['lists'], seed=options['seed'])
+        return vectors, np.arange(items), index, queries
+
+    def _trained(self, options, rng):
+        from movies.recommender.embeddings import EmbeddingModel
+
+        model = EmbeddingModel.load(settings.EMBEDDINGS_PATH)
+        users = rng.choice(len(model.user_factors), min(options['queries'], len(model.user_factors)), replace=False)
+        return model.item_factors, model.item_ids, model.index, model.user_factors[users]
+
+    def _time(self, search, queries):
+        results, timings = [], []
+        for query in queries:
+            started = time.perf_counter()
+            ids, _ = search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+            results.append(ids)
+        timings.sort()
+        return results, {
+            'mean_ms': round(statistics.fmean(timings), 4),
+            'p50_ms': round(timings[len(timings) // 2], 4),
+            'p99_ms': round(timings[max(int(len(timings) * 0.99) - 1, 0)], 4),
+        }
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        if options['synthetic']:
+            vectors, ids, index, queries = self._synthetic(options, rng)
+        else:
+            vectors, ids, index, queries = self._trained(options, rng)
+        queries = np.asarray(queries, dtype=np.float32)
+        k = options['k']
+
+        exact = ExactIndex(vectors, ids)
+        truth, exact_latency = self._time(lambda query: exact.search(query, k), queries)
+        baseline = {'index': 'exact', 'recall_at_k': 1.0, **exact_latency}
+        self.stdout.write(json.dumps(baseline))
+
+        results = [baseline]
+        for nprobe in options['nprobe']:
+            if nprobe > index.n_lists:
+                continue
+            found, latency = self._time(lambda query: index.search(query, k, nprobe=nprobe), queries)
+            recall = statistics.fmean(
+                len(np.intersect1d(expected, got)) / len(expected) for expected, got in zip(truth, found)
+            )
+            results.append({
+                'index': 'ivf',
+                'nprobe': nprobe,
+                'recall_at_k': round(recall, 4),
+                **latency,
+                'speedup': round(exact_latency['mean_ms'] / latency['mean_ms'], 2),
+            })
+            self.stdout.write(json.dumps(results[-1]))
+
+        report = {
+            'items': len(ids),
+            'factors': vectors.shape[1],
+            'n_lists': index.n_lists,
+            'k': k,
+            'queries': len(queries),
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
@@ -0,0 +1,63 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from movies.recommender import itemitem
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the online co-occurrence update against the user's history length.
+
+    Runs on a private in-memory store by default, so it needs no database rows
+    and does not touch live statistics. With --redis it measures a Redis store
+    (use a scratch database). History reads are not included; they are a
+    single indexed query per event.
+    """
+
+    help = "Benchmark per-event item-item update cost by history length."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--history-lengths', type=int, nargs='+', default=[10, 50, 100, 500, 1000])
+        parser.add_argument('--events', type=int, default=2000, help="Events per history length.")
+        parser.add_argument('--catalog', type=int, default=100000)
+        parser.add_argument('--redis', default=None, help="Redis URL to benchmark instead of memory.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default=None, help="Write the JSON report here.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        if options['redis']:
+            store = itemitem.RedisCooccurrenceStore(options['redis'])
+        else:
+            store = itemitem.MemoryCooccurrenceStore(None)
+
+        results = []
+        for length in options['history_lengths']:
+            timings = []
+            for _ in range(options['events']):
+                items = rng.sample(range(1, options['catalog'] + 1), length + 1)
+                history = {item: itemitem.signal_value(rating=rng.randint(1, 10)) for item in items[1:]}
+                value = itemitem.signal_value(rating=rng.randint(1, 10))
+                started = time.perf_counter()
+                itemitem.apply_change(items[0], 0.0, value, history, store=store)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            timings.sort()
+            results.append({
+                'history_length': length,
+                'events': len(timings),
+                'mean_ms': round(statistics.fmean(timings), 4),
+                'p50_ms': round(timings[len(timings) // 2], 4),
+                'p99_ms': round(timings[int(len(timings) * 0.99) - 1], 4),
+                'us_per_history_item': round(statistics.fmean(timings) * 1000 / length, 3),
+            })
+            self.stdout.write(json.dumps(results[-1]))
+
+        report = {'store': 'redis' if options['redis'] else 'memory', 'results': results}
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
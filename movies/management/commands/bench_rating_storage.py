@@ -0,0 +1,181 @@
+import hashlib
+import json
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from movies import partitioning
+
+
+# The Rating layout before partitioning: one table and its five B-trees.
+PLAIN_SQL = [
+    '''CREATE TABLE {table} (
+        id bigint NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+        tmdb_id integer NOT NULL,
+        rating double precision NOT NULL,
+        "timestamp" timestamp with time zone NOT NULL,
+        user_id uuid NOT NULL,
+        UNIQUE (user_id, tmdb_id)
+    )''',
+    'CREATE INDEX {table}_user_idx ON {table} (user_id)',
+    'CREATE INDEX {table}_user_time_idx ON {table} (user_id, "timestamp" DESC)',
+    'CREATE INDEX {table}_movie_idx ON {table} (tmdb_id) INCLUDE (rating)',
+]
+
+
+class Command(BaseCommand):
+    """
+    Benchmark Rating storage before and after partitioning (PostgreSQL only).
+
+    Builds two scratch tables with --rows synthetic ratings each: the old
+    unpartitioned layout with its five indexes, and the hash-partitioned
+    layout with the pared-down index set. Reports bulk load rate, single-row
+    insert rate into the full table (one transaction per insert, as the API
+    does), per-user and per-movie read latency, and table and index sizes.
+    The scratch tables are dropped afterwards unless --keep is given.
+    """
+
+    help = "Benchmark partitioned vs unpartitioned Rating storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000)
+        parser.add_argument('--users', type=int, default=500_000)
+        parser.add_argument('--movies', type=int, default=50_000)
+        parser.add_argument('--partitions', type=int, default=16)
+        parser.add_argument('--inserts', type=int, default=5000, help="Single-row inserts timed per layout.")
+        parser.add_argument('--lookups', type=int, default=2000, help="Reads timed per layout and query.")
+        parser.add_argument('--chunk', type=int, default=1_000_000, help="Rows per bulk-load statement.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true', help="Keep the scratch tables.")
+        parser.add_argument('--output', default=None, help="Write the JSON report here.")
+
+    def _user_id(self, n):
+        # Same derivation as the bulk load's md5(n::text)::uuid.
+        return uuid.UUID(hashlib.md5(str(n).encode()).hexdigest())
+
+    def _percentiles(self, timings):
+        timings.sort()
+        return {
+            'mean_ms': round(statistics.fmean(timings), 4),
+            'p50_ms': round(timings[len(timings) // 2], 4),
+            'p99_ms': round(timings[max(int(len(timings) * 0.99) - 1, 0)], 4),
+        }
+
+    def _load(self, cursor, table, options):
+        # Row g belongs to user g % users; stepping movies by a prime coprime to
+        # --movies keeps (user, tmdb_id) unique while rows per user <= --movies.
+        users, movies = options['users'], options['movies']
+        started = time.perf_counter()
+        for start in range(0, options['rows'], options['chunk']):
+            stop = min(start + options['chunk'], options['rows'])
+            cursor.execute(
+                f'''INSERT INTO {table} (user_id, tmdb_id, rating, "timestamp")
+                SELECT md5((g %% %s)::text)::uuid,
+                       ((g / %s) * 7919 + g %% %s) %% %s + 1,
+                       1 + (g * 2654435761 %% 10),
+                       now() - (g %% 31536000) * interval '1 second'
+                FROM generate_series(%s, %s) AS g''',
+                [users, users, users, movies, start, stop - 1],
+            )
+        seconds = time.perf_counter() - started
+        cursor.execute(f'VACUUM ANALYZE {table}')
+        return {'bulk_rows_per_second': round(options['rows'] / seconds), 'bulk_seconds': round(seconds, 1)}
+
+    def _sizes(self, cursor, table):
+        # pg_partition_tree lists nothing for a plain table, so fall back to the table itself.
+        cursor.execute(
+            '''SELECT sum(pg_table_size(relid)), sum(pg_indexes_size(relid)) FROM (
+                SELECT relid FROM pg_partition_tree(%s::regclass) WHERE isleaf
+                UNION SELECT %s::regclass
+            ) AS leaves WHERE relid NOT IN (SELECT inhparent FROM pg_inherits)''',
+            [table, table],
+        )
+        table_bytes, index_bytes = cursor.fetchone()
+        return {'table_mb': round(int(table_bytes) / 2 ** 20, 1), 'index_mb': round(int(index_bytes) / 2 ** 20, 1)}
+
+    def _inserts(self, cursor, table, options, rng):
+        timings = []
+        for i in range(options['inserts']):
+            user = self._user_id(rng.randrange(options['users']))
+            started = time.perf_counter()
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, tmdb_id, rating, "timestamp") VALUES (%s, %s, %s, now())',
+                [user, options['movies'] + 1 + i, rng.randint(1, 10)],
+            )
+            timings.append((time.perf_counter() - started) * 1000)
+        return {'insert_rows_per_second': round(len(timings) / (sum(timings) / 1000)), **self._percentiles(timings)}
+
+    def _reads(self, cursor, sql, params):
+        timings = []
+        for param in params:
+            started = time.perf_counter()
+            cursor.execute(sql, [param])
+            cursor.fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        return self._percentiles(timings)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("The storage benchmark needs PostgreSQL.")
+        if options['rows'] // options['users'] >= options['movies']:
+            raise CommandError("--rows / --users must be below --movies to keep (user, tmdb_id) unique.")
+
+        layouts = {
+            'unpartitioned': [sql.format(table='bench_rating_plain') for sql in PLAIN_SQL],
+            'partitioned': partitioning.create_table_sql(
+                'bench_rating_partitioned', options['partitions'], foreign_key=False
+            ),
+        }
+        tables = {'unpartitioned': 'bench_rating_plain', 'partitioned': 'bench_rating_partitioned'}
+        results = []
+        # Autocommit throughout: each insert is its own transaction, as in the API.
+        with connection.cursor() as cursor:
+            try:
+                for layout, statements in layouts.items():
+                    table = tables[layout]
+                    self._drop(cursor, table)
+                    for statement in statements:
+                        cursor.execute(statement)
+                    self.stdout.write(f"Loading {options['rows']} rows into {table}...")
+                    result = {'layout': layout, **self._load(cursor, table, options)}
+
+                    rng = random.Random(options['seed'])
+                    result['single_insert'] = self._inserts(cursor, table, options, rng)
+                    users = [self._user_id(rng.randrange(options['users'])) for _ in range(options['lookups'])]
+                    movies = [rng.randint(1, options['movies']) for _ in range(options['lookups'])]
+                    # RatingViewSet.list and the per-movie average written on every rating.
+                    result['user_ratings'] = self._reads(
+                        cursor,
+                        f'SELECT id, tmdb_id, rating, "timestamp" FROM {table} '
+                        f'WHERE user_id = %s ORDER BY "timestamp" DESC',
+                        users,
+                    )
+                    result['movie_average'] = self._reads(
+                        cursor, f'SELECT avg(rating) FROM {table} WHERE tmdb_id = %s', movies
+                    )
+                    result.update(self._sizes(cursor, table))
+                    results.append(result)
+                    self.stdout.write(json.dumps(result))
+            finally:
+                if not options['keep']:
+                    for table in tables.values():
+                        self._drop(cursor, table)
+
+        report = {
+            'rows': options['rows'],
+            'users': options['users'],
+            'movies': options['movies'],
+            'partitions': options['partitions'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+
+    def _drop(self, cursor, table):
+        cursor.execute(f'DROP TABLE IF EXISTS {table}')
+        cursor.execute(f'DROP SEQUENCE IF EXISTS {table}_id_seq')
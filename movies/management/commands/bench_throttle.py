@@ -0,0 +1,93 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from movies import throttling
+
+
+class _View:
+    action = 'discover'
+    upstream_actions = ['discover']
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the per-request cost of the API throttles.
+
+    Each simulated request runs both throttles the way DRF does (overall and
+    upstream budget) for one of --clients anonymous clients, so the figures
+    include key building and rate parsing as well as the limiter itself.
+    Uses the limiter configured by THROTTLE_REDIS_URL, or --redis. The budget
+    is 1 ms per request at p99.
+    """
+
+    help = "Benchmark throttle overhead per request."
+
+    BUDGET_MS = 1.0
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--clients', type=int, default=1000, help="Distinct client IPs.")
+        parser.add_argument('--redis', default=None, help="Benchmark a Redis limiter at this URL.")
+        parser.add_argument('--output', default=None, help="Write the JSON report here.")
+
+    def _time(self, check, requests):
+        timings, allowed = [], 0
+        for request in requests:
+            started = time.perf_counter()
+            allowed += check(request)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return {
+            'requests': len(timings),
+            'allowed': allowed,
+            'throttled': len(timings) - allowed,
+            'mean_ms': round(statistics.fmean(timings), 4),
+            'p50_ms': round(timings[len(timings) // 2], 4),
+            'p99_ms': round(timings[max(int(len(timings) * 0.99) - 1, 0)], 4),
+        }
+
+    def handle(self, *args, **options):
+        if options['redis']:
+            throttling._limiter = throttling.RedisLimiter(options['redis'])
+        limiter = throttling.get_limiter()
+
+        factory = APIRequestFactory()
+        requests = []
+        for i in range(options['requests']):
+            client = i % options['clients']
+            request = Request(factory.get(
+                '/api/movies/discover/', REMOTE_ADDR=f"10.{client >> 16 & 255}.{client >> 8 & 255}.{client & 255}"
+            ))
+            # Resolve the anonymous user up front; that cost belongs to authentication.
+            request.user
+            requests.append(request)
+
+        view = _View()
+        throttles = [throttling.RequestRateThrottle(), throttling.UpstreamRateThrottle()]
+        results = [
+            {'path': 'limiter', **self._time(
+                lambda request: limiter.hit(f"bench:{request.META['REMOTE_ADDR']}", 100, 1.0)[0], requests
+            )},
+            {'path': 'throttles', **self._time(
+                lambda request: all([throttle.allow_request(request, view) for throttle in throttles]), requests
+            )},
+        ]
+        for result in results:
+            self.stdout.write(json.dumps(result))
+
+        report = {
+            'limiter': type(limiter).__name__,
+            'clients': options['clients'],
+            'budget_ms': self.BUDGET_MS,
+            'within_budget': all(result['p99_ms'] < self.BUDGET_MS for result in results),
+            'results': results,
+        }
+        self.stdout.write(json.dumps({'within_budget': report['within_budget']}))
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
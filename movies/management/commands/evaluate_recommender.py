@@ -0,0 +1,99 @@
+import json
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from movies.recommender import evaluation
+
+
+def _evaluate(name, options, split, k):
+    return evaluation.evaluate(evaluation.VARIANTS[name](**options), split, k=k)
+
+
+class Command(BaseCommand):
+    """
+    Offline evaluation of the recommender variants on a time-based split of Rating.
+
+    Everything rated before the cutoff (plus earlier watchlist entries) is
+    training data; ratings at or above --relevant after it are the held-out
+    positives. Each variant is fitted and scored in its own worker process, so
+    variants run in parallel and memory is measured per variant. The JSON
+    report is meant to be diffed between commits, like benchmarks/run.py.
+    """
+
+    help = "Evaluate recommender variants offline (quality, latency, memory)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--variants', nargs='+', default=list(evaluation.VARIANTS),
+                            choices=list(evaluation.VARIANTS))
+        parser.add_argument('--k', type=int, default=20)
+        parser.add_argument('--test-fraction', type=float, default=0.2,
+                            help="Share of ratings, by time, held out for testing.")
+        parser.add_argument('--relevant', type=float, default=7.0,
+                            help="Minimum held-out rating that counts as a positive.")
+        parser.add_argument('--max-users', type=int, default=5000,
+                            help="Test users sampled for scoring (0 for all).")
+        parser.add_argument('--nprobe', type=int, default=8, help="IVF probes for the embeddings variant.")
+        parser.add_argument('--factors', type=int, default=64, help="Embedding dimensions.")
+        parser.add_argument('--workers', type=int, default=None, help="Processes (default: one per variant).")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default=None, help="Write the JSON report here.")
+
+    def _variant_options(self, name, options):
+        if name == 'embeddings':
+            return {'nprobe': options['nprobe'], 'factors': options['factors'], 'seed': options['seed']}
+        return {}
+
+    def _commit(self):
+        try:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        split = evaluation.time_split(
+            test_fraction=options['test_fraction'],
+            relevant_rating=options['relevant'],
+            max_users=options['max_users'] or None,
+            seed=options['seed'],
+        )
+        if split is None or not split.test:
+            raise CommandError("Not enough ratings on both sides of the time split to evaluate.")
+        self.stdout.write(
+            f"Split at {split.cutoff.isoformat()}: {len(split.train)} training users, "
+            f"{len(split.test)} test users, {len(split.catalog)} movies."
+        )
+
+        # Worker processes must not share the parent's database sockets.
+        connections.close_all()
+        workers = options['workers'] or len(options['variants'])
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup, max_tasks_per_child=1) as pool:
+            futures = [
+                pool.submit(_evaluate, name, self._variant_options(name, options), split, options['k'])
+                for name in options['variants']
+            ]
+            results = []
+            for future in futures:
+                results.append(future.result())
+                self.stdout.write(json.dumps(results[-1]))
+
+        report = {
+            'commit': self._commit(),
+            'cutoff': split.cutoff.isoformat(),
+            'k': options['k'],
+            'relevant_rating': options['relevant'],
+            'train_users': len(split.train),
+            'test_users': len(split.test),
+            'catalog': len(split.catalog),
+            'wall_seconds': round(time.perf_counter() - started, 2),
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
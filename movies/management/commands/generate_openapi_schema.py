@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movies import schema
+
+
+class Command(BaseCommand):
+    """
+    Generate the OpenAPI schema once, for serving from /swagger.json and /swagger.yaml.
+
+    Run at deploy time (after code changes, before starting the workers). The
+    files are written next to OPENAPI_SCHEMA_PATH, and running workers pick
+    them up on their next schema request. With --check nothing is written;
+    the command fails if the files on disk are missing or out of date, for CI.
+    """
+
+    help = "Pre-generate the OpenAPI schema as JSON and YAML."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default=None,
+                            help="Public base URL of the API (sets host and scheme in the schema).")
+        parser.add_argument('--check', action='store_true',
+                            help="Fail if the generated files are missing or stale instead of writing them.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        swagger = schema.generate_schema(url=options['url'])
+        seconds = time.perf_counter() - started
+
+        stale = []
+        for fmt in schema.FORMATS:
+            document = schema.encode(swagger, fmt)
+            path = schema.schema_path(fmt)
+            if options['check']:
+                if not path.exists() or path.read_bytes() != document.content:
+                    stale.append(str(path))
+                continue
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{fmt}.tmp")
+            tmp.write_bytes(document.content)
+            tmp.replace(path)
+            self.stdout.write(f"Wrote {path} ({len(document.content)} bytes, ETag {document.etag})")
+
+        if stale:
+            raise CommandError(f"OpenAPI schema is out of date: {', '.join(stale)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated schema for {len(swagger.paths)} paths in {seconds * 1000:.0f} ms."
+        ))
@@ -0,0 +1,87 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.utils import OperationalError
+
+from movies import partitioning
+
+
+class Command(BaseCommand):
+    """
+    Move Rating onto the hash-partitioned table without downtime (PostgreSQL only).
+
+    Creates the shadow table if migration 0003 left the table plain, copies
+    rows over in id batches while the trigger mirrors live writes, checks the
+    row counts and, with --swap, switches the tables under a short lock. The
+    copy can be stopped and resumed; batches already copied are skipped by
+    ON CONFLICT. --drop-old removes the old table once the swap has been verified.
+    """
+
+    help = "Backfill and swap in the partitioned Rating table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help="Ids per copy transaction.")
+        parser.add_argument('--start-id', type=int, default=None, help="Resume the copy from this id.")
+        parser.add_argument('--pause-ms', type=int, default=0, help="Sleep between batches to limit load.")
+        parser.add_argument('--swap', action='store_true', help="Swap the tables once the copy is complete.")
+        parser.add_argument('--lock-timeout', default='5s', help="Give up on the swap lock after this long.")
+        parser.add_argument('--drop-old', action='store_true', help="Drop the old table after a swap.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Rating partitioning needs PostgreSQL.")
+
+        current = partitioning.state(connection)
+        if current == 'partitioned':
+            self.stdout.write("Rating is already partitioned.")
+            if options['drop_old']:
+                partitioning.drop_old(connection)
+                self.stdout.write(self.style.SUCCESS(f"Dropped {partitioning.OLD}."))
+            return
+        if current == 'plain':
+            partitioning.create_shadow(connection, settings.RATING_PARTITIONS)
+            self.stdout.write(f"Created {partitioning.SHADOW} ({settings.RATING_PARTITIONS} partitions).")
+
+        self._backfill(options)
+
+        source, shadow = partitioning.counts(connection)
+        self.stdout.write(f"{source} rows in {partitioning.TABLE}, {shadow} in {partitioning.SHADOW}.")
+        if source != shadow:
+            raise CommandError("Row counts differ; rerun the backfill before swapping.")
+        if not options['swap']:
+            self.stdout.write("Copy complete. Run again with --swap to switch tables.")
+            return
+
+        try:
+            partitioning.swap(connection, lock_timeout=options['lock_timeout'])
+        except OperationalError as e:
+            raise CommandError(f"Swap did not get its lock, nothing was changed; retry later: {str(e)}")
+        self.stdout.write(self.style.SUCCESS(f"{partitioning.TABLE} is now partitioned."))
+        if options['drop_old']:
+            partitioning.drop_old(connection)
+            self.stdout.write(self.style.SUCCESS(f"Dropped {partitioning.OLD}."))
+
+    def _backfill(self, options):
+        bounds = partitioning.id_range(connection)
+        if bounds is None:
+            return
+        # Rows inserted after this point reach the shadow table through the trigger.
+        low, high = bounds
+        start = max(options['start_id'] or low, low)
+        started = time.perf_counter()
+        copied = 0
+        while start <= high:
+            stop = start + options['batch_size']
+            copied += partitioning.backfill_batch(connection, start, stop)
+            start = stop
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"Copied up to id {stop - 1} of {high}: {copied} rows, {copied / elapsed:.0f} rows/s.",
+                ending='\r',
+            )
+            if options['pause_ms']:
+                time.sleep(options['pause_ms'] / 1000)
+        self.stdout.write('')
+        self.stdout.write(f"Backfill copied {copied} rows in {time.perf_counter() - started:.1f}s.")
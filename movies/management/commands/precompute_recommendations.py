@@ -0,0 +1,88 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from movies.recommender import precompute
+
+
+def _run_shard(user_ids, n, model, write):
+    return precompute.run_shard(user_ids, n=n, model=model, write=write)
+
+
+class Command(BaseCommand):
+    """
+    Precompute top-N recommendations for every active user.
+
+    Active users (rating or watchlist activity in the last --days) are split
+    into shards. Each shard is scored by a worker process: the histories are
+    read in two queries, scored with the trained model and written in one bulk
+    upsert. With --celery the shards are queued to the Celery workers instead.
+
+    The report gives users per second and wall time; run with different
+    --workers values to measure how throughput scales with cores.
+    """
+
+    help = "Precompute per-user recommendations across a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--n', type=int, default=50, help="Recommendations stored per user.")
+        parser.add_argument('--days', type=int, default=30, help="Activity window for active users.")
+        parser.add_argument('--model', choices=['embeddings', 'itemitem'], default='embeddings')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--shard-size', type=int, default=500)
+        parser.add_argument('--celery', action='store_true', help="Queue shards to Celery instead.")
+        parser.add_argument('--dry-run', action='store_true', help="Score without storing the results.")
+        parser.add_argument('--output', default=None, help="Write the JSON report here.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        user_ids = precompute.active_user_ids(options['days'])
+        shards = [
+            user_ids[start:start + options['shard_size']]
+            for start in range(0, len(user_ids), options['shard_size'])
+        ]
+        self.stdout.write(f"{len(user_ids)} active users in {len(shards)} shards.")
+
+        if options['celery']:
+            from movies.tasks import precompute_recommendations_shard
+
+            for shard in shards:
+                precompute_recommendations_shard.delay(shard, n=options['n'], model=options['model'])
+            self.stdout.write(self.style.SUCCESS(f"Queued {len(shards)} shards."))
+            return
+
+        # Worker processes must not share the parent's database sockets.
+        connections.close_all()
+        scored = stored = 0
+        shard_seconds = []
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            futures = [
+                pool.submit(_run_shard, shard, options['n'], options['model'], not options['dry_run'])
+                for shard in shards
+            ]
+            for future in as_completed(futures):
+                users, lists, seconds = future.result()
+                scored += users
+                stored += lists
+                shard_seconds.append(seconds)
+
+        wall = time.perf_counter() - started
+        report = {
+            'model': options['model'],
+            'workers': options['workers'],
+            'users': scored,
+            'stored': 0 if options['dry_run'] else stored,
+            'shards': len(shards),
+            'wall_seconds': round(wall, 2),
+            'users_per_second': round(scored / wall, 1) if wall else None,
+            'mean_shard_seconds': round(sum(shard_seconds) / len(shard_seconds), 3) if shard_seconds else None,
+        }
+        self.stdout.write(json.dumps(report))
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from movies import genres
+
+
+class Command(BaseCommand):
+    """
+    Backfill Movie.genre_mask from stored genre names and recompute every
+    user's genre-affinity profile from their preferences and ratings.
+
+    Rating writes keep profiles current incrementally; run this once after
+    deploying the genre vocabulary and then occasionally to correct drift
+    (for example ratings of movies whose genres were not yet known).
+    """
+
+    help = "Backfill movie genre masks and rebuild user genre-affinity profiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-movies', action='store_true', help="Do not backfill Movie.genre_mask.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if not options['skip_movies']:
+            updated = genres.backfill_movie_masks(batch_size=options['batch_size'])
+            self.stdout.write(f"Updated genre masks on {updated} movies.")
+        profiles = genres.rebuild_affinities(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {profiles} genre-affinity profiles in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,132 @@
+import itertools
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from movies.models import Movie, Rating, User, Watchlist
+
+
+BENCHMARK_EMAIL_DOMAIN = 'bench.local'
+GENRES = [
+    'Action', 'Adventure', 'Animation', 'Comedy', 'Crime', 'Documentary', 'Drama',
+    'Family', 'Fantasy', 'History', 'Horror', 'Music', 'Mystery', 'Romance',
+    'Science Fiction', 'Thriller', 'War', 'Western',
+]
+
+
+class Command(BaseCommand):
+    """
+    Seed the database with synthetic users, movies, ratings and watchlist entries.
+
+    - Movie popularity follows a Zipf-like distribution, so a few titles get most ratings.
+    - User activity is skewed the same way, so a few users rate many movies.
+    - All users share one password hash, so seeding does not pay for hashing per user.
+    """
+
+    help = "Seed synthetic data for load tests and benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--movies', type=int, default=10000)
+        parser.add_argument('--ratings', type=int, default=50000)
+        parser.add_argument('--watchlist', type=int, default=None,
+                            help="Watchlist entries to create (defaults to half of --ratings).")
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help="Zipf exponent for movie popularity and user activity.")
+        parser.add_argument('--password', default='benchmark-pass')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--clear', action='store_true',
+                            help="Delete previously seeded benchmark data first.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        watchlist_total = options['watchlist']
+        if watchlist_total is None:
+            watchlist_total = options['ratings'] // 2
+
+        if options['clear']:
+            self._clear(options['movies'])
+
+        with transaction.atomic():
+            movie_ids = self._seed_movies(rng, options['movies'], batch_size)
+            users = self._seed_users(options['users'], options['password'], batch_size)
+
+            movie_weights = self._zipf_weights(len(movie_ids), options['skew'])
+            user_weights = self._zipf_weights(len(users), options['skew'])
+            rng.shuffle(user_weights)
+
+            ratings = self._pairs(rng, users, movie_ids, user_weights, movie_weights, options['ratings'])
+            Rating.objects.bulk_create(
+                (Rating(user_id=user_id, tmdb_id=tmdb_id, rating=rng.randint(1, 10))
+                 for user_id, tmdb_id in ratings),
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+            watchlist = self._pairs(rng, users, movie_ids, user_weights, movie_weights, watchlist_total)
+            Watchlist.objects.bulk_create(
+                (Watchlist(user_id=user_id, tmdb_id=tmdb_id) for user_id, tmdb_id in watchlist),
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} users, {len(movie_ids)} movies, "
+            f"{len(ratings)} ratings and {len(watchlist)} watchlist entries."
+        ))
+
+    def _clear(self, movie_count):
+        """Remove users (and their ratings/watchlists) and movies created by earlier runs."""
+        User.objects.filter(email__endswith=f"@{BENCHMARK_EMAIL_DOMAIN}").delete()
+        Movie.objects.filter(tmdb_id__lte=movie_count).delete()
+
+    def _seed_movies(self, rng, count, batch_size):
+        now = timezone.now()
+        movies = []
+        for tmdb_id in range(1, count + 1):
+            movies.append(Movie(
+                tmdb_id=tmdb_id,
+                title=f"Benchmark Movie {tmdb_id}",
+                release_year=rng.randint(1950, 2025),
+                overview="Synthetic movie used for benchmarks.",
+                poster_path=f"/bench{tmdb_id}.jpg",
+                genres=rng.sample(GENRES, rng.randint(1, 3)),
+                popularity=round(1000.0 / tmdb_id, 3),
+                cached_at=now,
+            ))
+        Movie.objects.bulk_create(movies, batch_size=batch_size, ignore_conflicts=True)
+        return [movie.tmdb_id for movie in movies]
+
+    def _seed_users(self, count, password, batch_size):
+        password_hash = make_password(password)
+        users = [
+            User(
+                username=f"bench_user_{i}",
+                email=f"bench{i}@{BENCHMARK_EMAIL_DOMAIN}",
+                password=password_hash,
+            )
+            for i in range(count)
+        ]
+        User.objects.bulk_create(users, batch_size=batch_size, ignore_conflicts=True)
+        emails = [user.email for user in users]
+        return list(User.objects.filter(email__in=emails).values_list('user_id', flat=True))
+
+    def _zipf_weights(self, count, skew):
+        return [1.0 / (rank ** skew) for rank in range(1, count + 1)]
+
+    def _pairs(self, rng, users, movie_ids, user_weights, movie_weights, total):
+        """Draw `total` distinct (user, movie) pairs using the skewed weights."""
+        total = min(total, len(users) * len(movie_ids))
+        movie_cum = list(itertools.accumulate(movie_weights))
+        user_cum = list(itertools.accumulate(user_weights))
+        pairs = set()
+        while len(pairs) < total:
+            needed = total - len(pairs)
+            drawn_users = rng.choices(users, cum_weights=user_cum, k=needed)
+            drawn_movies = rng.choices(movie_ids, cum_weights=movie_cum, k=needed)
+            pairs.update(zip(drawn_users, drawn_movies))
+        return pairs
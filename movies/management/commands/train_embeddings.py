@@ -0,0 +1,61 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from movies.recommender import embeddings
+
+
+class Command(BaseCommand):
+    """
+    Train implicit-feedback ALS embeddings on Rating and Watchlist and build
+    the IVF index over the item vectors.
+
+    Run periodically (e.g. nightly). The model is written atomically to
+    EMBEDDINGS_PATH and picked up by running workers on their next request.
+    """
+
+    help = "Train matrix-factorization embeddings and the ANN index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factors', type=int, default=embeddings.DEFAULT_FACTORS)
+        parser.add_argument('--iterations', type=int, default=embeddings.DEFAULT_ITERATIONS)
+        parser.add_argument('--regularization', type=float, default=embeddings.DEFAULT_REGULARIZATION)
+        parser.add_argument('--alpha', type=float, default=embeddings.DEFAULT_ALPHA,
+                            help="Confidence gained per unit of signal value.")
+        parser.add_argument('--lists', type=int, default=None,
+                            help="IVF cells (default: about sqrt of the catalog size).")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default=None, help="Defaults to EMBEDDINGS_PATH.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        interactions = embeddings.load_interactions(alpha=options['alpha'])
+        if interactions is None:
+            self.stdout.write(self.style.WARNING("No ratings or watchlist entries to train on."))
+            return
+        self.stdout.write(
+            f"Loaded {interactions.nnz} interactions for {len(interactions.user_ids)} users and "
+            f"{len(interactions.item_ids)} movies in {time.perf_counter() - started:.1f}s."
+        )
+
+        def progress(iteration):
+            self.stdout.write(f"Iteration {iteration + 1}/{options['iterations']} "
+                              f"({time.perf_counter() - started:.1f}s)")
+
+        model = embeddings.EmbeddingModel.train(
+            interactions,
+            n_lists=options['lists'],
+            nprobe=settings.EMBEDDINGS_NPROBE,
+            factors=options['factors'],
+            regularization=options['regularization'],
+            iterations=options['iterations'],
+            seed=options['seed'],
+            callback=progress,
+        )
+        output = options['output'] or settings.EMBEDDINGS_PATH
+        model.save(output)
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved embeddings with {model.index.n_lists} IVF cells to {output} "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
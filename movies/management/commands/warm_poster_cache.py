@@ -0,0 +1,57 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from movies import posters
+from movies.models import Movie
+
+
+class Command(BaseCommand):
+    """
+    Fill the poster cache for the most popular movies ahead of traffic.
+
+    Fetches every width in --widths (default POSTER_WIDTHS) of the posters of
+    the top --limit movies by popularity. Posters already cached are skipped
+    without an upstream call, so the command can be rerun after a deploy or
+    on a schedule.
+    """
+
+    help = "Pre-fetch poster width variants into the local poster cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=1000, help="Most popular movies to warm.")
+        parser.add_argument('--widths', nargs='+', default=None, help="Widths to fetch (default POSTER_WIDTHS).")
+        parser.add_argument('--concurrency', type=int, default=4, help="Parallel upstream fetches.")
+
+    def handle(self, *args, **options):
+        widths = options['widths'] or settings.POSTER_WIDTHS
+        unknown = set(widths) - set(settings.POSTER_WIDTHS)
+        if unknown:
+            raise CommandError(f"Not in POSTER_WIDTHS: {', '.join(sorted(unknown))}")
+
+        names = [
+            posters.poster_name(poster_path)
+            for poster_path in Movie.objects.order_by('-popularity', 'tmdb_id')
+            .values_list('poster_path', flat=True)[:options['limit']]
+        ]
+        jobs = [(width, name) for name in names if name for width in widths]
+        cache = posters.get_cache()
+
+        def warm(job):
+            try:
+                cache.get(*job)
+                return None
+            except (posters.PosterNotFound, requests.RequestException) as e:
+                return f"{job[0]}/{job[1]}: {str(e)}"
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            failures = [error for error in executor.map(warm, jobs) if error]
+        for error in failures[:20]:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {len(jobs) - len(failures)}/{len(jobs)} posters in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,151 @@
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+
+from movies import instrumentation
+
+
+class PerformanceMiddleware:
+    """
+    Middleware that records where time goes in each request.
+
+    - Counts and times DB queries on every configured connection.
+    - Collects TMDb call, cache and serialization stats recorded by the app.
+    - Adds a Server-Timing header and feeds the histograms served on /metrics.
+    - Adds an X-DB-Query-Count header when BENCHMARK_MODE is set.
+    """
+
+    QUERY_COUNT_HEADER = 'X-DB-Query-Count'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'PERFORMANCE_SERVER_TIMING', True)
+        self.query_count_header = getattr(settings, 'BENCHMARK_MODE', False)
+
+    def __call__(self, request):
+        stats, token = instrumentation.start_request()
+        started = time.perf_counter()
+
+        def db_timer(execute, sql, params, many, context):
+            query_started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats.record_query(sql, time.perf_counter() - query_started)
+
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(db_timer))
+                response = self.get_response(request)
+        finally:
+            instrumentation.end_request(token)
+
+        duration = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        stats.route = match.view_name if match else None
+        instrumentation.observe_request(stats, request.method, response.status_code, duration)
+
+        if self.server_timing:
+            response['Server-Timing'] = instrumentation.server_timing(stats, duration)
+        if self.query_count_header:
+            response[self.QUERY_COUNT_HEADER] = str(stats.db_queries)
+        return response
+
+
+class LoadSheddingMiddleware:
+    """
+    Middleware that rejects requests with 503 + Retry-After when the server is overloaded.
+
+    - Queue time: requests that waited longer than LOAD_SHED_MAX_QUEUE_MS
+      between the proxy and this process are rejected outright. The wait is
+      taken from the X-Request-Start header set by the proxy (nginx:
+      `proxy_set_header X-Request-Start "t=${msec}";`), so it reflects the
+      backlog in front of every worker; requests without it are not checked.
+    - In flight: once LOAD_SHED_MAX_IN_FLIGHT requests are already being
+      handled by this process, new ones are rejected outright. Counted per
+      process, so it only triggers with threaded or async workers; a sync
+      worker handles one request at a time and relies on the queue-time check.
+    - Latency: while the moving average of recent request times is above
+      LOAD_SHED_LATENCY_MS, a growing share of new requests is rejected, up
+      to MAX_LATENCY_SHED; the rest keep the average current, so shedding
+      stops once latency recovers.
+    - Paths under LOAD_SHED_EXEMPT_PATHS (metrics, admin) are never shed.
+    - Each check is disabled by setting it to 0.
+    """
+
+    # Weight of the newest request in the latency moving average.
+    EWMA_ALPHA = 0.1
+    MAX_LATENCY_SHED = 0.9
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.max_in_flight = getattr(settings, 'LOAD_SHED_MAX_IN_FLIGHT', 0)
+        self.latency_target = getattr(settings, 'LOAD_SHED_LATENCY_MS', 0) / 1000
+        self.max_queue_time = getattr(settings, 'LOAD_SHED_MAX_QUEUE_MS', 0) / 1000
+        self.retry_after = str(getattr(settings, 'LOAD_SHED_RETRY_AFTER', 1))
+        self.exempt_paths = tuple(getattr(settings, 'LOAD_SHED_EXEMPT_PATHS', ('/metrics', '/admin/')))
+        self.in_flight = 0
+        self.latency = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def queue_time(request, now=None):
+        """
+        Seconds since the proxy received the request, from X-Request-Start
+        ('t=<epoch>' in seconds, milliseconds or microseconds), or None.
+        """
+        header = request.headers.get('X-Request-Start', '')
+        try:
+            started = float(header[2:] if header.startswith('t=') else header)
+        except ValueError:
+            return None
+        # Scale milliseconds and microseconds since the epoch to seconds.
+        while started > 1e11:
+            started /= 1000
+        return max((time.time() if now is None else now) - started, 0.0)
+
+    def _shed_reason(self):
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return 'queue_depth'
+        if self.latency_target and self.latency > self.latency_target:
+            overload = (self.latency - self.latency_target) / self.latency_target
+            if random.random() < min(overload, self.MAX_LATENCY_SHED):
+                return 'latency'
+        return None
+
+    def _shed(self, reason):
+        instrumentation.SHED_REQUESTS.inc((reason,))
+        response = JsonResponse({'error': "Server is overloaded, retry later."}, status=503)
+        response['Retry-After'] = self.retry_after
+        return response
+
+    def __call__(self, request):
+        if request.path.startswith(self.exempt_paths):
+            return self.get_response(request)
+
+        if self.max_queue_time:
+            waited = self.queue_time(request)
+            if waited is not None and waited > self.max_queue_time:
+                return self._shed('queue_time')
+
+        with self._lock:
+            reason = self._shed_reason()
+            if reason is None:
+                self.in_flight += 1
+        if reason is not None:
+            return self._shed(reason)
+
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            duration = time.perf_counter() - started
+            with self._lock:
+                self.in_flight -= 1
+                self.latency += self.EWMA_ALPHA * (duration - self.latency)
@@ -0,0 +1,150 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:25
+
+import django.contrib.auth.models
+import django.contrib.auth.validators
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('is_superuser', models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status')),
+                ('username', models.CharField(error_messages={'unique': 'A user with that username already exists.'}, help_text='Required. 150 characters or fewer. Letters, digits and @/./+/-/_ only.', max_length=150, unique=True, validators=[django.contrib.auth.validators.UnicodeUsernameValidator()], verbose_name='username')),
+                ('first_name', models.CharField(blank=True, max_length=150, verbose_name='first name')),
+                ('last_name', models.CharField(blank=True, max_length=150, verbose_name='last name')),
+                ('is_staff', models.BooleanField(default=False, help_text='Designates whether the user can log into this admin site.', verbose_name='staff status')),
+                ('is_active', models.BooleanField(default=True, help_text='Designates whether this user should be treated as active. Unselect this instead of deleting accounts.', verbose_name='active')),
+                ('date_joined', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date joined')),
+                ('user_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('phone_number', models.CharField(blank=True, max_length=15, null=True)),
+                ('preferences', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('groups', models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.group', verbose_name='groups')),
+                ('user_permissions', models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_set', related_query_name='user', to='auth.permission', verbose_name='user permissions')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+            managers=[
+                ('objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserGenreAffinity',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='genre_affinity', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('preference', models.BinaryField(default=bytes)),
+                ('sums', models.BinaryField(default=bytes)),
+                ('counts', models.BinaryField(default=bytes)),
+                ('affinity', models.BinaryField(default=bytes)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserRecommendation',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='precomputed_recommendations', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('tmdb_ids', models.BinaryField()),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Movie',
+            fields=[
+                ('tmdb_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=255)),
+                ('release_year', models.IntegerField()),
+                ('overview', models.TextField(blank=True)),
+                ('poster_path', models.CharField(blank=True, max_length=255)),
+                ('genres', models.JSONField(default=list)),
+                ('genre_mask', models.BigIntegerField(default=0)),
+                ('average_rating', models.FloatField(default=0.0)),
+                ('popularity', models.FloatField(default=0.0)),
+                ('cached_at', models.DateTimeField(auto_now=True)),
+                ('hydrated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-release_year', '-tmdb_id'],
+                'indexes': [models.Index(fields=['-release_year', '-tmdb_id'], name='movie_year_idx'), models.Index(fields=['-popularity', 'tmdb_id'], name='movie_popularity_idx'), models.Index(fields=['tmdb_id'], include=('cached_at',), name='movie_fresh_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Rating',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tmdb_id', models.IntegerField()),
+                ('rating', models.FloatField()),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('tmdb_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=255)),
+                ('popularity', models.FloatField()),
+                ('cached_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-popularity'],
+                'indexes': [models.Index(fields=['-popularity'], name='recommendation_popularity_idx'), models.Index(fields=['cached_at'], name='recommendation_cached_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Watchlist',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tmdb_id', models.IntegerField()),
+                ('added_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='watchlists', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-added_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-created_at'], name='user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['user', '-timestamp'], name='rating_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['tmdb_id'], include=('rating',), name='rating_movie_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='rating',
+            unique_together={('user', 'tmdb_id')},
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['user', '-added_at'], name='watchlist_user_time_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='watchlist',
+            unique_together={('user', 'tmdb_id')},
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='rating',
+            name='rating_user_time_idx',
+        ),
+        migrations.AlterField(
+            model_name='rating',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
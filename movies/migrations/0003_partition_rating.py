@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.migrations.exceptions import IrreversibleError
+
+from movies import partitioning
+
+
+def partition(apps, schema_editor):
+    """
+    Start partitioning Rating on PostgreSQL. An empty table is swapped at once;
+    otherwise rows are copied by `manage.py partition_ratings`.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql' or partitioning.state(connection) != 'plain':
+        return
+    partitioning.create_shadow(connection, settings.RATING_PARTITIONS)
+    if partitioning.id_range(connection) is None:
+        partitioning.swap(connection)
+        partitioning.drop_old(connection)
+
+
+def unpartition(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    current = partitioning.state(connection)
+    if current == 'partitioned':
+        raise IrreversibleError(
+            "Rating is already partitioned; restore it from movies_rating_unpartitioned by hand."
+        )
+    if current == 'backfilling':
+        partitioning.drop_shadow(connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_pare_rating_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0003_partition_rating'),
+    ]
+
+    operations = [
+        # A table partitioned by 0003 on a fresh install already has this index
+        # (see movies/partitioning.py), so it is only created where missing.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'CREATE INDEX IF NOT EXISTS rating_time_idx ON movies_rating ("timestamp", id)',
+                    'DROP INDEX IF EXISTS rating_time_idx',
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='rating',
+                    index=models.Index(fields=['timestamp', 'id'], name='rating_time_idx'),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['added_at', 'id'], name='watchlist_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['tmdb_id'], name='watchlist_movie_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:08
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='movie',
+            name='movie_fresh_idx',
+        ),
+    ]
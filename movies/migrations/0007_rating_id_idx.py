@@ -0,0 +1,45 @@
+from django.db import migrations
+
+from movies import partitioning
+
+
+def add_id_index(apps, schema_editor):
+    """
+    Index Rating.id on each partition (PostgreSQL). Once partitioned the primary
+    key is (user_id, id), so a lookup by id alone would scan every partition.
+    Fresh installs get the index from migration 0003; a plain table needs none
+    yet, as id is its primary key and create_shadow() adds it to the shadow.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    current = partitioning.state(connection)
+    if current == 'partitioned':
+        partitioning.create_index(connection, partitioning.TABLE, 'rating_id_idx', 'id_idx')
+    elif current == 'backfilling':
+        partitioning.create_index(
+            connection, partitioning.SHADOW, f'{partitioning.SHADOW}_id_idx', 'id_idx'
+        )
+
+
+def drop_id_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP INDEX IF EXISTS rating_id_idx')
+        cursor.execute(f'DROP INDEX IF EXISTS {partitioning.SHADOW}_id_idx')
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('movies', '0006_rating_time_brin'),
+    ]
+
+    operations = [
+        # PostgreSQL-only, like the partitioning, so not in the model state.
+        migrations.RunPython(add_id_index, drop_id_index),
+    ]
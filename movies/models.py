@@ -38,9 +38,9 @@ class User(AbstractUser):
         """Meta options for the User model."""
 
         ordering = ['-created_at']
+        # username and email are unique, so they already carry an index.
         indexes = [
-            models.Index(fields=['username'], name='username_idx'),
-            models.Index(fields=['email'], name='email_idx'),
+            models.Index(fields=['-created_at'], name='user_created_idx'),
         ]
 
 
@@ -61,12 +61,19 @@ class Movie(models.Model):
 
     genres = models.JSONField(default=list)
 
+    # Bit i is set for TMDb genre movies.genres.GENRE_IDS[i]
+    genre_mask = models.BigIntegerField(default=0)
+
     average_rating = models.FloatField(default=0.0)
 
     popularity = models.FloatField(default=0.0)
 
     cached_at = models.DateTimeField(auto_now=True)
 
+    # Set when full /movie/{id} details were stored; rows ingested from
+    # trending/discover results have no genre names until then.
+    hydrated_at = models.DateTimeField(null=True, blank=True)
+
     
     def __str__(self):
         """returns a string representation of the movie."""
@@ -75,10 +82,12 @@ class Movie(models.Model):
     class Meta:
         """Meta options for the movie model."""
 
-        ordering = ['-release_year']
+        ordering = ['-release_year', '-tmdb_id']
         indexes = [
-            models.Index(fields=['title']),
-            models.Index(fields=['release_year']),
+            # Backs the default ordering used by the list endpoint.
+            models.Index(fields=['-release_year', '-tmdb_id'], name='movie_year_idx'),
+            # Trending-style sorts by popularity.
+            models.Index(fields=['-popularity', 'tmdb_id'], name='movie_popularity_idx'),
         ]
 
 
@@ -87,7 +96,8 @@ class Rating(models.Model):
     Model representing user ratings for movies.
     """
 
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ratings')
+    # Indexed by the unique (user, tmdb_id) constraint, which leads with user.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ratings', db_index=False)
 
     tmdb_id = models.IntegerField()
 
@@ -106,10 +116,15 @@ class Rating(models.Model):
 
         ordering = ['-timestamp']
 
+        # Every index is maintained on each insert, so only what reads use is kept:
+        # - the unique (user, tmdb_id) index serves per-user reads (a user's
+        #   ratings are read in full, so sorting them by time needs no index);
+        # - rating_movie_idx covers the per-movie average computed on every rating write.
+        # On PostgreSQL the table is hash-partitioned by user (see movies/partitioning.py);
+        # rating_id_idx keeps lookups by id off a scan of every partition, and a BRIN index, rating_time_brin, serves the admin's date filter. Timestamps
+        # only grow, so it stays a few pages and inserts rarely touch it.
         indexes = [
-            models.Index(fields=['user']),
-            models.Index(fields=['tmdb_id']),
-            models.Index(fields=['rating']),
+            models.Index(fields=['tmdb_id'], include=['rating'], name='rating_movie_idx'),
         ]
 
 
@@ -138,8 +153,10 @@ class Watchlist(models.Model):
         ordering = ['-added_at']
 
         indexes = [
-            models.Index(fields=['user']),
-            models.Index(fields=['tmdb_id']),
+            models.Index(fields=['user', '-added_at'], name='watchlist_user_time_idx'),
+            # Admin ordering and date filter, and lookups by movie.
+            models.Index(fields=['added_at', 'id'], name='watchlist_time_idx'),
+            models.Index(fields=['tmdb_id'], name='watchlist_movie_idx'),
         ]
 
 
@@ -166,5 +183,47 @@ class Recommendation(models.Model):
         ordering = ['-popularity']
 
         indexes = [
-            models.Index(fields=['popularity']),
-        ]
\ No newline at end of file
+            models.Index(fields=['-popularity'], name='recommendation_popularity_idx'),
+            models.Index(fields=['cached_at'], name='recommendation_cached_idx'),
+        ]
+
+class UserRecommendation(models.Model):
+    """
+    Model holding the precomputed top-N recommendations for one user.
+    - tmdb_ids is a packed little-endian int32 array, best first (4 bytes per movie).
+    - Written in bulk by the precompute_recommendations job.
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='precomputed_recommendations')
+
+    tmdb_ids = models.BinaryField()
+
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """returns a string representation of the precomputed recommendations."""
+        return f"Precomputed recommendations for user {self.user_id}"
+
+
+class UserGenreAffinity(models.Model):
+    """
+    Model holding a user's genre-affinity profile (see movies/genres.py).
+    - Each field is a packed little-endian float32 vector indexed like genres.GENRE_IDS.
+    - affinity = preference + sums / (counts + smoothing), kept up to date on rating writes.
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='genre_affinity')
+
+    preference = models.BinaryField(default=bytes)
+
+    sums = models.BinaryField(default=bytes)
+
+    counts = models.BinaryField(default=bytes)
+
+    affinity = models.BinaryField(default=bytes)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        """returns a string representation of the genre-affinity profile."""
+        return f"Genre affinity for user {self.user_id}"
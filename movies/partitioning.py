@@ -0,0 +1,211 @@
+"""
+Hash partitioning of the Rating table on PostgreSQL.
+
+The move from the plain table is done online:
+
+1. create_shadow() creates `movies_rating_partitioned`, hash-partitioned by
+   user_id, plus a trigger that mirrors every write on `movies_rating` into it.
+2. backfill_batch() copies existing rows over in id ranges. Rows are locked
+   FOR SHARE while they are copied, so a concurrent update or delete either
+   waits for the batch or is seen by it, and the trigger's copy always wins.
+3. swap() renames the tables under a short ACCESS EXCLUSIVE lock. The old
+   table is kept as `movies_rating_unpartitioned` until drop_old().
+
+On an empty table (fresh installs, test databases) the migration does all of
+this at once. See `manage.py partition_ratings`.
+"""
+import logging
+
+from django.db import transaction
+
+
+logger = logging.getLogger(__name__)
+
+TABLE = 'movies_rating'
+SHADOW = 'movies_rating_partitioned'
+OLD = 'movies_rating_unpartitioned'
+SEQUENCE = f'{SHADOW}_id_seq'
+SYNC_FUNCTION = f'{TABLE}_sync_partitioned'
+# The model's secondary indexes as rating_{suffix}: columns. Index names are
+# schema-wide, so on the shadow table they are {SHADOW}_{suffix} until the swap.
+# The primary key leads with user_id, so id_idx serves lookups by id alone
+# (admin change pages, staff API detail views); ids only grow, so inserts
+# append to its last page.
+INDEXES = {
+    'id_idx': '(id)',
+    'movie_idx': '(tmdb_id) INCLUDE (rating)',
+    'time_brin': 'USING brin ("timestamp")',
+}
+COLUMNS = 'id, user_id, tmdb_id, rating, "timestamp"'
+
+
+def create_table_sql(table, partitions, sequence=None, foreign_key=True):
+    """
+    DDL for a Rating table hash-partitioned by user_id, with the model's index
+    set: the primary key and unique (user, tmdb_id) both lead with the
+    partition key, so per-user reads touch one partition.
+    """
+    sequence = sequence or f'{table}_id_seq'
+    references = ' REFERENCES movies_user (user_id) DEFERRABLE INITIALLY DEFERRED' if foreign_key else ''
+    statements = [
+        f'CREATE SEQUENCE {sequence}',
+        f'''CREATE TABLE {table} (
+            id bigint NOT NULL DEFAULT nextval('{sequence}'),
+            tmdb_id integer NOT NULL,
+            rating double precision NOT NULL,
+            "timestamp" timestamp with time zone NOT NULL,
+            user_id uuid NOT NULL{references},
+            PRIMARY KEY (user_id, id),
+            UNIQUE (user_id, tmdb_id)
+        ) PARTITION BY HASH (user_id)''',
+    ]
+    statements += [
+        f'CREATE TABLE {table}_p{remainder} PARTITION OF {table} '
+        f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+        for remainder in range(partitions)
+    ]
+    statements += [f'CREATE INDEX {table}_{suffix} ON {table} {columns}' for suffix, columns in INDEXES.items()]
+    return statements
+
+
+SYNC_FUNCTION_SQL = f'''
+CREATE FUNCTION {SYNC_FUNCTION}() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM {SHADOW} WHERE user_id = OLD.user_id AND id = OLD.id;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    -- The source table is unique on (user_id, tmdb_id), so any other row here
+    -- holding the pair is stale.
+    DELETE FROM {SHADOW} WHERE user_id = NEW.user_id AND tmdb_id = NEW.tmdb_id AND id <> NEW.id;
+    INSERT INTO {SHADOW} ({COLUMNS})
+    VALUES (NEW.id, NEW.user_id, NEW.tmdb_id, NEW.rating, NEW."timestamp");
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+'''
+
+
+def _relkind(cursor, table):
+    cursor.execute(
+        "SELECT relkind FROM pg_class WHERE relname = %s AND relnamespace = current_schema()::regnamespace",
+        [table],
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def state(connection):
+    """'partitioned', 'backfilling' (shadow and trigger in place) or 'plain'."""
+    with connection.cursor() as cursor:
+        if _relkind(cursor, TABLE) == 'p':
+            return 'partitioned'
+        if _relkind(cursor, SHADOW) == 'p':
+            return 'backfilling'
+    return 'plain'
+
+
+def create_shadow(connection, partitions):
+    """Create the partitioned shadow table and start mirroring writes into it."""
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        for statement in create_table_sql(SHADOW, partitions, sequence=SEQUENCE):
+            cursor.execute(statement)
+        cursor.execute(SYNC_FUNCTION_SQL)
+        cursor.execute(
+            f'CREATE TRIGGER {SYNC_FUNCTION} AFTER INSERT OR UPDATE OR DELETE ON {TABLE} '
+            f'FOR EACH ROW EXECUTE FUNCTION {SYNC_FUNCTION}()'
+        )
+    logger.info(f"Created {SHADOW} with {partitions} partitions")
+
+
+def id_range(connection):
+    """(min id, max id) of the plain table, or None if it is empty."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT min(id), max(id) FROM {TABLE}')
+        low, high = cursor.fetchone()
+    return None if low is None else (low, high)
+
+
+def backfill_batch(connection, start, stop):
+    """Copy rows with start <= id < stop into the shadow table. Returns rows copied."""
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            f'''WITH batch AS (
+                SELECT {COLUMNS} FROM {TABLE} WHERE id >= %s AND id < %s FOR SHARE
+            )
+            INSERT INTO {SHADOW} ({COLUMNS}) SELECT {COLUMNS} FROM batch
+            ON CONFLICT DO NOTHING''',
+            [start, stop],
+        )
+        return cursor.rowcount
+
+
+def counts(connection):
+    """Row counts of the plain and shadow tables."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT (SELECT count(*) FROM {TABLE}), (SELECT count(*) FROM {SHADOW})')
+        return cursor.fetchone()
+
+
+def swap(connection, lock_timeout='5s'):
+    """
+    Make the partitioned table `movies_rating`. Holds an ACCESS EXCLUSIVE lock
+    for a few renames only; gives up after `lock_timeout` rather than queueing
+    every rating request behind a long-running transaction.
+    """
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f"SET LOCAL lock_timeout = '{lock_timeout}'")
+        cursor.execute(f'LOCK TABLE {TABLE}, {SHADOW} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'DROP TRIGGER {SYNC_FUNCTION} ON {TABLE}')
+        cursor.execute(f'DROP FUNCTION {SYNC_FUNCTION}()')
+        # New ids continue after the old table's identity sequence.
+        cursor.execute(f"SELECT setval('{SEQUENCE}', (SELECT coalesce(max(id), 0) + 1 FROM {TABLE}), false)")
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {OLD}')
+        # IF EXISTS: migration 0003 runs before later migrations add indexes to the old table.
+        for suffix in INDEXES:
+            cursor.execute(f'ALTER INDEX IF EXISTS rating_{suffix} RENAME TO {OLD}_{suffix}')
+        cursor.execute(f'ALTER TABLE {SHADOW} RENAME TO {TABLE}')
+        for suffix in INDEXES:
+            cursor.execute(f'ALTER INDEX {SHADOW}_{suffix} RENAME TO rating_{suffix}')
+        cursor.execute(f"SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = '{TABLE}'::regclass")
+        for (partition,) in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {partition} RENAME TO {partition.replace(SHADOW, TABLE, 1)}')
+        cursor.execute(f'ALTER SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id')
+    logger.info(f"Swapped in the partitioned {TABLE}; the old table is kept as {OLD}")
+
+
+def create_index(connection, table, index, suffix):
+    """
+    Build INDEXES[suffix] on a partitioned table as `index` without blocking
+    writes: each partition's index is built CONCURRENTLY and attached to a
+    parent index created ON ONLY the table. Must run outside a transaction.
+    """
+    columns = INDEXES[suffix]
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [index])
+        if cursor.fetchone()[0] is not None:
+            return
+        cursor.execute(f"SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = '{table}'::regclass")
+        partitions = [partition for (partition,) in cursor.fetchall()]
+        for partition in partitions:
+            cursor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition}_{suffix} ON {partition} {columns}')
+        cursor.execute(f'CREATE INDEX {index} ON ONLY {table} {columns}')
+        for partition in partitions:
+            cursor.execute(f'ALTER INDEX {index} ATTACH PARTITION {partition}_{suffix}')
+    logger.info(f"Created {index} on {len(partitions)} partitions of {table}")
+
+
+def drop_old(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {OLD}')
+
+
+def drop_shadow(connection):
+    """Undo create_shadow() before the swap."""
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {SYNC_FUNCTION} ON {TABLE}')
+        cursor.execute(f'DROP FUNCTION IF EXISTS {SYNC_FUNCTION}()')
+        cursor.execute(f'DROP TABLE IF EXISTS {SHADOW}')
+        cursor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE}')
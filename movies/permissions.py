@@ -30,7 +30,7 @@ class MovieAccessPermission(BasePermission):
             
         # For anonymous users, only allow trending and discover
         if not request.user.is_authenticated:
-            return view.action in ['trending', 'discover', 'list']
+            return view.action in ['trending', 'local_trending', 'discover', 'genre_list', 'list']
         
         # Authenticated users get full access
         return True
\ No newline at end of file
@@ -0,0 +1,259 @@
+"""
+Poster image proxy.
+
+Posters are fetched from TMDb's image CDN once per width and kept in a
+content-addressed cache on local disk, from which /api/posters/ serves them.
+TMDb pre-generates each width (w92 ... w780), so nothing is resized here.
+The fetcher is pluggable (POSTER_FETCHER), so tests and benchmarks can point
+it at a local stub.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from movies import instrumentation
+
+
+logger = logging.getLogger(__name__)
+
+# TMDb poster file names, e.g. kqjL17yufvn9OVLyXYpvtyrFfak.jpg
+NAME_RE = re.compile(r'^[A-Za-z0-9_-]+\.(jpg|jpeg|png|webp)$')
+MEDIA_TYPES = {'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+# Hits refresh an entry's mtime, which orders eviction, at most this often.
+TOUCH_INTERVAL = 3600
+# Totals are re-read from disk at least this often, as other processes write too.
+RESCAN_INTERVAL = 300
+# Eviction frees space down to this share of the limit, so it does not run on every write.
+LOW_WATER = 0.9
+
+
+class PosterNotFound(Exception):
+    """The upstream has no poster by that name."""
+
+
+def poster_name(poster_path):
+    """'/abc.jpg' -> 'abc.jpg', or None if it is not a TMDb poster file name."""
+    name = (poster_path or '').lstrip('/')
+    return name if NAME_RE.match(name) else None
+
+
+def base_url(request=None):
+    """URL of the poster endpoint, ending in '/'; absolute when a request is given."""
+    url = reverse('poster', kwargs={'width': 'w0', 'name': 'x.jpg'}).rsplit('/', 2)[0] + '/'
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def poster_urls(poster_path, base):
+    """
+    Proxied URL of the poster for each width in POSTER_WIDTHS, under `base`
+    (from base_url(), resolved once per response). None without a poster.
+    """
+    name = poster_name(poster_path)
+    if name is None:
+        return None
+    return {width: f"{base}{width}/{name}" for width in settings.POSTER_WIDTHS}
+
+
+class HTTPPosterFetcher:
+    """
+    Default fetcher: GETs {TMDB_IMAGE_URL}/{width}/{name} over a pooled session.
+    Any object with a fetch(width, name) -> bytes method can replace it.
+    """
+
+    def __init__(self, base_url=None, timeout=10):
+        self.base_url = (base_url or settings.TMDB_IMAGE_URL).rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def fetch(self, width, name):
+        """The image bytes; raises PosterNotFound on a 404, requests errors otherwise."""
+        started = time.perf_counter()
+        status = None
+        try:
+            response = self.session.get(f"{self.base_url}/{width}/{name}", timeout=self.timeout)
+            status = response.status_code
+            if status == 404:
+                raise PosterNotFound(f"{width}/{name}")
+            response.raise_for_status()
+            return response.content
+        finally:
+            instrumentation.record_upstream('poster', status, time.perf_counter() - started)
+
+
+class Poster:
+    """A cached poster file; the ETag is its content hash."""
+
+    def __init__(self, path, digest, media_type):
+        self.path = path
+        self.digest = digest
+        self.media_type = media_type
+        self.etag = f'"{digest[:32]}"'
+
+
+class PosterCache:
+    """
+    Content-addressed disk cache of poster images with an LRU size bound.
+
+    - objects/ab/<sha256> holds each distinct image once.
+    - refs/<width>/<name> holds the hash of the image stored for that poster width.
+    - Files are written to a temporary name and renamed into place, so readers
+      never see a partial file and several processes can share the directory.
+    - Entries are evicted in mtime order, and hits refresh the mtime at most
+      once per TOUCH_INTERVAL. A ref whose object was evicted is a miss.
+    - Once the total passes `max_bytes`, least recently used entries are
+      deleted until it is under LOW_WATER of the limit.
+    - Concurrent misses for one poster in a process share a single fetch.
+    """
+
+    def __init__(self, root, max_bytes, fetcher):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.fetcher = fetcher
+        self._size = None
+        self._scanned_at = 0.0
+        self._size_lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        self._fetch_locks = [threading.Lock() for _ in range(64)]
+
+    def _ref_path(self, width, name):
+        return self.root / 'refs' / width / name
+
+    def _object_path(self, digest):
+        return self.root / 'objects' / digest[:2] / digest
+
+    def _touch(self, path, mtime):
+        if time.time() - mtime > TOUCH_INTERVAL:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+
+    def _lookup(self, ref, media_type):
+        try:
+            ref_mtime = ref.stat().st_mtime
+            digest = ref.read_text()
+            path = self._object_path(digest)
+            object_mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        self._touch(ref, ref_mtime)
+        self._touch(path, object_mtime)
+        return Poster(path, digest, media_type)
+
+    def _write(self, path, content):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(content)
+        tmp.replace(path)
+
+    def get(self, width, name, on_miss=None):
+        """
+        The cached poster, fetched and stored first on a miss. Raises
+        PosterNotFound for widths outside POSTER_WIDTHS and malformed names.
+        `on_miss` is called before each upstream fetch and may raise to refuse it.
+        """
+        if width not in settings.POSTER_WIDTHS or not NAME_RE.match(name):
+            raise PosterNotFound(f"{width}/{name}")
+        media_type = MEDIA_TYPES[name.rsplit('.', 1)[1]]
+        ref = self._ref_path(width, name)
+        poster = self._lookup(ref, media_type)
+        if poster is not None:
+            instrumentation.record_cache('poster', True)
+            return poster
+
+        with self._fetch_locks[hash(ref) % len(self._fetch_locks)]:
+            poster = self._lookup(ref, media_type)
+            if poster is not None:
+                instrumentation.record_cache('poster', True)
+                return poster
+            instrumentation.record_cache('poster', False)
+            if on_miss is not None:
+                on_miss()
+            content = self.fetcher.fetch(width, name)
+            digest = hashlib.sha256(content).hexdigest()
+            path = self._object_path(digest)
+            written = 0
+            if not path.exists():
+                self._write(path, content)
+                written = len(content)
+            self._write(ref, digest.encode())
+            self._added(written + len(digest))
+        return Poster(path, digest, media_type)
+
+    def _entries(self):
+        """(mtime, size, path) of every cached file."""
+        entries = []
+        for directory, _, files in os.walk(self.root):
+            for file in files:
+                # Skip files still being written.
+                if file.startswith('.'):
+                    continue
+                path = os.path.join(directory, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _added(self, size):
+        with self._size_lock:
+            stale = time.monotonic() - self._scanned_at > RESCAN_INTERVAL
+            if self._size is not None and not stale:
+                self._size += size
+                if self._size <= self.max_bytes:
+                    return
+        # Only one thread sweeps; the others keep serving.
+        if self._evict_lock.acquire(blocking=False):
+            try:
+                self.evict()
+            finally:
+                self._evict_lock.release()
+
+    def evict(self):
+        """Re-read the cache size from disk and drop LRU entries if it is over the limit."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        if total > self.max_bytes:
+            entries.sort()
+            target = total - self.max_bytes * LOW_WATER
+            for _, size, path in entries:
+                if freed >= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                freed += size
+            logger.info(f"Evicted {freed} bytes of posters; {total - freed} bytes remain")
+        with self._size_lock:
+            self._size = total - freed
+            self._scanned_at = time.monotonic()
+        return freed
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PosterCache(
+                    settings.POSTER_CACHE_DIR,
+                    max_bytes=settings.POSTER_CACHE_MAX_MB * 2 ** 20,
+                    fetcher=import_string(settings.POSTER_FETCHER)(),
+                )
+    return _cache
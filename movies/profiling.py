@@ -0,0 +1,258 @@
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+
+from movies import instrumentation
+
+
+PROFILE_HEADER = 'X-Profile-Request'
+PROFILE_ID_RE = re.compile(r'^[0-9]+-[0-9]+$')
+
+
+class StackSampler(threading.Thread):
+    """
+    Background thread that periodically samples the stacks of registered threads.
+
+    - Each registered thread gets a Counter of collapsed stacks ("a;b;c" -> hits).
+    - Only threads currently handling a profiled request are walked, so the cost
+      is proportional to in-flight requests, not to the whole process.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name='request-stack-sampler', daemon=True)
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def register(self, thread_id):
+        counts = Counter()
+        with self._lock:
+            self._active[thread_id] = counts
+        return counts
+
+    def unregister(self, thread_id):
+        with self._lock:
+            self._active.pop(thread_id, None)
+
+    def run(self):
+        own_id = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, counts in active:
+                frame = frames.get(thread_id)
+                if frame is not None and thread_id != own_id:
+                    counts[collapse_stack(frame)] += 1
+
+
+def collapse_stack(frame):
+    """Render a frame chain root-first in the collapsed format used by flamegraph tools."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class ProfileStore:
+    """
+    Bounded on-disk ring buffer of request profiles.
+
+    Each profile is a `<id>.json` metadata file (route, timing, queries, upstream
+    calls) plus either `<id>.folded` (collapsed stacks, for flamegraph.pl,
+    speedscope or inferno) or `<id>.prof` (cProfile pstats, for snakeviz or
+    flameprof). The oldest profiles are removed once `max_profiles` is exceeded.
+    """
+
+    EXTENSIONS = ('.folded', '.prof')
+
+    def __init__(self, directory, max_profiles):
+        self.directory = Path(directory)
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    def save(self, meta, folded=None, profiler=None):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profile_id = f"{time.time_ns()}-{os.getpid()}"
+        if folded is not None:
+            meta['format'] = 'folded'
+            (self.directory / f"{profile_id}.folded").write_text(
+                '\n'.join(f"{stack} {count}" for stack, count in folded.most_common()) + '\n'
+            )
+        else:
+            meta['format'] = 'pstats'
+            profiler.dump_stats(str(self.directory / f"{profile_id}.prof"))
+        meta['id'] = profile_id
+        (self.directory / f"{profile_id}.json").write_text(json.dumps(meta, default=str))
+        self._trim()
+        return profile_id
+
+    def _trim(self):
+        with self._lock:
+            metas = sorted(self.directory.glob('*.json'))
+            for path in metas[:max(0, len(metas) - self.max_profiles)]:
+                for suffix in ('.json',) + self.EXTENSIONS:
+                    path.with_suffix(suffix).unlink(missing_ok=True)
+
+    def list(self):
+        if not self.directory.exists():
+            return []
+        profiles = []
+        for path in sorted(self.directory.glob('*.json'), reverse=True):
+            try:
+                meta = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            meta.pop('queries', None)
+            meta.pop('upstream', None)
+            profiles.append(meta)
+        return profiles
+
+    def get(self, profile_id):
+        if not PROFILE_ID_RE.match(profile_id):
+            return None
+        path = self.directory / f"{profile_id}.json"
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def data_path(self, profile_id):
+        if not PROFILE_ID_RE.match(profile_id):
+            return None
+        for suffix in self.EXTENSIONS:
+            path = self.directory / f"{profile_id}{suffix}"
+            if path.exists():
+                return path
+        return None
+
+
+class RequestProfiler:
+    """
+    Decides which requests get profiled and stores their profiles.
+
+    - With PROFILING_ENABLED, every request is stack-sampled; the samples are
+      kept only if the request took longer than PROFILING_THRESHOLD_MS.
+    - Staff users can send `X-Profile-Request: cprofile` to capture a full
+      cProfile of one request, or any other value to force keeping the samples.
+      The sender is authenticated before the header is honoured; for anyone
+      else it is ignored.
+    """
+
+    def __init__(self):
+        self._sampler = None
+        self._store = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'PROFILING_ENABLED', False)
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = ProfileStore(
+                getattr(settings, 'PROFILING_DIR', Path(settings.BASE_DIR) / 'profiles'),
+                getattr(settings, 'PROFILING_MAX_PROFILES', 50),
+            )
+        return self._store
+
+    @property
+    def sampler(self):
+        if self._sampler is None:
+            with self._lock:
+                if self._sampler is None:
+                    interval = getattr(settings, 'PROFILING_SAMPLE_INTERVAL_MS', 5) / 1000.0
+                    sampler = StackSampler(interval)
+                    sampler.start()
+                    self._sampler = sampler
+        return self._sampler
+
+    @staticmethod
+    def is_staff(view, request, *args, **kwargs):
+        """
+        Authenticate the request ahead of dispatch, which only requests carrying
+        the profile header pay for. A failed authentication counts as not staff
+        and is reported by dispatch as usual.
+        """
+        try:
+            user = view.initialize_request(request, *args, **kwargs).user
+        except APIException:
+            return False
+        return bool(user and user.is_staff)
+
+    def dispatch(self, view, request, dispatch, *args, **kwargs):
+        """Run `dispatch` under the profiler and keep the profile if it qualifies."""
+        mode = request.headers.get(PROFILE_HEADER)
+        if mode and not self.is_staff(view, request, *args, **kwargs):
+            mode = None
+        stats = instrumentation.current_stats()
+        trace = stats.enable_trace() if stats is not None else None
+
+        thread_id = threading.get_ident()
+        profiler = None
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            samples = self.sampler.register(thread_id)
+
+        started = time.perf_counter()
+        try:
+            response = dispatch(request, *args, **kwargs)
+        finally:
+            duration = time.perf_counter() - started
+            if profiler is not None:
+                profiler.disable()
+            else:
+                self.sampler.unregister(thread_id)
+
+        forced = bool(mode)
+        threshold = getattr(settings, 'PROFILING_THRESHOLD_MS', 1000) / 1000.0
+        if forced or (profiler is None and duration >= threshold):
+            match = request.resolver_match
+            meta = {
+                'route': match.view_name if match else request.path,
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 3),
+                'created_at': timezone.now().isoformat(),
+                'forced': forced,
+                'queries': trace['queries'] if trace else [],
+                'upstream': trace['upstream'] if trace else [],
+            }
+            if profiler is not None:
+                self.store.save(meta, profiler=profiler)
+            else:
+                self.store.save(meta, folded=samples)
+        return response
+
+
+request_profiler = RequestProfiler()
+
+
+class ProfiledViewMixin:
+    """
+    View mixin that routes dispatch through the request profiler when enabled.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request_profiler.enabled:
+            return request_profiler.dispatch(self, request, super().dispatch, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
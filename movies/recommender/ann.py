@@ -0,0 +1,133 @@
+import numpy as np
+
+
+def top_k(scores, k):
+    """Indices of the k largest scores, best first, in O(n + k log k)."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+class ExactIndex:
+    """
+    Brute-force maximum inner product search over every vector.
+
+    - One matrix-vector product per query, O(n * d).
+    - Used as the ground truth when benchmarking the approximate index.
+    """
+
+    def __init__(self, vectors, ids):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.ids = np.asarray(ids)
+
+    def search(self, query, k):
+        scores = self.vectors @ np.asarray(query, dtype=np.float32)
+        best = top_k(scores, k)
+        return self.ids[best], scores[best]
+
+
+class IVFIndex:
+    """
+    Inverted-file index for maximum inner product search.
+
+    - Vectors are clustered with k-means into `n_lists` cells. A query scores
+      the centroids, then only the vectors in the `nprobe` best cells.
+    - `nprobe` is the recall/latency knob: 1 is fastest, `n_lists` is exact.
+    - Cells are stored as one contiguous array sorted by cell, so probing a cell
+      is a slice rather than a gather.
+    """
+
+    def __init__(self, centroids, offsets, vectors, ids, nprobe=8):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.ids = np.asarray(ids)
+        self.nprobe = nprobe
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, vectors, ids, n_lists=None, nprobe=8, iterations=10, sample_size=100000, seed=42):
+        """
+        Train the coarse quantizer on a sample and bucket every vector.
+        `n_lists` defaults to about sqrt(n), the usual balance between centroid
+        scoring and cell scanning.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ids = np.asarray(ids)
+        n_lists = min(n_lists or max(1, int(np.sqrt(len(vectors)))), len(vectors))
+        rng = np.random.default_rng(seed)
+
+        sample = vectors
+        if len(vectors) > sample_size:
+            sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = kmeans(sample, n_lists, iterations=iterations, rng=rng)
+
+        assignment = assign(vectors, centroids)
+        order = np.argsort(assignment, kind='stable')
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=n_lists), out=offsets[1:])
+        return cls(centroids, offsets, vectors[order], ids[order], nprobe=nprobe)
+
+    def search(self, query, k, nprobe=None):
+        query = np.asarray(query, dtype=np.float32)
+        probes = top_k(self.centroids @ query, nprobe or self.nprobe)
+        rows = np.concatenate([
+            np.arange(self.offsets[cell], self.offsets[cell + 1]) for cell in probes
+        ])
+        if not len(rows):
+            return self.ids[:0], np.empty(0, dtype=np.float32)
+        scores = self.vectors[rows] @ query
+        best = top_k(scores, k)
+        return self.ids[rows[best]], scores[best]
+
+    def to_arrays(self, prefix='ivf_'):
+        return {
+            f"{prefix}centroids": self.centroids,
+            f"{prefix}offsets": self.offsets,
+            f"{prefix}vectors": self.vectors,
+            f"{prefix}ids": self.ids,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix='ivf_', nprobe=8):
+        return cls(
+            arrays[f"{prefix}centroids"],
+            arrays[f"{prefix}offsets"],
+            arrays[f"{prefix}vectors"],
+            arrays[f"{prefix}ids"],
+            nprobe=nprobe,
+        )
+
+
+def assign(vectors, centroids, batch_size=65536):
+    """Nearest centroid (Euclidean) for each vector, in batches to bound memory."""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), batch_size):
+        batch = vectors[start:start + batch_size]
+        # |x - c|^2 = |x|^2 - 2 x.c + |c|^2; |x|^2 does not change the argmin.
+        distances = centroid_norms - 2 * (batch @ centroids.T)
+        labels[start:start + batch_size] = distances.argmin(axis=1)
+    return labels
+
+
+def kmeans(vectors, k, iterations=10, rng=None):
+    """Lloyd's k-means; empty clusters are re-seeded from random points."""
+    rng = rng or np.random.default_rng()
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(vectors, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.stack([
+            np.bincount(labels, weights=vectors[:, dim], minlength=k) for dim in range(vectors.shape[1])
+        ], axis=1)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+    return centroids
@@ -0,0 +1,315 @@
+import logging
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from movies.models import Rating, Watchlist
+from movies.recommender.ann import IVFIndex, top_k
+from movies.recommender.itemitem import WATCHLIST_WEIGHT, signal_value
+
+
+logger = logging.getLogger(__name__)
+
+# Implicit-feedback ALS (Hu, Koren & Volinsky, 2008). Every rated or watchlisted
+# movie is a positive preference p_ui = 1 with confidence
+#   c_ui = 1 + ALPHA * v_ui
+# where v_ui is the itemitem signal value (rating / 10, plus the watchlist weight).
+# Unobserved pairs are p_ui = 0 with confidence 1. The model minimizes
+#   sum_ui c_ui (p_ui - x_u . y_i)^2 + reg * (|X|^2 + |Y|^2)
+# by alternately solving for all user and all item factors.
+DEFAULT_FACTORS = 64
+DEFAULT_REGULARIZATION = 0.05
+DEFAULT_ALPHA = 20.0
+DEFAULT_ITERATIONS = 15
+# Conjugate-gradient steps per half-iteration. Each solve is warm-started from
+# the previous factors, so a few steps are enough (as in the `implicit` library).
+CG_STEPS = 3
+# Interactions processed per block, bounding the (nnz, factors) temporaries.
+BLOCK_NNZ = 2_000_000
+
+
+class Interactions:
+    """
+    A user x item confidence matrix in compressed sparse row form.
+
+    - `user_ids` and `item_ids` are sorted, so lookups are a binary search.
+    - `by_user` and `by_item` are (indptr, indices, confidence) triples for
+      the matrix and its transpose; ALS needs both.
+    """
+
+    def __init__(self, user_ids, item_ids, users, items, values, alpha=DEFAULT_ALPHA):
+        self.user_ids = user_ids
+        self.item_ids = item_ids
+        self.alpha = alpha
+        confidence = (1.0 + alpha * values).astype(np.float32)
+        self.by_user = _csr(users, items, confidence, len(user_ids))
+        self.by_item = _csr(items, users, confidence, len(item_ids))
+
+    @property
+    def nnz(self):
+        return len(self.by_user[1])
+
+    @classmethod
+    def from_arrays(cls, user_ids, tmdb_ids, values, alpha=DEFAULT_ALPHA):
+        """
+        Build from parallel (user_id, tmdb_id, value) arrays. Repeated pairs
+        (a rating and a watchlist entry for the same movie) are summed.
+        """
+        user_ids, users = np.unique(np.asarray(user_ids), return_inverse=True)
+        item_ids, items = np.unique(np.asarray(tmdb_ids, dtype=np.int64), return_inverse=True)
+        pairs, inverse = np.unique(users.astype(np.int64) * len(item_ids) + items, return_inverse=True)
+        values = np.bincount(inverse.ravel(), weights=np.asarray(values, dtype=np.float64))
+        return cls(user_ids, item_ids, pairs // len(item_ids), pairs % len(item_ids), values, alpha=alpha)
+
+
+def _csr(rows, cols, values, n_rows):
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, cols[order].astype(np.int64), values[order]
+
+
+def load_interactions(alpha=DEFAULT_ALPHA):
+    """Read every rating and watchlist entry into an Interactions matrix."""
+    user_ids, tmdb_ids, values = [], [], []
+    ratings = Rating.objects.order_by().values_list('user_id', 'tmdb_id', 'rating')
+    for user_id, tmdb_id, rating in ratings.iterator(chunk_size=10000):
+        user_ids.append(str(user_id))
+        tmdb_ids.append(tmdb_id)
+        values.append(signal_value(rating=rating))
+    watchlist = Watchlist.objects.order_by().values_list('user_id', 'tmdb_id')
+    for user_id, tmdb_id in watchlist.iterator(chunk_size=10000):
+        user_ids.append(str(user_id))
+        tmdb_ids.append(tmdb_id)
+        values.append(WATCHLIST_WEIGHT)
+    if not user_ids:
+        return None
+    return Interactions.from_arrays(user_ids, tmdb_ids, values, alpha=alpha)
+
+
+def _blocks(indptr, block_nnz):
+    """Split rows into contiguous ranges of roughly `block_nnz` entries each."""
+    n_rows = len(indptr) - 1
+    start = 0
+    while start < n_rows:
+        end = int(np.searchsorted(indptr, indptr[start] + block_nnz, side='right')) - 1
+        end = min(max(end, start + 1), n_rows)
+        yield start, end
+        start = end
+
+
+def _segment_sum(values, indptr, n_rows):
+    """Sum consecutive runs of `values` rows as delimited by `indptr`."""
+    out = np.zeros((n_rows, values.shape[1]), dtype=values.dtype)
+    counts = np.diff(indptr)
+    nonempty = counts > 0
+    if nonempty.any():
+        out[nonempty] = np.add.reduceat(values, indptr[:-1][nonempty], axis=0)
+    return out
+
+
+def _solve_block(X, Y, gram, indptr, indices, confidence, regularization, cg_steps):
+    """
+    Update rows X in place with batched conjugate gradient on
+        (Y'Y + Y' (C_u - I) Y + reg I) x_u = Y' C_u p_u
+    for every row at once. Only the observed entries contribute beyond Y'Y, so
+    each matrix-vector product costs O(nnz * factors + rows * factors^2).
+    """
+    local = indptr - indptr[0]
+    rows = np.repeat(np.arange(len(X)), np.diff(local))
+    Yu = Y[indices]
+
+    def matvec(P):
+        dots = np.einsum('ij,ij->i', P[rows], Yu)
+        return P @ gram + regularization * P + _segment_sum(((confidence - 1) * dots)[:, None] * Yu, local, len(P))
+
+    b = _segment_sum(confidence[:, None] * Yu, local, len(X))
+    r = b - matvec(X)
+    p = r.copy()
+    rs = np.einsum('ij,ij->i', r, r)
+    for _ in range(cg_steps):
+        Ap = matvec(p)
+        step = rs / np.maximum(np.einsum('ij,ij->i', p, Ap), 1e-12)
+        X += step[:, None] * p
+        r -= step[:, None] * Ap
+        rs_new = np.einsum('ij,ij->i', r, r)
+        p = r + (rs_new / np.maximum(rs, 1e-12))[:, None] * p
+        rs = rs_new
+
+
+def _als_step(X, Y, csr, regularization, cg_steps, block_nnz):
+    indptr, indices, confidence = csr
+    gram = Y.T @ Y
+    for start, end in _blocks(indptr, block_nnz):
+        lo, hi = indptr[start], indptr[end]
+        _solve_block(
+            X[start:end], Y, gram, indptr[start:end + 1], indices[lo:hi], confidence[lo:hi],
+            regularization, cg_steps,
+        )
+
+
+def train_als(interactions, factors=DEFAULT_FACTORS, regularization=DEFAULT_REGULARIZATION,
+              iterations=DEFAULT_ITERATIONS, cg_steps=CG_STEPS, block_nnz=BLOCK_NNZ, seed=42,
+              callback=None):
+    """
+    Fit user and item factors. Returns (user_factors, item_factors) as float32
+    arrays aligned with interactions.user_ids and interactions.item_ids.
+    `callback(iteration)` runs after each full iteration.
+    """
+    rng = np.random.default_rng(seed)
+    X = (rng.standard_normal((len(interactions.user_ids), factors)) * 0.01).astype(np.float32)
+    Y = (rng.standard_normal((len(interactions.item_ids), factors)) * 0.01).astype(np.float32)
+    for iteration in range(iterations):
+        _als_step(X, Y, interactions.by_user, regularization, cg_steps, block_nnz)
+        _als_step(Y, X, interactions.by_item, regularization, cg_steps, block_nnz)
+        if callback:
+            callback(iteration)
+    return X, Y
+
+
+class EmbeddingModel:
+    """
+    Trained user and item embeddings plus an IVF index over the items.
+
+    - score(u, i) = user_factors[u] . item_factors[i].
+    - Users who joined after the last training run are folded in from their
+      history with one exact least-squares solve, so they are served immediately.
+    - Saved as a single .npz file; see train_embeddings.
+    """
+
+    def __init__(self, user_ids, item_ids, user_factors, item_factors, index, regularization, alpha):
+        self.user_ids = np.asarray(user_ids)
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.user_factors = np.ascontiguousarray(user_factors, dtype=np.float32)
+        self.item_factors = np.ascontiguousarray(item_factors, dtype=np.float32)
+        self.index = index
+        self.regularization = float(regularization)
+        self.alpha = float(alpha)
+        self.gram = self.item_factors.T @ self.item_factors
+
+    @classmethod
+    def train(cls, interactions, n_lists=None, nprobe=8, **params):
+        user_factors, item_factors = train_als(interactions, **params)
+        index = IVFIndex.build(item_factors, interactions.item_ids, n_lists=n_lists, nprobe=nprobe)
+        return cls(
+            interactions.user_ids, interactions.item_ids, user_factors, item_factors, index,
+            regularization=params.get('regularization', DEFAULT_REGULARIZATION),
+            alpha=interactions.alpha,
+        )
+
+    def save(self, path):
+        tmp = f"{path}.tmp.npz"
+        np.savez(
+            tmp,
+            user_ids=self.user_ids,
+            item_ids=self.item_ids,
+            user_factors=self.user_factors,
+            item_factors=self.item_factors,
+            params=np.array([self.regularization, self.alpha]),
+            **self.index.to_arrays(),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, nprobe=8):
+        with np.load(path) as arrays:
+            arrays = dict(arrays)
+        regularization, alpha = arrays['params']
+        return cls(
+            arrays['user_ids'], arrays['item_ids'], arrays['user_factors'], arrays['item_factors'],
+            IVFIndex.from_arrays(arrays, nprobe=nprobe), regularization, alpha,
+        )
+
+    def _lookup(self, ids, value):
+        position = int(np.searchsorted(ids, value))
+        if position < len(ids) and ids[position] == value:
+            return position
+        return None
+
+    def user_vector(self, user_id, history=None):
+        position = self._lookup(self.user_ids, str(user_id))
+        if position is not None:
+            return self.user_factors[position]
+        if history:
+            return self.fold_in(history)
+        return None
+
+    def item_vector(self, tmdb_id):
+        position = self._lookup(self.item_ids, int(tmdb_id))
+        return None if position is None else self.item_factors[position]
+
+    def fold_in(self, history):
+        """Solve for a user vector from {tmdb_id: value} with the items held fixed."""
+        rows, confidence = [], []
+        for tmdb_id, value in history.items():
+            position = self._lookup(self.item_ids, int(tmdb_id))
+            if position is not None:
+                rows.append(position)
+                confidence.append(1.0 + self.alpha * value)
+        if not rows:
+            return None
+        Yu = self.item_factors[rows]
+        confidence = np.asarray(confidence, dtype=np.float32)
+        A = self.gram + (Yu.T * (confidence - 1)) @ Yu + self.regularization * np.eye(len(self.gram))
+        return np.linalg.solve(A, Yu.T @ confidence).astype(np.float32)
+
+    def _search(self, vector, k, exclude, nprobe):
+        ids, scores = self.index.search(vector, k + len(exclude), nprobe=nprobe)
+        results = [(int(tmdb_id), float(score)) for tmdb_id, score in zip(ids, scores) if tmdb_id not in exclude]
+        return results[:k]
+
+    def recommend(self, user_id, history, k=20, nprobe=None):
+        """Top-k unseen movies for a user as [(tmdb_id, score)]."""
+        vector = self.user_vector(user_id, history)
+        if vector is None:
+            return []
+        return self._search(vector, k, set(history), nprobe)
+
+    def similar(self, tmdb_id, k=20, nprobe=None):
+        """Movies whose embeddings score highest against this one."""
+        vector = self.item_vector(tmdb_id)
+        if vector is None:
+            return []
+        return self._search(vector, k, {int(tmdb_id)}, nprobe)
+
+    def recommend_exact(self, vector, k=20, exclude=()):
+        """Exhaustive scoring over every item; the benchmark's ground truth."""
+        scores = self.item_factors @ vector
+        for tmdb_id in exclude:
+            position = self._lookup(self.item_ids, int(tmdb_id))
+            if position is not None:
+                scores[position] = -np.inf
+        best = top_k(scores, k)
+        return [(int(self.item_ids[i]), float(scores[i])) for i in best]
+
+
+_model = None
+_model_mtime = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """
+    The trained model at EMBEDDINGS_PATH, or None before the first training
+    run. Reloaded when the file changes, so retraining needs no restart.
+    """
+    global _model, _model_mtime
+    path = getattr(settings, 'EMBEDDINGS_PATH', None)
+    try:
+        mtime = os.stat(path).st_mtime if path else None
+    except OSError:
+        mtime = None
+    if mtime is None:
+        return None
+    if mtime != _model_mtime:
+        with _model_lock:
+            if mtime != _model_mtime:
+                try:
+                    _model = EmbeddingModel.load(path, nprobe=getattr(settings, 'EMBEDDINGS_NPROBE', 8))
+                except (OSError, KeyError, ValueError) as e:
+                    logger.error(f"Could not load embeddings from {path}: {str(e)}")
+                    return _model
+                _model_mtime = mtime
+    return _model
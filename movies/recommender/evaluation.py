@@ -0,0 +1,208 @@
+import math
+import resource
+import statistics
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from movies.models import Rating, Recommendation, Watchlist
+from movies.recommender import embeddings, itemitem
+
+
+class Split:
+    """
+    A time-based train/test split.
+
+    - `train` is {user_id: {tmdb_id: value}} from every rating and watchlist
+      entry before the cutoff, valued as in itemitem.signal_value.
+    - `test` is {user_id: set of tmdb_ids} rated at or above the relevance
+      threshold after the cutoff, for users who also have training history.
+      Items already in a user's training history are not counted.
+    - `popular` is the cached TMDb trending list from Recommendation, read up
+      front so variants can be fitted in worker processes without the database.
+    """
+
+    def __init__(self, cutoff, train, test, popular=()):
+        self.cutoff = cutoff
+        self.train = train
+        self.test = test
+        self.popular = list(popular)
+
+    @property
+    def catalog(self):
+        return {tmdb_id for history in self.train.values() for tmdb_id in history}
+
+
+def time_split(test_fraction=0.2, relevant_rating=7.0, max_users=None, seed=42):
+    """Split Rating at the timestamp below which 1 - test_fraction of ratings fall."""
+    ratings = list(
+        Rating.objects.order_by().values_list('user_id', 'tmdb_id', 'rating', 'timestamp').iterator(chunk_size=10000)
+    )
+    if not ratings:
+        return None
+    timestamps = sorted(row[3] for row in ratings)
+    cutoff = timestamps[min(int(len(timestamps) * (1 - test_fraction)), len(timestamps) - 1)]
+
+    train = defaultdict(lambda: defaultdict(float))
+    test = defaultdict(set)
+    for user_id, tmdb_id, rating, timestamp in ratings:
+        user_id = str(user_id)
+        if timestamp < cutoff:
+            train[user_id][tmdb_id] += itemitem.signal_value(rating=rating)
+        elif rating >= relevant_rating:
+            test[user_id].add(tmdb_id)
+    watchlist = Watchlist.objects.filter(added_at__lt=cutoff).order_by().values_list('user_id', 'tmdb_id')
+    for user_id, tmdb_id in watchlist.iterator(chunk_size=10000):
+        train[str(user_id)][tmdb_id] += itemitem.WATCHLIST_WEIGHT
+
+    test = {
+        user_id: items - train[user_id].keys()
+        for user_id, items in test.items()
+        if user_id in train and items - train[user_id].keys()
+    }
+    if max_users and len(test) > max_users:
+        rng = np.random.default_rng(seed)
+        users = rng.choice(sorted(test), max_users, replace=False)
+        test = {str(user_id): test[user_id] for user_id in users}
+    popular = Recommendation.objects.order_by('-popularity').values_list('tmdb_id', flat=True)
+    return Split(cutoff, {user_id: dict(history) for user_id, history in train.items()}, test, popular)
+
+
+class PopularityVariant:
+    """
+    Non-personalized baseline: the cached TMDb trending list in Recommendation,
+    falling back to the most-interacted movies in the training data.
+    """
+
+    name = 'popularity'
+
+    def fit(self, split):
+        ranked = split.popular
+        self.source = 'recommendation'
+        if not ranked:
+            counts = Counter(tmdb_id for history in split.train.values() for tmdb_id in history)
+            ranked = [tmdb_id for tmdb_id, _ in counts.most_common()]
+            self.source = 'train_counts'
+        self.ranked = ranked
+
+    def recommend(self, user_id, history, k):
+        return [tmdb_id for tmdb_id in self.ranked if tmdb_id not in history][:k]
+
+
+class ItemItemVariant:
+    """Co-occurrence cosine model, built from the training split in memory."""
+
+    name = 'itemitem'
+
+    def __init__(self, neighbors=50):
+        self.neighbors = neighbors
+
+    def fit(self, split):
+        self.store = itemitem.MemoryCooccurrenceStore(None)
+        self.store.replace(*itemitem.build_statistics(split.train.values()))
+
+    def recommend(self, user_id, history, k):
+        ranked = itemitem.recommend_for_history(history, k, neighbors=self.neighbors, store=self.store)
+        return [tmdb_id for tmdb_id, _ in ranked]
+
+
+class EmbeddingVariant:
+    """ALS embeddings served through the IVF index."""
+
+    name = 'embeddings'
+
+    def __init__(self, nprobe=8, alpha=embeddings.DEFAULT_ALPHA, **params):
+        self.nprobe = nprobe
+        self.alpha = alpha
+        self.params = params
+
+    def fit(self, split):
+        user_ids, tmdb_ids, values = [], [], []
+        for user_id, history in split.train.items():
+            for tmdb_id, value in history.items():
+                user_ids.append(user_id)
+                tmdb_ids.append(tmdb_id)
+                values.append(value)
+        interactions = embeddings.Interactions.from_arrays(
+            user_ids, tmdb_ids, values, alpha=self.alpha
+        )
+        self.model = embeddings.EmbeddingModel.train(interactions, nprobe=self.nprobe, **self.params)
+
+    def recommend(self, user_id, history, k):
+        return [tmdb_id for tmdb_id, _ in self.model.recommend(user_id, history, k, nprobe=self.nprobe)]
+
+
+VARIANTS = {
+    'popularity': PopularityVariant,
+    'itemitem': ItemItemVariant,
+    'embeddings': EmbeddingVariant,
+}
+
+
+def ranking_metrics(recommended, relevant, k):
+    """
+    Precision@k, recall@k and NDCG@k with binary relevance. A list shorter
+    than k counts its missing slots as misses; with nothing relevant, all are 0.
+    """
+    hits = [rank for rank, tmdb_id in enumerate(recommended[:k]) if tmdb_id in relevant]
+    dcg = sum(1.0 / math.log2(rank + 2) for rank in hits)
+    ideal = sum(1.0 / math.log2(rank + 2) for rank in range(min(len(relevant), k)))
+    recall = len(hits) / len(relevant) if relevant else 0.0
+    return len(hits) / k, recall, dcg / ideal if ideal else 0.0
+
+
+def _percentile(ordered, fraction):
+    return ordered[max(int(len(ordered) * fraction) - 1, 0)]
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def evaluate(variant, split, k=20):
+    """
+    Fit one variant on the training split and score it on the test split.
+
+    Memory is the growth in the process's peak RSS while fitting and serving,
+    so run each variant in a fresh process for the numbers to be comparable.
+    """
+    baseline_rss = _peak_rss_mb()
+    started = time.perf_counter()
+    variant.fit(split)
+    fit_seconds = time.perf_counter() - started
+
+    precision, recall, ndcg, latencies = [], [], [], []
+    recommended_items = set()
+    for user_id, relevant in split.test.items():
+        history = split.train[user_id]
+        started = time.perf_counter()
+        recommended = variant.recommend(user_id, history, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        recommended_items.update(recommended)
+        p, r, n = ranking_metrics(recommended, relevant, k)
+        precision.append(p)
+        recall.append(r)
+        ndcg.append(n)
+
+    latencies.sort()
+    result = {
+        'variant': variant.name,
+        'users': len(latencies),
+        f"precision_at_{k}": round(statistics.fmean(precision), 5) if precision else 0.0,
+        f"recall_at_{k}": round(statistics.fmean(recall), 5) if recall else 0.0,
+        f"ndcg_at_{k}": round(statistics.fmean(ndcg), 5) if ndcg else 0.0,
+        'coverage': round(len(recommended_items) / max(len(split.catalog), 1), 5),
+        'fit_seconds': round(fit_seconds, 3),
+        'peak_rss_growth_mb': round(_peak_rss_mb() - baseline_rss, 1),
+    }
+    if latencies:
+        result.update({
+            'latency_mean_ms': round(statistics.fmean(latencies), 4),
+            'latency_p50_ms': round(_percentile(latencies, 0.5), 4),
+            'latency_p99_ms': round(_percentile(latencies, 0.99), 4),
+        })
+    if hasattr(variant, 'source'):
+        result['source'] = variant.source
+    return result
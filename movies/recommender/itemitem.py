@@ -0,0 +1,270 @@
+import heapq
+import logging
+import math
+import pickle
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+
+from movies.models import Rating, Watchlist
+from movies.snapshots import PeriodicSnapshot, write_atomic
+
+
+logger = logging.getLogger(__name__)
+
+# A user's value for a movie: rating / MAX_RATING, plus WATCHLIST_WEIGHT if it is
+# on their watchlist. Item-item similarity is the cosine of these user vectors:
+#   sim(i, j) = co[i][j] / sqrt(norm[i] * norm[j])
+# with co[i][j] = sum_u v_ui * v_uj and norm[i] = sum_u v_ui ** 2.
+MAX_RATING = 10.0
+WATCHLIST_WEIGHT = 0.5
+
+
+def signal_value(rating=None, in_watchlist=False):
+    value = rating / MAX_RATING if rating is not None else 0.0
+    return value + (WATCHLIST_WEIGHT if in_watchlist else 0.0)
+
+
+def user_item_values(user_id):
+    """Current {tmdb_id: value} for one user, from two indexed reads."""
+    values = defaultdict(float)
+    for tmdb_id, rating in Rating.objects.filter(user_id=user_id).values_list('tmdb_id', 'rating'):
+        values[tmdb_id] += signal_value(rating=rating)
+    for tmdb_id in Watchlist.objects.filter(user_id=user_id).values_list('tmdb_id', flat=True):
+        values[tmdb_id] += WATCHLIST_WEIGHT
+    return dict(values)
+
+
+class MemoryCooccurrenceStore:
+    """
+    In-process co-occurrence and norm statistics, for a single process only.
+
+    - `co` is a dict of dicts (symmetric), `norms` a dict; both keyed by tmdb_id.
+    - Pickled to `path` by a background thread every `persist_interval` seconds
+      (see movies/snapshots.py), so an update only pays for its own increments.
+    - Per process, and processes sharing `path` overwrite each other's saves;
+      use Redis when running several workers.
+    """
+
+    def __init__(self, path, persist_interval=60):
+        self.path = Path(path) if path else None
+        self.co = defaultdict(dict)
+        self.norms = {}
+        self._lock = threading.Lock()
+        self.snapshot = PeriodicSnapshot(self.save, persist_interval, name='cooccurrence-snapshot') if self.path else None
+        if self.path and self.path.exists():
+            try:
+                with open(self.path, 'rb') as fh:
+                    co, self.norms = pickle.load(fh)
+                self.co = defaultdict(dict, co)
+            except (OSError, pickle.UnpicklingError, ValueError) as e:
+                logger.warning(f"Could not load co-occurrence state from {self.path}: {str(e)}")
+
+    def apply(self, item, norm_delta, pairs):
+        with self._lock:
+            self.norms[item] = self.norms.get(item, 0.0) + norm_delta
+            row = self.co[item]
+            for other, delta in pairs:
+                row[other] = row.get(other, 0.0) + delta
+                other_row = self.co[other]
+                other_row[item] = other_row.get(item, 0.0) + delta
+        if self.snapshot:
+            self.snapshot.mark()
+
+    def neighbors(self, item):
+        with self._lock:
+            return dict(self.co.get(item, {}))
+
+    def get_norms(self, items):
+        with self._lock:
+            return {item: self.norms.get(item, 0.0) for item in items}
+
+    def replace(self, co, norms):
+        with self._lock:
+            self.co = defaultdict(dict, co)
+            self.norms = dict(norms)
+        # Rebuilds run outside requests, so the new state is saved right away.
+        if self.snapshot:
+            self.snapshot.mark()
+            self.snapshot.flush()
+
+    def save(self):
+        """Pickle the statistics to `path`; only the copy is taken under the lock."""
+        with self._lock:
+            co = {item: dict(row) for item, row in self.co.items()}
+            norms = dict(self.norms)
+        write_atomic(self.path, pickle.dumps((co, norms), protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class RedisCooccurrenceStore:
+    """
+    Co-occurrence statistics in Redis: one hash per item plus one hash of norms.
+
+    - An update is one pipelined round trip of 2 * len(history) + 1 HINCRBYFLOATs.
+    - A rebuild writes a new key generation and then switches `cooc:gen` to it.
+      Events applied to the old generation while a rebuild runs are dropped;
+      the next rebuild picks them up from the database.
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    def _generation(self):
+        return int(self.client.get('cooc:gen') or 0)
+
+    def apply(self, item, norm_delta, pairs):
+        gen = self._generation()
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hincrbyfloat(f"cooc:{gen}:norms", item, norm_delta)
+        for other, delta in pairs:
+            pipe.hincrbyfloat(f"cooc:{gen}:{item}", other, delta)
+            pipe.hincrbyfloat(f"cooc:{gen}:{other}", item, delta)
+        pipe.execute()
+
+    def neighbors(self, item):
+        row = self.client.hgetall(f"cooc:{self._generation()}:{item}")
+        return {int(other): float(value) for other, value in row.items()}
+
+    def get_norms(self, items):
+        items = list(items)
+        if not items:
+            return {}
+        values = self.client.hmget(f"cooc:{self._generation()}:norms", items)
+        return {item: float(value or 0.0) for item, value in zip(items, values)}
+
+    def replace(self, co, norms):
+        old = self._generation()
+        new = old + 1
+        pipe = self.client.pipeline(transaction=False)
+        for item, row in co.items():
+            if row:
+                pipe.hset(f"cooc:{new}:{item}", mapping=row)
+        if norms:
+            pipe.hset(f"cooc:{new}:norms", mapping=norms)
+        pipe.set('cooc:gen', new)
+        pipe.execute()
+        for key in self.client.scan_iter(match=f"cooc:{old}:*", count=1000):
+            self.client.unlink(key)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                url = getattr(settings, 'RECOMMENDER_REDIS_URL', None)
+                if url:
+                    _store = RedisCooccurrenceStore(url)
+                else:
+                    _store = MemoryCooccurrenceStore(getattr(settings, 'RECOMMENDER_STATE_PATH', None))
+    return _store
+
+
+def apply_change(item, old_value, new_value, history, store=None):
+    """
+    Adjust the statistics for one user's value of `item` changing from
+    `old_value` to `new_value`. `history` is the user's {tmdb_id: value} for
+    every other item; the cost is O(len(history)).
+    """
+    delta = new_value - old_value
+    if not delta:
+        return
+    pairs = [(other, delta * value) for other, value in history.items() if other != item and value]
+    (store or get_store()).apply(item, new_value ** 2 - old_value ** 2, pairs)
+
+
+def record_interaction(user_id, tmdb_id, delta):
+    """
+    Online update hook for rating and watchlist writes.
+
+    Call after the write is saved, with the change in the user's value for the
+    movie (see signal_value). Failures are logged, not raised.
+    """
+    try:
+        history = user_item_values(user_id)
+        new_value = history.pop(tmdb_id, 0.0)
+        apply_change(tmdb_id, new_value - delta, new_value, history)
+    except Exception as e:
+        logger.error(f"Co-occurrence update failed for movie {tmdb_id}: {str(e)}")
+
+
+def similar_items(tmdb_id, k=20, store=None):
+    """Return [(tmdb_id, cosine similarity)] for the k nearest items."""
+    store = store or get_store()
+    row = store.neighbors(tmdb_id)
+    if not row:
+        return []
+    norms = store.get_norms([tmdb_id, *row])
+    own = norms[tmdb_id]
+    if own <= 0:
+        return []
+    scored = (
+        (other, value / math.sqrt(own * norms[other]))
+        for other, value in row.items()
+        if value > 0 and norms[other] > 0
+    )
+    return heapq.nlargest(k, scored, key=lambda pair: pair[1])
+
+
+def recommend_for_history(history, k=20, neighbors=50, store=None):
+    """
+    Score unseen items for a user's {tmdb_id: value} history:
+    score(j) = sum_i value_i * sim(i, j) over each item's nearest neighbors.
+    """
+    scores = defaultdict(float)
+    for item, value in history.items():
+        for other, sim in similar_items(item, neighbors, store=store):
+            if other not in history:
+                scores[other] += value * sim
+    return heapq.nlargest(k, scores.items(), key=lambda pair: pair[1])
+
+
+def build_statistics(user_histories):
+    """
+    Compute exact co-occurrence and norm statistics from scratch.
+
+    `user_histories` yields one {tmdb_id: value} dict per user. Every pair is
+    kept in both rows: online updates adjust the counts in place, so a row
+    truncated here would restart pruned pairs from 0. Neighbors are cut to
+    the strongest k when read (see similar_items).
+    """
+    co = defaultdict(lambda: defaultdict(float))
+    norms = defaultdict(float)
+    for history in user_histories:
+        items = list(history.items())
+        for index, (item, value) in enumerate(items):
+            norms[item] += value * value
+            for other, other_value in items[index + 1:]:
+                product = value * other_value
+                co[item][other] += product
+                co[other][item] += product
+    return {item: dict(row) for item, row in co.items()}, dict(norms)
+
+
+def iter_user_histories():
+    """Yield every user's {tmdb_id: value}, built from Rating and Watchlist."""
+    ratings = Rating.objects.order_by().values_list('user_id', 'tmdb_id', 'rating')
+    watchlist = Watchlist.objects.order_by().values_list('user_id', 'tmdb_id')
+
+    histories = defaultdict(lambda: defaultdict(float))
+    for user_id, tmdb_id, rating in ratings.iterator(chunk_size=10000):
+        histories[user_id][tmdb_id] += signal_value(rating=rating)
+    for user_id, tmdb_id in watchlist.iterator(chunk_size=10000):
+        histories[user_id][tmdb_id] += WATCHLIST_WEIGHT
+    for history in histories.values():
+        yield dict(history)
+
+
+def rebuild(store=None):
+    """Recompute the statistics from the database and swap them in."""
+    co, norms = build_statistics(iter_user_histories())
+    (store or get_store()).replace(co, norms)
+    return len(norms)
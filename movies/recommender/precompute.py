@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from movies.models import Rating, UserRecommendation, Watchlist
+from movies.recommender import embeddings, itemitem
+
+
+logger = logging.getLogger(__name__)
+
+# Lists are stored as packed little-endian int32 tmdb_ids, best first.
+PACKED_DTYPE = np.dtype('<i4')
+
+
+def pack_ids(tmdb_ids):
+    return np.asarray(tmdb_ids, dtype=PACKED_DTYPE).tobytes()
+
+
+def unpack_ids(blob):
+    return np.frombuffer(bytes(blob), dtype=PACKED_DTYPE).tolist()
+
+
+class DatabaseRecommendationStore:
+    """
+    Precomputed lists in the UserRecommendation table, one row per user.
+
+    - get: a primary-key read.
+    - put_many: one bulk upsert per call.
+    """
+
+    def get(self, user_id):
+        blob = UserRecommendation.objects.filter(user_id=user_id).values_list('tmdb_ids', flat=True).first()
+        return None if blob is None else unpack_ids(blob)
+
+    def put_many(self, lists):
+        UserRecommendation.objects.bulk_create(
+            [UserRecommendation(user_id=user_id, tmdb_ids=pack_ids(ids)) for user_id, ids in lists.items()],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['tmdb_ids', 'computed_at'],
+        )
+
+
+class RedisRecommendationStore:
+    """
+    Precomputed lists as one Redis string per user, `recs:{user_id}`.
+
+    - Values expire after `ttl` seconds, so users who stop being active fall
+      back to the live path instead of seeing stale lists forever.
+    """
+
+    def __init__(self, url, ttl):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, user_id):
+        blob = self.client.get(f"recs:{user_id}")
+        return None if blob is None else unpack_ids(blob)
+
+    def put_many(self, lists):
+        pipe = self.client.pipeline(transaction=False)
+        for user_id, ids in lists.items():
+            pipe.set(f"recs:{user_id}", pack_ids(ids), ex=self.ttl)
+        pipe.execute()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                url = getattr(settings, 'PRECOMPUTED_RECS_REDIS_URL', None)
+                if url:
+                    _store = RedisRecommendationStore(url, getattr(settings, 'PRECOMPUTED_RECS_TTL', 2 * 24 * 3600))
+                else:
+                    _store = DatabaseRecommendationStore()
+    return _store
+
+
+def get_recommendations(user_id):
+    """The user's precomputed tmdb_ids, best first, or None if there are none."""
+    try:
+        return get_store().get(user_id)
+    except Exception as e:
+        logger.error(f"Failed to read precomputed recommendations for user {user_id}: {str(e)}")
+        return None
+
+
+def active_user_ids(days=30):
+    """Users with any rating or watchlist activity in the last `days` days."""
+    since = timezone.now() - timedelta(days=days)
+    raters = Rating.objects.filter(timestamp__gte=since).order_by().values_list('user_id', flat=True).distinct()
+    watchers = Watchlist.objects.filter(added_at__gte=since).order_by().values_list('user_id', flat=True).distinct()
+    return sorted({str(user_id) for user_id in raters.iterator()} | {str(user_id) for user_id in watchers.iterator()})
+
+
+def load_histories(user_ids):
+    """{user_id: {tmdb_id: value}} for a batch of users, in two queries."""
+    histories = defaultdict(lambda: defaultdict(float))
+    ratings = Rating.objects.filter(user_id__in=user_ids).order_by().values_list('user_id', 'tmdb_id', 'rating')
+    for user_id, tmdb_id, rating in ratings.iterator(chunk_size=10000):
+        histories[str(user_id)][tmdb_id] += itemitem.signal_value(rating=rating)
+    watchlist = Watchlist.objects.filter(user_id__in=user_ids).order_by().values_list('user_id', 'tmdb_id')
+    for user_id, tmdb_id in watchlist.iterator(chunk_size=10000):
+        histories[str(user_id)][tmdb_id] += itemitem.WATCHLIST_WEIGHT
+    return {user_id: dict(histories[user_id]) for user_id in map(str, user_ids)}
+
+
+def score_users(user_ids, n=50, model='embeddings'):
+    """Top-n tmdb_ids for each user, from the embeddings or the item-item model."""
+    histories = load_histories(user_ids)
+    lists = {}
+    if model == 'embeddings':
+        trained = embeddings.get_model()
+        if trained is None:
+            raise RuntimeError("No trained embeddings; run train_embeddings first.")
+        for user_id, history in histories.items():
+            lists[user_id] = [tmdb_id for tmdb_id, _ in trained.recommend(user_id, history, n)]
+    else:
+        for user_id, history in histories.items():
+            lists[user_id] = [tmdb_id for tmdb_id, _ in itemitem.recommend_for_history(history, n)]
+    return {user_id: ids for user_id, ids in lists.items() if ids}
+
+
+def run_shard(user_ids, n=50, model='embeddings', write=True):
+    """
+    Score and store one shard of users. Returns (users scored, lists stored,
+    seconds). This is the unit of work for both the process pool and Celery.
+    """
+    started = time.perf_counter()
+    lists = score_users(user_ids, n=n, model=model)
+    if write and lists:
+        get_store().put_many(lists)
+    return len(user_ids), len(lists), time.perf_counter() - started
@@ -0,0 +1,105 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+
+_use_primary = ContextVar('use_primary', default=False)
+
+
+def pin_to_primary():
+    """Send every read for the rest of the current request to the primary."""
+    _use_primary.set(True)
+
+
+def mark_recent_write(user_id):
+    """
+    Keep this user's reads on the primary until replicas have caught up.
+    The pin is kept in the default cache, which must be shared by all
+    processes (CACHE_REDIS_URL) for it to hold across workers.
+    """
+    cache.set(f"dbpin_{user_id}", True, getattr(settings, 'REPLICA_STICKY_SECONDS', 10))
+
+
+def has_recent_write(user_id):
+    return bool(cache.get(f"dbpin_{user_id}"))
+
+
+def replicas_configured():
+    return any(alias.startswith('replica') for alias in settings.DATABASES)
+
+
+class ReadReplicaRouter:
+    """
+    Database router that spreads reads over replicas and keeps writes on the primary.
+
+    - Replicas are the DATABASES aliases starting with 'replica' (see DB_REPLICA_URLS).
+      With none configured, everything goes to 'default'.
+    - Reads go to the primary when the request is pinned (unsafe method, or the
+      user wrote recently) or when the primary is inside a transaction.
+    - Replicas can be PostgreSQL standbys or, for local testing, any database
+      holding the same data, e.g. SQLite files.
+    """
+
+    def __init__(self):
+        self.replicas = [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or _use_primary.get():
+            return 'default'
+        if connections['default'].in_atomic_block:
+            return 'default'
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class PrimaryForWritesMiddleware:
+    """
+    Middleware that pins non-GET/HEAD/OPTIONS requests to the primary,
+    so validation reads inside a write never see stale replica data.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _use_primary.set(request.method not in SAFE_METHODS)
+        try:
+            return self.get_response(request)
+        finally:
+            _use_primary.reset(token)
+
+
+class ReplicaRoutingMixin:
+    """
+    View mixin giving users read-your-writes consistency on replicated reads.
+
+    - A successful write marks the user as sticky for REPLICA_STICKY_SECONDS.
+    - While sticky, that user's reads are pinned to the primary.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not replicas_configured() or request.method not in SAFE_METHODS:
+            return
+        if request.user.is_authenticated and has_recent_write(request.user.id):
+            pin_to_primary()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if (replicas_configured() and request.method not in SAFE_METHODS
+                and response.status_code < 400 and request.user.is_authenticated):
+            mark_recent_write(request.user.id)
+        return response
@@ -0,0 +1,98 @@
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.generators import OpenAPISchemaGenerator
+from rest_framework.exceptions import NotFound
+
+
+logger = logging.getLogger(__name__)
+
+API_INFO = openapi.Info(
+    title="Movie Recommendation API",
+    default_version='v1',
+    description="API for movie recommendations with TMDb integration",
+)
+
+# Media type and drf_yasg codec for each format the schema is written in.
+FORMATS = {
+    'json': ('application/json', OpenAPICodecJson),
+    'yaml': ('application/yaml', OpenAPICodecYaml),
+}
+
+
+class SchemaDocument:
+    """An encoded schema and its ETag, a hash of the content."""
+
+    def __init__(self, content, media_type):
+        self.content = content
+        self.media_type = media_type
+        self.etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+class DocsSchemaGenerator(OpenAPISchemaGenerator):
+    """
+    Generator for the Swagger/ReDoc UI views.
+
+    - The UI pages only need the title, which drf_yasg builds without
+      enumerating any endpoints.
+    - The UIs load the spec from the pre-generated document (SPEC_URL), so
+      outside DEBUG a full introspection through these views is refused.
+    """
+
+    def __init__(self, info, version='', url=None, patterns=None, urlconf=None):
+        super().__init__(info, version, url, patterns, urlconf)
+        self.introspects = patterns != []
+
+    def get_schema(self, request=None, public=False):
+        if self.introspects and not settings.DEBUG:
+            raise NotFound("The schema is served pre-generated from /swagger.json and /swagger.yaml.")
+        return super().get_schema(request, public)
+
+
+def generate_schema(url=None):
+    """Build the schema by introspecting every view and serializer. This is the expensive part."""
+    return OpenAPISchemaGenerator(API_INFO, url=url).get_schema(request=None, public=True)
+
+
+def encode(swagger, fmt):
+    media_type, codec_class = FORMATS[fmt]
+    return SchemaDocument(codec_class(validators=[]).encode(swagger), media_type)
+
+
+def schema_path(fmt):
+    """Where the generated schema is written in `fmt`: OPENAPI_SCHEMA_PATH with its suffix."""
+    return Path(settings.OPENAPI_SCHEMA_PATH).with_suffix(f".{fmt}")
+
+
+_documents = {}
+_documents_lock = threading.Lock()
+
+
+def get_document(fmt):
+    """
+    The schema in `fmt`. In DEBUG it is generated on every call so it tracks
+    code changes; otherwise it is read from disk once and kept in memory,
+    reloading when the file changes. None if it has not been generated.
+    """
+    if settings.DEBUG:
+        return encode(generate_schema(), fmt)
+
+    path = schema_path(fmt)
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    cached = _documents.get(fmt)
+    if cached is None or cached[0] != mtime:
+        with _documents_lock:
+            cached = _documents.get(fmt)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, SchemaDocument(path.read_bytes(), FORMATS[fmt][0]))
+                _documents[fmt] = cached
+                logger.info(f"Loaded OpenAPI schema from {path}")
+    return cached[1]
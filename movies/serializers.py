@@ -1,7 +1,10 @@
+from drf_yasg.utils import swagger_serializer_method
 from rest_framework import serializers
 from movies.models import User, Movie, Rating, Watchlist, Recommendation
+from movies.instrumentation import InstrumentedSerializerMixin
+from movies import posters
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the User model.
     """
@@ -55,11 +58,14 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 
-class MovieSerializer(serializers.ModelSerializer):
+class MovieSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Movie model.
     """
 
+    # Proxied, cached poster URL per width (see movies/posters.py)
+    poster_urls = serializers.SerializerMethodField()
+
     class Meta:
         """Meta options for the MovieSerializer."""
 
@@ -71,6 +77,7 @@ class MovieSerializer(serializers.ModelSerializer):
             'release_year',
             'overview',
             'poster_path',
+            'poster_urls',
             'genres',
             'average_rating',
             'popularity',
@@ -78,8 +85,15 @@ class MovieSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['cached_at']
 
+    @swagger_serializer_method(serializer_or_field=serializers.DictField(child=serializers.URLField(), allow_null=True))
+    def get_poster_urls(self, obj):
+        # Resolved once per response: the items of a list share the root's context.
+        if 'poster_base_url' not in self.context:
+            self.context['poster_base_url'] = posters.base_url(self.context.get('request'))
+        return posters.poster_urls(obj.poster_path, self.context['poster_base_url'])
+
 
-class RatingSerializer(serializers.ModelSerializer):
+class RatingSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Rating model.
     """
@@ -99,7 +113,7 @@ class RatingSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'timestamp']
 
 
-class WatchlistSerializer(serializers.ModelSerializer):
+class WatchlistSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Watchlist model.
     """
@@ -118,7 +132,7 @@ class WatchlistSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'added_at']
 
 
-class RecommendationSerializer(serializers.ModelSerializer):
+class RecommendationSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Recommendation model.
     """
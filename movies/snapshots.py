@@ -0,0 +1,82 @@
+"""
+Periodic snapshots of in-process state to a local file.
+
+The in-memory fallbacks of the trending and co-occurrence stores use this to
+survive restarts without paying for serialization on the request path. They
+are meant for a single process: every process keeps its own state, and the
+last one to save wins the file. Use the Redis stores with several workers.
+"""
+import atexit
+import logging
+import os
+import tempfile
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+def write_atomic(path, data):
+    """
+    Write `data` (bytes) to `path` through a temporary file of this process's
+    own in the same directory, then rename it into place.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp', delete=False) as fh:
+        try:
+            fh.write(data)
+        except BaseException:
+            os.unlink(fh.name)
+            raise
+    try:
+        os.replace(fh.name, path)
+    except BaseException:
+        os.unlink(fh.name)
+        raise
+
+
+class PeriodicSnapshot:
+    """
+    Calls `save` from a background thread while there are unsaved changes.
+
+    - mark() flags a change; it is all a write on the request path pays.
+    - The thread starts on the first mark() and saves every `interval` seconds.
+    - Unsaved changes are saved once more at interpreter exit.
+    - A failed save is logged and retried on the next tick.
+    """
+
+    def __init__(self, save, interval, name='snapshot'):
+        self.save = save
+        self.interval = interval
+        self.name = name
+        self._dirty = False
+        self._thread = None
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def mark(self):
+        self._dirty = True
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        """Save now if anything changed since the last save."""
+        with self._lock:
+            if not self._dirty:
+                return
+            # Cleared before saving, so changes made during the save are kept for the next one.
+            self._dirty = False
+            try:
+                self.save()
+            except Exception as e:
+                self._dirty = True
+                logger.error(f"Saving {self.name} failed: {str(e)}")
@@ -0,0 +1,100 @@
+import logging
+
+import requests
+from celery import shared_task
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Avg
+
+from movies.hydration import fetch_and_store
+from movies.ingest import upsert_movies
+from movies.models import Movie, Rating
+from movies.recommender.precompute import active_user_ids, run_shard
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(
+    acks_late=True,
+    reject_on_worker_lost=True,
+    autoretry_for=(DatabaseError,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def ingest_movies(payloads):
+    """
+    Bulk upsert a batch of TMDb movie payloads.
+    Acked only after the write commits, so a crashed worker's batch is redelivered.
+    """
+    return upsert_movies(payloads)
+
+
+@shared_task(
+    rate_limit=getattr(settings, 'MOVIE_HYDRATION_RATE_LIMIT', '20/s'),
+    autoretry_for=(requests.RequestException, DatabaseError),
+    retry_backoff=True,
+    max_retries=3,
+)
+def hydrate_movie(tmdb_id, refresh=False):
+    """
+    Fetch and store full TMDb details for a movie first seen in list results,
+    or with refresh=True, re-fetch a stored movie past the TMDb cache.
+    The rate limit applies per worker.
+    """
+    fetch_and_store(tmdb_id, write=upsert_movies, refresh=refresh)
+
+
+@shared_task
+def refresh_movies(tmdb_ids):
+    """Fan a batch of admin refreshes out as rate-limited hydrate_movie tasks."""
+    for tmdb_id in tmdb_ids:
+        hydrate_movie.delay(tmdb_id, refresh=True)
+    return len(tmdb_ids)
+
+
+@shared_task(
+    acks_late=True,
+    reject_on_worker_lost=True,
+    autoretry_for=(DatabaseError,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def recompute_average_ratings(tmdb_ids):
+    """
+    Recompute Movie.average_rating for a batch of movies from their ratings,
+    with one grouped read over rating_movie_idx and one bulk update.
+    """
+    averages = dict(
+        Rating.objects.filter(tmdb_id__in=tmdb_ids)
+        .order_by()
+        .values('tmdb_id')
+        .annotate(average=Avg('rating'))
+        .values_list('tmdb_id', 'average')
+    )
+    movies = [
+        Movie(tmdb_id=tmdb_id, average_rating=averages.get(tmdb_id) or 0.0)
+        for tmdb_id in Movie.objects.filter(tmdb_id__in=tmdb_ids).values_list('tmdb_id', flat=True)
+    ]
+    Movie.objects.bulk_update(movies, ['average_rating'])
+    return len(movies)
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def precompute_recommendations_shard(user_ids, n=50, model='embeddings'):
+    """Score and store precomputed recommendations for one shard of users."""
+    users, stored, seconds = run_shard(user_ids, n=n, model=model)
+    logger.info(f"Precomputed recommendations for {stored}/{users} users in {seconds:.2f}s")
+    return stored
+
+
+@shared_task
+def precompute_recommendations(n=50, days=30, shard_size=500, model='embeddings'):
+    """
+    Nightly entry point (see CELERY_BEAT_SCHEDULE): shard the active users and
+    fan the shards out across the workers.
+    """
+    user_ids = active_user_ids(days)
+    for start in range(0, len(user_ids), shard_size):
+        precompute_recommendations_shard.delay(user_ids[start:start + shard_size], n=n, model=model)
+    return len(user_ids)
@@ -1,3 +1,1540 @@
-from django.test import TestCase
+import json
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from collections import Counter
+from datetime import timedelta
+from unittest import addModuleCleanup, mock, skipUnless
+from urllib.parse import urlencode
 
-# Create your tests here.
+import requests
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.db import connection, connections, router, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from kombu.exceptions import OperationalError
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from benchmarks import tmdb_stub
+from movies import (
+    genres, hydration, ingest, instrumentation, partitioning, posters, profiling, routers, schema, throttling, tmdb,
+    trending,
+)
+from movies.middleware import LoadSheddingMiddleware
+import numpy as np
+
+from movies.recommender import embeddings, evaluation, itemitem, precompute
+from movies.recommender.ann import ExactIndex, IVFIndex, top_k
+from movies.auth import ClaimsUser, get_full_user
+from movies.models import Movie, Rating, Recommendation, User, UserGenreAffinity, UserRecommendation, Watchlist
+from movies.tmdb import TMDbAPI
+
+
+# Tables that are expected to grow large in production. A sequential scan over
+# any of these inside a request is treated as a regression.
+LARGE_TABLES = {
+    Movie._meta.db_table,
+    Rating._meta.db_table,
+    Watchlist._meta.db_table,
+    User._meta.db_table,
+}
+
+
+
+def setUpModule():
+    # Ratings and watchlist writes feed the in-process trending and
+    # co-occurrence stores; keep their snapshots away from the developer's
+    # own state files.
+    overrides = override_settings(TRENDING_STATE_PATH=None, RECOMMENDER_STATE_PATH=None)
+    overrides.enable()
+    addModuleCleanup(overrides.disable)
+    for patcher in (mock.patch.object(trending, '_store', None), mock.patch.object(itemitem, '_store', None)):
+        patcher.start()
+        addModuleCleanup(patcher.stop)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Query plans are only checked against PostgreSQL.')
+@override_settings(MOVIE_INGEST_BACKEND='sync', MOVIE_HYDRATION_BACKEND='off')
+class QueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN on the queries issued by each API endpoint against a seeded
+    database and fails when the planner picks a sequential scan on a large table.
+    """
+
+    MOVIES = 20000
+    USERS = 500
+    RATINGS_PER_USER = 40
+    # Users with no activity, so joins to the user table plan as they would at scale.
+    IDLE_USERS = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(42)
+        now = timezone.now()
+
+        Movie.objects.bulk_create(
+            Movie(
+                tmdb_id=tmdb_id,
+                title=f"Movie {tmdb_id}",
+                release_year=1950 + tmdb_id % 75,
+                popularity=rng.random() * 1000,
+                cached_at=now,
+                hydrated_at=now,
+            )
+            for tmdb_id in range(1, cls.MOVIES + 1)
+        )
+        users = User.objects.bulk_create(
+            User(username=f"user{i}", email=f"user{i}@example.com")
+            for i in range(cls.USERS)
+        )
+        User.objects.bulk_create(
+            (User(username=f"idle{i}", email=f"idle{i}@example.com") for i in range(cls.IDLE_USERS)),
+            batch_size=5000,
+        )
+        ratings, watchlist = [], []
+        for user in users:
+            for tmdb_id in rng.sample(range(1, cls.MOVIES + 1), cls.RATINGS_PER_USER):
+                ratings.append(Rating(user=user, tmdb_id=tmdb_id, rating=rng.randint(1, 10)))
+                watchlist.append(Watchlist(user=user, tmdb_id=tmdb_id))
+        Rating.objects.bulk_create(ratings, batch_size=5000)
+        Watchlist.objects.bulk_create(watchlist, batch_size=5000)
+        Recommendation.objects.bulk_create(
+            Recommendation(tmdb_id=tmdb_id, title=f"Movie {tmdb_id}", popularity=tmdb_id)
+            for tmdb_id in range(1, 21)
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        cls.user = users[0]
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _tmdb_payload(self):
+        return [
+            {'id': tmdb_id, 'title': f"Movie {tmdb_id}", 'release_date': '2020-01-01'}
+            for tmdb_id in range(1, 21)
+        ]
+
+    def _seq_scans(self, plan):
+        """Yield the relation names of every Seq Scan node in a JSON plan."""
+        if plan.get('Node Type') == 'Seq Scan':
+            # Partitions (movies_rating_p3) count as their parent table.
+            yield re.sub(r'_p\d+$', '', plan.get('Relation Name', ''))
+        for child in plan.get('Plans', []):
+            yield from self._seq_scans(child)
+
+    def assertNoSeqScans(self, method, path, data=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(path, data, format='json')
+        self.assertLess(response.status_code, 500, response.content)
+
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scanned = set(self._seq_scans(plan[0]['Plan'])) & LARGE_TABLES
+            self.assertFalse(scanned, f"Sequential scan on {scanned} for {method.upper()} {path}:\n{sql}")
+
+    def test_movie_list(self):
+        self.assertNoSeqScans('get', '/api/movies/')
+        self.assertNoSeqScans('get', '/api/movies/?page=50')
+
+    def test_movie_list_cursor(self):
+        self.assertNoSeqScans('get', '/api/movies/?cursor=')
+
+    def test_movie_retrieve(self):
+        self.assertNoSeqScans('get', '/api/movies/1234/')
+
+    def test_movie_trending(self):
+        with mock.patch('movies.views.TMDbAPI.get_trending_movies', return_value=self._tmdb_payload()):
+            self.assertNoSeqScans('get', '/api/movies/trending/')
+
+    def test_movie_discover(self):
+        with mock.patch('movies.views.TMDbAPI.discover_movies', return_value=self._tmdb_payload()):
+            self.assertNoSeqScans('get', '/api/movies/discover/?genres=28')
+
+    def test_rating_list(self):
+        self.assertNoSeqScans('get', '/api/ratings/')
+
+    def test_rating_create(self):
+        self.assertNoSeqScans('post', '/api/ratings/', {'user': str(self.user.user_id), 'tmdb_id': 19999, 'rating': 7})
+
+    def test_watchlist_list(self):
+        self.assertNoSeqScans('get', '/api/watchlist/')
+
+    def test_recommendation_list(self):
+        self.assertNoSeqScans('get', '/api/recommendations/')
+
+    def test_user_retrieve(self):
+        self.assertNoSeqScans('get', f"/api/users/{self.user.user_id}/")
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.admin)
+        past = timezone.now() - timedelta(days=30)
+        date_range = urlencode({'timestamp__gte': past, 'timestamp__lt': past + timedelta(days=7)})
+        for path in [
+            '/admin/movies/movie/',
+            '/admin/movies/movie/?q=1234',
+            '/admin/movies/rating/',
+            '/admin/movies/rating/?q=1234',
+            '/admin/movies/rating/?q=user7%40example.com',
+            '/admin/movies/watchlist/',
+            '/admin/movies/watchlist/?q=1234',
+            '/admin/movies/watchlist/?q=user7%40example.com',
+            f"/admin/movies/watchlist/?{date_range.replace('timestamp', 'added_at')}",
+            '/admin/movies/user/?q=user7',
+            '/admin/autocomplete/?app_label=movies&model_name=rating&field_name=user&term=user7',
+        ]:
+            with self.subTest(path=path):
+                self.assertNoSeqScans('get', path)
+
+    def test_rating_lookups_by_id(self):
+        rating = Rating.objects.filter(user=self.user).first()
+        self.assertNoSeqScans('get', f'/api/ratings/{rating.id}/')
+        self.assertNoSeqScans('patch', f'/api/ratings/{rating.id}/', {'rating': 3})
+        # Staff look ratings up by id alone, across every partition.
+        self.client.force_authenticate(self.admin)
+        self.assertNoSeqScans('get', f'/api/ratings/{rating.id}/')
+        self.client.force_login(self.admin)
+        for path in [f'/admin/movies/rating/{rating.id}/change/', f'/admin/movies/rating/{rating.id}/delete/']:
+            with self.subTest(path=path):
+                self.assertNoSeqScans('get', path)
+
+    def test_admin_rating_date_filter(self):
+        # rating_time_brin only beats a sequential scan at scale, so check that it can serve the filter.
+        self.client.force_login(self.admin)
+        past = timezone.now() - timedelta(days=30)
+        date_range = urlencode({'timestamp__gte': past, 'timestamp__lt': past + timedelta(days=7)})
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        self.assertNoSeqScans('get', f'/admin/movies/rating/?{date_range}')
+
+
+@override_settings(MOVIE_INGEST_BACKEND='sync', MOVIE_HYDRATION_BACKEND='off')
+class MovieListPaginationTests(TestCase):
+    """The movie list keeps its page-number envelope unless the client asks for cursors."""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        Movie.objects.bulk_create(
+            Movie(tmdb_id=tmdb_id, title=f"Movie {tmdb_id}", release_year=2000 + tmdb_id % 3,
+                  cached_at=now, hydrated_at=now)
+            for tmdb_id in range(1, 46)
+        )
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def expected_ids(self):
+        return list(Movie.objects.order_by('-release_year', '-tmdb_id').values_list('tmdb_id', flat=True))
+
+    def test_page_number_by_default(self):
+        response = self.client.get('/api/movies/', {'page': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 45)
+        self.assertIn('page=3', response.data['next'])
+        self.assertEqual([m['tmdb_id'] for m in response.data['results']], self.expected_ids()[20:40])
+
+    def test_cursor_is_opt_in(self):
+        seen, url = [], '/api/movies/?cursor='
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            seen += [m['tmdb_id'] for m in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(seen, self.expected_ids())
+
+
+class BenchmarkHarnessTests(TestCase):
+    """The seeder, the TMDb stub and the query-count header used by the load tests."""
+
+    def test_seed_benchmark_data(self):
+        options = {'users': 20, 'movies': 50, 'ratings': 200, 'watchlist': 60, 'stdout': StringIO()}
+        call_command('seed_benchmark_data', **options)
+        call_command('seed_benchmark_data', clear=True, **options)
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Movie.objects.count(), 50)
+        self.assertEqual(Rating.objects.count(), 200)
+        self.assertEqual(Watchlist.objects.count(), 60)
+
+    def test_stub_serves_tmdb_client(self):
+        tmdb_stub.StubHandler.state = tmdb_stub.StubState(0, 0, 0, catalog_size=100, seed=1)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), tmdb_stub.StubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        with mock.patch.object(TMDbAPI, 'BASE_URL', f"http://127.0.0.1:{server.server_port}/3"):
+            self.assertEqual(TMDbAPI.get_movie_details(7, refresh=True), tmdb_stub.movie_details(7))
+            self.assertEqual(len(TMDbAPI.get_trending_movies(page=2)), tmdb_stub.PAGE_SIZE)
+        self.assertEqual(tmdb_stub.StubHandler.state.snapshot(), {'movie': 1, 'trending': 1, 'total': 2})
+
+    @override_settings(BENCHMARK_MODE=True)
+    def test_query_count_header(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('bench', 'bench@example.com', 'password'))
+        response = client.get('/api/watchlist/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(int(response['X-DB-Query-Count']), 0)
+
+
+def metric_samples(text):
+    """{(name, labels): value} from a Prometheus text exposition."""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            series, value = line.rsplit(' ', 1)
+            name, _, labels = series.partition('{')
+            samples[name, '{' + labels if labels else ''] = float(value)
+    return samples
+
+
+@override_settings(MOVIE_INGEST_BACKEND='sync', MOVIE_HYDRATION_BACKEND='off', TMDB_PREFETCH_MAX_PAGE=1,
+                   PERFORMANCE_SERVER_TIMING=True, METRICS_TOKEN='scrape-token',
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class InstrumentationTests(TestCase):
+    """Server-Timing headers and the /metrics exposition."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('timed', 'timed@example.com', 'password'))
+
+    def trending(self):
+        payload = {'results': [{'id': tmdb_id, 'title': f"Movie {tmdb_id}", 'release_date': '2020-01-01'}
+                               for tmdb_id in range(1, 4)]}
+        response = mock.Mock(status_code=200, json=mock.Mock(return_value=payload))
+        with mock.patch('movies.tmdb.requests.get', return_value=response):
+            return self.client.get('/api/movies/trending/')
+
+    def scrape(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        return metric_samples(response.content.decode())
+
+    def test_server_timing(self):
+        entries = dict(
+            entry.strip().split(';', 1) for entry in self.trending()['Server-Timing'].split(',')
+        )
+        self.assertEqual(set(entries), {'db', 'tmdb', 'serialize', 'cache-trending', 'total'})
+        self.assertIn('desc="1 calls"', entries['tmdb'])
+        self.assertEqual(entries['cache-trending'], 'desc="hit=0 miss=1"')
+        entries = dict(
+            entry.strip().split(';', 1) for entry in self.trending()['Server-Timing'].split(',')
+        )
+        self.assertIn('desc="0 calls"', entries['tmdb'])
+        self.assertEqual(entries['cache-trending'], 'desc="hit=1 miss=0"')
+
+    def test_histograms_and_cache_families(self):
+        route = '{route="movie-trending",method="GET",status="200"}'
+        hits = ('movies_cache_requests_total', '{family="trending",result="hit"}')
+        misses = ('movies_cache_requests_total', '{family="trending",result="miss"}')
+        before = self.scrape()
+        self.trending()
+        self.trending()
+        after = self.scrape()
+
+        def delta(key):
+            return after.get(key, 0) - before.get(key, 0)
+
+        self.assertEqual(delta(('movies_http_request_duration_seconds_count', route)), 2)
+        self.assertEqual(
+            delta(('movies_http_request_duration_seconds_bucket', route[:-1] + ',le="+Inf"}')), 2
+        )
+        self.assertEqual(delta(('movies_http_request_db_queries_count', '{route="movie-trending"}')), 2)
+        self.assertEqual((delta(hits), delta(misses)), (1, 1))
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = instrumentation.Histogram('h', "Test.", ('route',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(('r',), value)
+        samples = {(name, labels): value for name, labels, value in histogram.samples()}
+        self.assertEqual(samples['h_bucket', '{route="r",le="0.1"}'], 1)
+        self.assertEqual(samples['h_bucket', '{route="r",le="1.0"}'], 3)
+        self.assertEqual(samples['h_bucket', '{route="r",le="+Inf"}'], 4)
+        self.assertEqual(samples['h_count', '{route="r"}'], 4)
+        self.assertAlmostEqual(samples['h_sum', '{route="r"}'], 6.05)
+
+    def test_metrics_access(self):
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get('/metrics').status_code, 401)
+        self.assertEqual(anonymous.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        with override_settings(METRICS_TOKEN=None, DEBUG=False):
+            self.assertEqual(anonymous.get('/metrics').status_code, 403)
+            staff = User.objects.create_user('ops', 'ops@example.com', 'password', is_staff=True)
+            anonymous.force_login(staff)
+            self.assertEqual(anonymous.get('/metrics').status_code, 200)
+        with override_settings(METRICS_TOKEN=None, DEBUG=True):
+            self.assertEqual(APIClient().get('/metrics').status_code, 200)
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_THRESHOLD_MS=60000, PROFILING_MAX_PROFILES=50,
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ProfilingTests(TestCase):
+    """Sampled and forced request profiles, and the admin-only browser on /api/profiles/."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('profiled', 'profiled@example.com', 'password')
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        overrides = override_settings(PROFILING_DIR=directory.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        patcher = mock.patch.object(profiling.request_profiler, '_store', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def get(self, user, path='/api/watchlist/', **headers):
+        self.client.force_authenticate(user)
+        return self.client.get(path, headers=headers)
+
+    def test_store_is_a_ring_buffer(self):
+        store = profiling.ProfileStore(self.directory, max_profiles=2)
+        ids = [store.save({'route': f"r{i}"}, folded=Counter({'a;b': 3, 'a;c': 1})) for i in range(3)]
+        self.assertEqual([meta['id'] for meta in store.list()], ids[:0:-1])
+        self.assertIsNone(store.get(ids[0]))
+        self.assertIsNone(store.data_path(ids[0]))
+        self.assertEqual(store.data_path(ids[2]).read_text(), "a;b 3\na;c 1\n")
+        self.assertIsNone(store.get('../secrets'))
+
+    def test_collapse_stack_is_root_first(self):
+        stack = profiling.collapse_stack(sys._getframe())
+        self.assertTrue(stack.split(';')[-1].startswith('test_collapse_stack_is_root_first (tests.py:'))
+
+    def test_slow_requests_are_kept(self):
+        self.assertEqual(self.get(self.user).status_code, 200)
+        self.assertEqual(profiling.request_profiler.store.list(), [])
+        with override_settings(PROFILING_THRESHOLD_MS=0):
+            self.get(self.user)
+        [meta] = profiling.request_profiler.store.list()
+        self.assertEqual((meta['route'], meta['format'], meta['forced']), ('watchlist-list', 'folded', False))
+
+    def test_profile_header_is_staff_only(self):
+        with mock.patch.object(profiling.cProfile, 'Profile') as profile:
+            self.assertEqual(self.get(self.user, **{'X-Profile-Request': 'cprofile'}).status_code, 200)
+            APIClient().get('/api/movies/', headers={'X-Profile-Request': 'cprofile'})
+        profile.assert_not_called()
+        self.assertEqual(profiling.request_profiler.store.list(), [])
+
+        # Non-staff senders still get the threshold capture.
+        with override_settings(PROFILING_THRESHOLD_MS=0):
+            self.get(self.user, **{'X-Profile-Request': 'cprofile'})
+        self.assertEqual([meta['format'] for meta in profiling.request_profiler.store.list()], ['folded'])
+
+        self.get(self.staff, **{'X-Profile-Request': 'cprofile'})
+        meta = profiling.request_profiler.store.list()[0]
+        self.assertEqual((meta['format'], meta['forced']), ('pstats', True))
+
+    def test_profiles_api_is_admin_only(self):
+        self.get(self.staff, **{'X-Profile-Request': 'samples'})
+        [meta] = profiling.request_profiler.store.list()
+        for path in ('/api/profiles/', f"/api/profiles/{meta['id']}/", f"/api/profiles/{meta['id']}/download/"):
+            with self.subTest(path=path):
+                self.assertEqual(self.get(self.user, path).status_code, 403)
+        self.assertEqual([item['id'] for item in self.get(self.staff, '/api/profiles/').data], [meta['id']])
+        detail = self.get(self.staff, f"/api/profiles/{meta['id']}/").data
+        self.assertEqual(detail['route'], 'watchlist-list')
+        self.assertIn('queries', detail)
+        download = self.get(self.staff, f"/api/profiles/{meta['id']}/download/")
+        self.assertIn(f"{meta['id']}.folded", download['Content-Disposition'])
+        self.assertEqual(self.get(self.staff, '/api/profiles/1-1/').status_code, 404)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ClaimsUserTests(TestCase):
+    """Stateless JWT authentication from token claims."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('claims', 'claims@example.com', 'password')
+        self.client = APIClient()
+        response = self.client.post('/api/token/', {'email': 'claims@example.com', 'password': 'password'})
+        self.tokens = response.data
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+
+    def test_authenticates_without_user_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/watchlist/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in ctx.captured_queries if User._meta.db_table in q['sql']])
+        user = response.wsgi_request.user
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertEqual(user.user_id, self.user.user_id)
+        self.assertFalse(user.is_staff)
+
+    def test_refresh_rereads_staff_flags(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = APIClient().post('/api/token/refresh/', {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertTrue(self.client.get('/api/watchlist/').wsgi_request.user.is_staff)
+
+    def test_refresh_refuses_inactive_users(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = APIClient().post('/api/token/refresh/', {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_full_user_is_loaded_once_per_request(self):
+        user = self.client.get('/api/watchlist/').wsgi_request.user
+        with self.assertNumQueries(1):
+            self.assertEqual(get_full_user(user), self.user)
+            self.assertIs(get_full_user(user), get_full_user(user))
+        self.assertIs(get_full_user(self.user), self.user)
+
+
+@override_settings(MOVIE_INGEST_BACKEND='sync', MOVIE_HYDRATION_BACKEND='off',
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Routing against a second SQLite alias standing in for a lagging replica:
+    it has the tables but none of the rows written during the test.
+    """
+
+    REPLICA = 'replica_0'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Added after the test case has guarded its known aliases, and connected
+        # here, so the replica is usable without a test database of its own.
+        databases = {'default': settings.DATABASES['default'], cls.REPLICA: {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:',
+        }}
+        replica = connections.configure_settings(databases)[cls.REPLICA]
+        cls.enterClassContext(mock.patch.dict(settings.DATABASES, {cls.REPLICA: replica}))
+        cls.addClassCleanup(connections.__delitem__, cls.REPLICA)
+        connections[cls.REPLICA].connect()
+        # Built once the alias exists, as the router lists replicas when created.
+        cls.enterClassContext(mock.patch.object(router, 'routers', [routers.ReadReplicaRouter()]))
+        with connections[cls.REPLICA].schema_editor() as editor:
+            for model in (User, Movie, Rating):
+                editor.create_model(model)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('writer', 'writer@example.com', 'password')
+        Movie.objects.create(tmdb_id=7, title="Movie 7", release_year=2000)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_router(self):
+        replica_router = router.routers[0]
+        self.assertEqual(replica_router.replicas, [self.REPLICA])
+        self.assertEqual(replica_router.db_for_read(Movie), self.REPLICA)
+        self.assertEqual(replica_router.db_for_write(Movie), 'default')
+        self.assertFalse(replica_router.allow_migrate(self.REPLICA, 'movies'))
+        routers.pin_to_primary()
+        try:
+            self.assertEqual(replica_router.db_for_read(Movie), 'default')
+        finally:
+            routers._use_primary.set(False)
+
+    def test_reads_follow_writes(self):
+        self.assertEqual(self.client_for(self.user).get('/api/ratings/').data, [])
+
+        response = self.client_for(self.user).post(
+            '/api/ratings/', {'user': str(self.user.user_id), 'tmdb_id': 7, 'rating': 8}, format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertTrue(routers.has_recent_write(self.user.id))
+
+        # A later request through a fresh client, as another worker would see it.
+        self.assertEqual(len(self.client_for(self.user).get('/api/ratings/').data), 1)
+        # Other users keep reading from the replica.
+        other = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.assertEqual(self.client_for(other).get('/api/ratings/').data, [])
+
+        with override_settings(REPLICA_STICKY_SECONDS=0):
+            routers.mark_recent_write(self.user.id)
+        self.assertFalse(routers.has_recent_write(self.user.id))
+        self.assertEqual(self.client_for(self.user).get('/api/ratings/').data, [])
+
+
+class WriteBehindBufferTests(SimpleTestCase):
+    """Coalescing and retries of the in-process write-behind buffer."""
+
+    def buffer(self, flush, max_items=1000):
+        # Long intervals keep the background thread out of the way; tests drain by hand.
+        return ingest.WriteBehindBuffer(flush, max_items=max_items, interval=3600, max_backoff=86400)
+
+    def test_coalesces_by_movie(self):
+        flushed = []
+        buffer = self.buffer(flushed.append)
+        buffer.add([{'id': 1, 'title': 'Old', 'popularity': 1.0}, {'id': 2, 'title': 'Two'}])
+        buffer.add([{'id': 1, 'title': 'New'}])
+        self.assertEqual(buffer.pending(), 2)
+        self.assertTrue(buffer.drain())
+        self.assertEqual(flushed, [[{'id': 1, 'title': 'New', 'popularity': 1.0}, {'id': 2, 'title': 'Two'}]])
+        self.assertEqual(buffer.pending(), 0)
+
+    def test_flushes_when_full(self):
+        flushed = threading.Event()
+        buffer = self.buffer(lambda items: flushed.set(), max_items=2)
+        buffer.add([{'id': 1}])
+        self.assertFalse(flushed.wait(0.2))
+        buffer.add([{'id': 2}])
+        self.assertTrue(flushed.wait(5))
+
+    def test_failed_batch_is_requeued_with_backoff(self):
+        flush = mock.Mock(side_effect=[RuntimeError('database down'), RuntimeError('database down'), None])
+        buffer = self.buffer(flush)
+        buffer.add([{'id': 1, 'title': 'Old', 'popularity': 1.0}])
+        with self.assertLogs('movies.ingest', 'ERROR'):
+            self.assertFalse(buffer.drain())
+        first_backoff = buffer.backoff
+        # Payloads that arrive meanwhile win over the failed batch.
+        buffer.add([{'id': 1, 'title': 'New'}, {'id': 2}])
+        with self.assertLogs('movies.ingest', 'ERROR'):
+            self.assertFalse(buffer.drain())
+        self.assertGreater(buffer.backoff, first_backoff)
+        self.assertTrue(buffer.drain())
+        self.assertEqual(flush.call_args.args[0], [{'id': 1, 'title': 'New', 'popularity': 1.0}, {'id': 2}])
+        self.assertEqual(buffer.backoff, 0)
+
+
+@override_settings(MOVIE_INGEST_BACKEND='celery', MOVIE_INGEST_BATCH_SIZE=2)
+class PublishMoviesTests(TestCase):
+    """The 'celery' ingest backend publishes from the request path."""
+
+    payloads = [
+        {'id': 1, 'title': 'One', 'release_date': '2001-01-01'},
+        {'id': 2, 'title': 'Two', 'release_date': '2002-01-01'},
+        {'id': 1, 'title': 'One, again', 'release_date': '2001-01-01'},
+        {'id': 3, 'title': 'Three', 'release_date': '2003-01-01'},
+    ]
+
+    def test_publishes_coalesced_batches(self):
+        with mock.patch('movies.tasks.ingest_movies.delay') as delay:
+            ingest.enqueue_movies(self.payloads)
+        self.assertEqual([[m['id'] for m in call.args[0]] for call in delay.call_args_list], [[1, 2], [3]])
+        self.assertEqual(delay.call_args_list[0].args[0][0]['title'], 'One, again')
+        self.assertFalse(Movie.objects.exists())
+
+    def test_writes_inline_when_broker_is_down(self):
+        side_effect = [None, OperationalError('broker down')]
+        with mock.patch('movies.tasks.ingest_movies.delay', side_effect=side_effect), \
+                self.assertLogs('movies.ingest', 'ERROR'):
+            ingest.enqueue_movies(self.payloads)
+        self.assertEqual(list(Movie.objects.values_list('tmdb_id', flat=True)), [3])
+
+
+class MemoryTrendingStoreTests(SimpleTestCase):
+    """Decay, ordering and snapshots of the in-process trending store."""
+
+    NOW = 1_700_000_000.0
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = Path(self.dir.name) / 'trending.json'
+
+    def test_scores_decay_by_window(self):
+        store = trending.MemoryTrendingStore(None, max_members=100)
+        store.record(1, 1.0, self.NOW)
+        for window, tau in trending.WINDOWS.items():
+            [(tmdb_id, score)] = store.top(window, 10, self.NOW + tau)
+            self.assertEqual(tmdb_id, 1)
+            self.assertAlmostEqual(score, math.exp(-1))
+
+    def test_recent_activity_ranks_first(self):
+        store = trending.MemoryTrendingStore(None, max_members=100)
+        store.record(1, 1.0, self.NOW)
+        store.record(1, 1.0, self.NOW)
+        store.record(2, 1.0, self.NOW + 3 * 3600)
+        store.record(3, 1.5, self.NOW + 3 * 3600)
+        later = self.NOW + 3 * 3600
+        self.assertEqual([tmdb_id for tmdb_id, _ in store.top('hour', 10, later)], [3, 2, 1])
+        self.assertEqual([tmdb_id for tmdb_id, _ in store.top('week', 10, later)], [1, 3, 2])
+        self.assertEqual(len(store.top('week', 2, later)), 2)
+
+    def test_rebase_keeps_scores(self):
+        store = trending.MemoryTrendingStore(None, max_members=100)
+        store.record(1, 1.0, self.NOW)
+        later = self.NOW + (trending.MAX_EXPONENT + 1) * 3600
+        store.record(2, 1.0, later)
+        [(first, score), (second, old)] = store.top('week', 10, later)
+        self.assertEqual((first, second), (2, 1))
+        self.assertAlmostEqual(score, 1.0)
+        self.assertAlmostEqual(old, math.exp(-(later - self.NOW) / trending.WINDOWS['week']))
+        # Decayed below MIN_SCORE in the hour window, so dropped there.
+        self.assertEqual(store.top('hour', 10, later), [(2, 1.0)])
+
+    def test_caps_members(self):
+        store = trending.MemoryTrendingStore(None, max_members=3)
+        for tmdb_id in range(1, 8):
+            store.record(tmdb_id, float(tmdb_id), self.NOW)
+        self.assertEqual([tmdb_id for tmdb_id, _ in store.top('day', 10, self.NOW)], [7, 6, 5])
+        # Pruned back to the top members once twice the cap is passed.
+        self.assertEqual(sorted(store._windows['day']['scores']), [5, 6, 7])
+        store.record(1, 10.0, self.NOW)
+        self.assertEqual([tmdb_id for tmdb_id, _ in store.top('day', 2, self.NOW)], [1, 7])
+
+    def test_snapshot_is_saved_off_the_write_path(self):
+        store = trending.MemoryTrendingStore(self.path, max_members=100, persist_interval=3600)
+        store.record(7, 1.0, self.NOW)
+        self.assertFalse(self.path.exists())
+
+        store.snapshot.flush()
+        self.assertEqual(sorted(p.name for p in self.path.parent.iterdir()), ['trending.json'])
+        reloaded = trending.MemoryTrendingStore(self.path, max_members=100)
+        self.assertEqual(reloaded.top('day', 10, self.NOW), store.top('day', 10, self.NOW))
+
+
+class CooccurrenceTests(TestCase):
+    """Online item-item statistics: symmetry, agreement with a rebuild, snapshots."""
+
+    def assertStatsEqual(self, store, co, norms):
+        for item in set(norms) | set(store.norms):
+            self.assertAlmostEqual(store.norms.get(item, 0.0), norms.get(item, 0.0))
+            for other in set(co.get(item, {})) | set(store.co.get(item, {})):
+                self.assertAlmostEqual(store.co[item].get(other, 0.0), co.get(item, {}).get(other, 0.0))
+
+    def test_apply_then_revert_is_a_no_op(self):
+        store = itemitem.MemoryCooccurrenceStore(None)
+        history = {1: 0.8, 2: 0.5, 3: 1.3}
+        itemitem.apply_change(4, 0.0, 0.7, history, store=store)
+        self.assertAlmostEqual(store.co[4][1], 0.56)
+        self.assertEqual(store.co[1][4], store.co[4][1])
+        itemitem.apply_change(4, 0.7, 0.0, history, store=store)
+        self.assertStatsEqual(store, {}, {})
+
+    def test_online_updates_match_rebuild(self):
+        rng = random.Random(7)
+        store = itemitem.MemoryCooccurrenceStore(None)
+        histories = [{} for _ in range(6)]
+        for _ in range(200):
+            history = rng.choice(histories)
+            item = rng.randint(1, 10)
+            old = history.pop(item, 0.0)
+            new = rng.choice([0.0, itemitem.signal_value(rating=rng.randint(1, 10), in_watchlist=rng.random() < 0.3)])
+            itemitem.apply_change(item, old, new, history, store=store)
+            if new:
+                history[item] = new
+        co, norms = itemitem.build_statistics(histories)
+        self.assertStatsEqual(store, co, norms)
+
+        [(best, similarity)] = itemitem.similar_items(1, 1, store=store)
+        self.assertAlmostEqual(similarity, co[1][best] / math.sqrt(norms[1] * norms[best]))
+
+    def test_online_updates_after_rebuild_stay_exact(self):
+        # Item 1 co-occurs with many items; a rebuild keeps every pair, so
+        # later updates to its weakest pair still add to the full count.
+        histories = [{1: 1.0, other: 0.1 * other} for other in range(2, 12)]
+        store = itemitem.MemoryCooccurrenceStore(None)
+        store.replace(*itemitem.build_statistics(histories))
+        itemitem.apply_change(2, 0.2, 0.9, {1: 1.0}, store=store)
+        histories[0][2] = 0.9
+        co, norms = itemitem.build_statistics(histories)
+        self.assertStatsEqual(store, co, norms)
+        self.assertEqual(store.co[1][2], store.co[2][1])
+        self.assertEqual(len(itemitem.similar_items(1, 3, store=store)), 3)
+
+    def test_rating_writes_update_and_revert(self):
+        store = itemitem.MemoryCooccurrenceStore(None)
+        user = User.objects.create_user('cooc', 'cooc@example.com', 'password')
+        Rating.objects.create(user=user, tmdb_id=1, rating=10)
+        itemitem.apply_change(1, 0.0, 1.0, {}, store=store)
+        client = APIClient()
+        client.force_authenticate(user)
+        with mock.patch.object(itemitem, '_store', store), \
+                override_settings(MOVIE_INGEST_BACKEND='sync', MOVIE_HYDRATION_BACKEND='off'):
+            response = client.post('/api/ratings/', {'user': str(user.user_id), 'tmdb_id': 2, 'rating': 5}, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertAlmostEqual(store.co[1][2], 0.5)
+            client.delete(f"/api/ratings/{response.data['id']}/")
+        self.assertStatsEqual(store, {}, {1: 1.0})
+
+    def test_snapshot_is_saved_off_the_write_path(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'cooc.pickle'
+            store = itemitem.MemoryCooccurrenceStore(path, persist_interval=3600)
+            itemitem.apply_change(2, 0.0, 0.5, {1: 1.0}, store=store)
+            self.assertFalse(path.exists())
+            store.snapshot.flush()
+            self.assertEqual([p.name for p in path.parent.iterdir()], ['cooc.pickle'])
+            self.assertStatsEqual(itemitem.MemoryCooccurrenceStore(path), store.co, store.norms)
+
+            # A rebuild is saved at once.
+            store.replace({1: {3: 2.0}, 3: {1: 2.0}}, {1: 1.0, 3: 4.0})
+            self.assertEqual(itemitem.MemoryCooccurrenceStore(path).norms, {1: 1.0, 3: 4.0})
+
+
+class EmbeddingTests(SimpleTestCase):
+    """ALS training and the IVF index, checked against brute force."""
+
+    def clustered_vectors(self, n=3000, dim=16, clusters=40, seed=3):
+        rng = np.random.default_rng(seed)
+        centers = rng.standard_normal((clusters, dim))
+        vectors = centers[rng.integers(clusters, size=n)] + 0.3 * rng.standard_normal((n, dim))
+        return vectors.astype(np.float32), np.arange(100, 100 + n)
+
+    def test_top_k(self):
+        scores = np.random.default_rng(0).standard_normal(1000)
+        self.assertEqual(list(top_k(scores, 10)), list(np.argsort(-scores)[:10]))
+        self.assertEqual(len(top_k(scores[:3], 10)), 3)
+
+    def test_ivf_recall_against_brute_force(self):
+        vectors, ids = self.clustered_vectors()
+        exact = ExactIndex(vectors, ids)
+        index = IVFIndex.build(vectors, ids, seed=1)
+        queries = np.random.default_rng(4).standard_normal((50, vectors.shape[1])).astype(np.float32)
+
+        def recall(nprobe):
+            hits = sum(
+                len(set(index.search(query, 10, nprobe=nprobe)[0]) & set(exact.search(query, 10)[0]))
+                for query in queries
+            )
+            return hits / (10 * len(queries))
+
+        self.assertEqual(recall(index.n_lists), 1.0)
+        self.assertGreaterEqual(recall(8), 0.9)
+        self.assertLessEqual(recall(1), recall(8))
+
+        restored = IVFIndex.from_arrays(index.to_arrays())
+        self.assertEqual(list(restored.search(queries[0], 10)[0]), list(index.search(queries[0], 10)[0]))
+
+    def test_als_separates_tastes(self):
+        # Two groups of users, each interacting with a random part of its own half of the catalog.
+        rng = np.random.default_rng(5)
+        users, items, values = [], [], []
+        for user in range(200):
+            half = user % 2
+            for item in rng.choice(50, 15, replace=False) + 50 * half:
+                users.append(f"u{user}")
+                items.append(int(item) + 1)
+                values.append(itemitem.signal_value(rating=int(rng.integers(6, 11))))
+        interactions = embeddings.Interactions.from_arrays(users, items, values)
+        model = embeddings.EmbeddingModel.train(interactions, factors=8, iterations=8, n_lists=10, nprobe=10)
+
+        history = {item: 1.0 for item in range(1, 11)}
+        exact = model.recommend_exact(model.fold_in(history), k=10, exclude=history)
+        self.assertTrue(all(tmdb_id <= 50 for tmdb_id, _ in exact))
+        self.assertEqual(model.recommend('new-user', history, k=10), exact)
+        self.assertTrue(all(tmdb_id <= 50 for tmdb_id, _ in model.recommend('u0', {}, k=10)))
+
+
+class RankingMetricTests(SimpleTestCase):
+    def test_hand_computed_values(self):
+        precision, recall, ndcg = evaluation.ranking_metrics([1, 2, 3, 4], {2, 4, 9}, k=4)
+        self.assertAlmostEqual(precision, 0.5)
+        self.assertAlmostEqual(recall, 2 / 3)
+        dcg = 1 / math.log2(3) + 1 / math.log2(5)
+        ideal = 1 + 1 / math.log2(3) + 1 / math.log2(4)
+        self.assertAlmostEqual(ndcg, dcg / ideal)
+
+    def test_perfect_ranking(self):
+        self.assertEqual(evaluation.ranking_metrics([5, 6], {5, 6}, k=2), (1.0, 1.0, 1.0))
+
+    def test_short_and_empty_lists(self):
+        # Missing slots are misses for precision; the ideal ranking is capped at k.
+        precision, recall, ndcg = evaluation.ranking_metrics([7], {7, 8}, k=4)
+        self.assertEqual((precision, recall), (0.25, 0.5))
+        self.assertAlmostEqual(ndcg, 1 / (1 + 1 / math.log2(3)))
+        self.assertEqual(evaluation.ranking_metrics([], {7}, k=4), (0.0, 0.0, 0.0))
+        self.assertEqual(evaluation.ranking_metrics([7], set(), k=4), (0.0, 0.0, 0.0))
+
+
+class EvaluationHarnessTests(TransactionTestCase):
+    """The time split and an end-to-end run of `manage.py evaluate_recommender`."""
+
+    NOW = timezone.now()
+
+    def rate(self, user, tmdb_id, rating, days_ago):
+        rating = Rating.objects.create(user=user, tmdb_id=tmdb_id, rating=rating)
+        Rating.objects.filter(pk=rating.pk).update(timestamp=self.NOW - timedelta(days=days_ago))
+
+    def seed(self, users=12, movies=10):
+        rng = random.Random(5)
+        for index in range(users):
+            user = User.objects.create(username=f"eval{index}", email=f"eval{index}@example.com")
+            for days_ago, tmdb_id in enumerate(rng.sample(range(1, movies + 1), 6)):
+                self.rate(user, tmdb_id, rng.choice([4, 8, 9]), days_ago=60 - 10 * days_ago)
+        return users
+
+    def test_time_split_trains_on_earlier_ratings_only(self):
+        user = User.objects.create(username='split', email='split@example.com')
+        self.rate(user, 1, 8, days_ago=30)
+        self.rate(user, 2, 3, days_ago=20)
+        self.rate(user, 3, 9, days_ago=10)
+        self.rate(user, 4, 5, days_ago=5)
+        self.rate(user, 5, 8, days_ago=1)
+        Watchlist.objects.create(user=user, tmdb_id=6)
+        split = evaluation.time_split(test_fraction=0.4, relevant_rating=7.0)
+
+        later = Rating.objects.filter(timestamp__gte=split.cutoff).values_list('tmdb_id', flat=True)
+        self.assertEqual(sorted(later), [4, 5])
+        # The watchlist entry was added now, after the cutoff.
+        self.assertEqual(set(split.train[str(user.user_id)]), {1, 2, 3})
+        self.assertAlmostEqual(split.train[str(user.user_id)][1], 0.8)
+        # Item 4 is after the cutoff but below the relevance threshold.
+        self.assertEqual(split.test, {str(user.user_id): {5}})
+
+    def test_evaluate_recommender_report(self):
+        self.seed()
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / 'report.json'
+            call_command('evaluate_recommender', '--factors', '4', '--workers', '1', '--k', '5',
+                         '--output', str(output), stdout=StringIO())
+            report = json.loads(output.read_text())
+
+        self.assertLessEqual(
+            {'commit', 'cutoff', 'k', 'relevant_rating', 'train_users', 'test_users', 'catalog', 'wall_seconds'},
+            set(report),
+        )
+        self.assertEqual(report['k'], 5)
+        self.assertEqual([result['variant'] for result in report['results']], list(evaluation.VARIANTS))
+        for result in report['results']:
+            with self.subTest(variant=result['variant']):
+                self.assertEqual(result['users'], report['test_users'])
+                for key in ('precision_at_5', 'recall_at_5', 'ndcg_at_5', 'coverage'):
+                    self.assertTrue(0.0 <= result[key] <= 1.0, key)
+                for key in ('fit_seconds', 'peak_rss_growth_mb', 'latency_mean_ms', 'latency_p50_ms', 'latency_p99_ms'):
+                    self.assertGreaterEqual(result[key], 0.0, key)
+
+    def test_refuses_without_a_split(self):
+        with self.assertRaisesMessage(CommandError, 'Not enough ratings'):
+            call_command('evaluate_recommender', stdout=StringIO())
+
+
+@override_settings(PRECOMPUTED_RECS_REDIS_URL=None)
+class PrecomputedRecommendationTests(TestCase):
+    """Packed per-user lists and the two-query recommendation path."""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        Movie.objects.bulk_create(
+            Movie(tmdb_id=tmdb_id, title=f"Movie {tmdb_id}", release_year=2000, popularity=tmdb_id, cached_at=now)
+            for tmdb_id in range(1, 10)
+        )
+        cls.user = User.objects.create_user('precomputed', 'precomputed@example.com', 'password')
+
+    def test_packing(self):
+        blob = precompute.pack_ids([5, 3, 2 ** 31 - 1])
+        self.assertEqual(len(blob), 12)
+        self.assertEqual(precompute.unpack_ids(memoryview(blob)), [5, 3, 2 ** 31 - 1])
+
+    def test_database_store_upserts(self):
+        store = precompute.DatabaseRecommendationStore()
+        user_id = str(self.user.user_id)
+        self.assertIsNone(store.get(user_id))
+        store.put_many({user_id: [5, 3, 99, 7]})
+        store.put_many({user_id: [5, 3, 99, 8]})
+        self.assertEqual(store.get(user_id), [5, 3, 99, 8])
+        self.assertEqual(UserRecommendation.objects.count(), 1)
+
+    def test_list_is_served_in_two_queries(self):
+        precompute.DatabaseRecommendationStore().put_many({str(self.user.user_id): [5, 3, 99, 8]})
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch.object(precompute, '_store', None), self.assertNumQueries(2):
+            response = client.get('/api/recommendations/')
+        self.assertEqual([movie['tmdb_id'] for movie in response.data], [5, 3, 8])
+
+    def test_run_shard_with_item_item(self):
+        Rating.objects.create(user=self.user, tmdb_id=1, rating=10)
+        cooc = itemitem.MemoryCooccurrenceStore(None)
+        cooc.replace({1: {2: 1.0, 3: 0.5}, 2: {1: 1.0}, 3: {1: 0.5}}, {1: 1.0, 2: 1.0, 3: 1.0})
+        with mock.patch.object(itemitem, '_store', cooc), mock.patch.object(precompute, '_store', None):
+            self.assertEqual(precompute.run_shard([str(self.user.user_id)], model='itemitem')[:2], (1, 1))
+            self.assertEqual(precompute.get_recommendations(self.user.user_id), [2, 3])
+
+
+@override_settings(MOVIE_INGEST_BACKEND='sync', MOVIE_HYDRATION_BACKEND='off')
+class GenreAffinityTests(TestCase):
+    """Genre masks, incremental affinity profiles and the affinity re-rank."""
+
+    HORROR, COMEDY = 27, 35
+
+    @classmethod
+    def setUpTestData(cls):
+        ingest.upsert_movies([
+            {'id': tmdb_id, 'title': f"Movie {tmdb_id}", 'release_date': '2020-01-01',
+             'genre_ids': [cls.HORROR] if tmdb_id % 2 else [cls.COMEDY]}
+            for tmdb_id in range(1, 11)
+        ])
+        cls.user = User.objects.create_user('genres', 'genres@example.com', 'password',
+                                            preferences={'favorite_genres': ['comedy']})
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def index(self, genre_id):
+        return genres.GENRE_IDS.index(genre_id)
+
+    def rate(self, tmdb_id, rating):
+        response = self.client.post(
+            '/api/ratings/', {'user': str(self.user.user_id), 'tmdb_id': tmdb_id, 'rating': rating}, format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def test_masks(self):
+        vocabulary = genres.get_vocabulary()
+        mask = vocabulary.mask([self.HORROR, 'Comedy', 'no such genre', 999])
+        self.assertEqual(vocabulary.ids(mask), [35, 27])
+        self.assertEqual(genres.genre_mask({'genres': [{'id': 35, 'name': 'Comedy'}]}), vocabulary.mask([35]))
+        self.assertEqual(Movie.objects.get(tmdb_id=1).genre_mask, vocabulary.mask([self.HORROR]))
+
+    def test_incremental_profile_matches_rebuild(self):
+        for tmdb_id in (1, 3, 5):
+            self.rate(tmdb_id, 2)
+        rating_id = self.rate(4, 10)
+        self.client.patch(f"/api/ratings/{rating_id}/", {'rating': 9}, format='json')
+        incremental = genres.get_affinity(self.user.user_id)
+        self.assertLess(incremental[self.index(self.HORROR)], 0)
+        self.assertGreater(incremental[self.index(self.COMEDY)], 1)
+
+        genres.rebuild_affinities()
+        np.testing.assert_allclose(genres.get_affinity(self.user.user_id), incremental, rtol=1e-6)
+
+    def test_rating_of_unmasked_movie_deleted_after_hydration(self):
+        Movie.objects.filter(tmdb_id=1).update(genre_mask=0)
+        rating_id = self.rate(1, 2)
+        Movie.objects.filter(tmdb_id=1).update(genre_mask=genres.get_vocabulary().mask([self.HORROR]))
+        self.client.delete(f"/api/ratings/{rating_id}/")
+
+        profile = UserGenreAffinity.objects.get(user_id=self.user.user_id)
+        self.assertTrue((genres._vector(profile.counts) >= 0).all())
+        affinity = genres.get_affinity(self.user.user_id)
+        self.assertTrue(np.isfinite(affinity).all())
+        np.testing.assert_array_equal(affinity, genres.preference_vector(self.user.preferences))
+
+    def test_compose_is_finite(self):
+        counts = np.full(genres.N_GENRES, -genres.SMOOTHING, dtype=np.float32)
+        sums = np.full(genres.N_GENRES, np.nan, dtype=np.float32)
+        self.assertTrue(np.isfinite(genres.compose(np.zeros(genres.N_GENRES), sums, counts)).all())
+
+    def test_rerank(self):
+        self.rate(2, 10)
+        self.rate(5, 1)
+        movies = list(Movie.objects.filter(tmdb_id__in=[1, 2, 3, 4]).order_by('tmdb_id'))
+        ranked, scores = genres.rerank(movies, genres.get_affinity(self.user.user_id), min_affinity=0)
+        self.assertEqual([movie.tmdb_id for movie in ranked], [2, 4])
+        self.assertTrue((scores > 0).all())
+
+
+@override_settings(MOVIE_INGEST_BACKEND='sync', MOVIE_HYDRATION_BACKEND='sync')
+class HydrationTests(TestCase):
+    """Full-detail fetches for movies seen only in list results, de-duplicated by claim markers."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def details(self, endpoint, path, **params):
+        tmdb_id = int(path.rsplit('/', 1)[1])
+        return {'id': tmdb_id, 'title': f"Movie {tmdb_id}", 'release_date': '2020-01-01',
+                'genres': [{'id': 28, 'name': 'Action'}]}
+
+    def test_claims_are_exclusive(self):
+        self.assertEqual(hydration.claim([1, 2, 2, 3], ttl=60), [1, 2, 3])
+        self.assertEqual(hydration.claim([1, 4], ttl=60), [4])
+
+    def test_list_hits_fetch_details_once(self):
+        payload = [{'id': tmdb_id, 'title': f"Movie {tmdb_id}", 'release_date': '2020-01-01', 'genre_ids': [28]}
+                   for tmdb_id in range(1, 6)]
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('hydrate', 'hydrate@example.com', 'password'))
+        with mock.patch.object(TMDbAPI, 'get_trending_movies', return_value=payload), \
+                mock.patch.object(TMDbAPI, '_get', side_effect=self.details) as fetch:
+            client.get('/api/movies/trending/')
+            client.get('/api/movies/trending/')
+        self.assertEqual(sorted(call.args[1] for call in fetch.call_args_list), [f"/movie/{i}" for i in range(1, 6)])
+        self.assertEqual(Movie.objects.filter(hydrated_at__isnull=False, genres=['Action']).count(), 5)
+
+    def test_failed_fetch_releases_claim(self):
+        movie = Movie(tmdb_id=9, title="Movie 9", release_year=2020)
+        with mock.patch.object(TMDbAPI, '_get', side_effect=requests.ConnectionError('down')), \
+                self.assertLogs('movies.hydration', 'WARNING'):
+            hydration.hydrate_missing([movie])
+        with mock.patch.object(TMDbAPI, '_get', side_effect=self.details) as fetch:
+            self.assertEqual(hydration.hydrate_missing([movie]), 1)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertIsNotNone(Movie.objects.get(tmdb_id=9).hydrated_at)
+
+    def test_queue_is_bounded(self):
+        release = threading.Event()
+        queue = hydration.HydrationQueue(lambda tmdb_id: release.wait(5), concurrency=1, max_pending=2)
+        self.addCleanup(queue._executor.shutdown)
+        self.addCleanup(release.set)
+        ids = hydration.claim([1, 2, 3, 4], ttl=60)
+        self.assertEqual(queue.submit(ids), 2)
+        # Dropped ids are released, so a later list hit can queue them again.
+        self.assertEqual(hydration.claim([1, 2, 3, 4], ttl=60), [3, 4])
+
+
+class SynchronousExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+@override_settings(MOVIE_INGEST_BACKEND='sync', MOVIE_HYDRATION_BACKEND='off', TMDB_PREFETCH_MAX_PAGE=3,
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UpstreamPagingTests(TestCase):
+    """?page on the TMDb-backed lists: validation, Link headers, per-page caching and prefetch."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        patcher = mock.patch.object(tmdb, '_get_prefetch_executor', return_value=SynchronousExecutor())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('pager', 'pager@example.com', 'password'))
+        self.short_pages = set()
+
+    def upstream(self, endpoint, path, page=1, **params):
+        size = 5 if page in self.short_pages else tmdb.PAGE_SIZE
+        first = page * 100
+        return {'results': [{'id': tmdb_id, 'title': f"Movie {tmdb_id}", 'release_date': '2020-01-01'}
+                            for tmdb_id in range(first, first + size)]}
+
+    def get(self, path, **params):
+        with mock.patch.object(TMDbAPI, '_get', side_effect=self.upstream) as fetch:
+            response = self.client.get(path, params)
+        return response, [call.kwargs.get('page') for call in fetch.call_args_list]
+
+    def test_page_must_be_in_range(self):
+        for path in ('/api/movies/trending/', '/api/movies/discover/'):
+            for page in ('0', '501', 'two'):
+                with self.subTest(path=path, page=page):
+                    response, pages = self.get(path, page=page)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(pages, [])
+        response, _ = self.get('/api/movies/trending/', page=500)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('rel="next"', response['Link'])
+
+    def test_link_headers(self):
+        response, _ = self.get('/api/movies/discover/', page=2, genres='28')
+        self.assertEqual([movie['tmdb_id'] for movie in response.data][:2], [200, 201])
+        next_link, prev_link = response['Link'].split(', ')
+        self.assertIn('page=3', next_link)
+        self.assertIn('genres=28', next_link)
+        self.assertTrue(next_link.endswith('rel="next"'))
+        self.assertIn('page=1', prev_link)
+        self.assertTrue(prev_link.endswith('rel="prev"'))
+
+        response, _ = self.get('/api/movies/trending/')
+        self.assertEqual(response['Link'].count('rel='), 1)
+        self.short_pages.add(4)
+        response, _ = self.get('/api/movies/trending/', page=4)
+        self.assertNotIn('rel="next"', response['Link'])
+
+    def test_pages_are_cached_separately(self):
+        self.short_pages.update({1, 4})
+        self.assertEqual(self.get('/api/movies/trending/')[1], [1])
+        self.assertEqual(self.get('/api/movies/trending/', page=4)[1], [4])
+        self.assertEqual(self.get('/api/movies/trending/')[1], [])
+        self.assertEqual(self.get('/api/movies/trending/', time_window='week')[1], [1])
+
+    def test_full_pages_prefetch_the_next_up_to_the_cap(self):
+        # Page 1 also warms page 2, so reading on costs one upstream call per page.
+        self.assertEqual(self.get('/api/movies/trending/')[1], [1, 2])
+        self.assertEqual(self.get('/api/movies/trending/', page=2)[1], [3])
+        # TMDB_PREFETCH_MAX_PAGE is 3: page 3 does not warm page 4.
+        self.assertEqual(self.get('/api/movies/trending/', page=3)[1], [])
+        self.assertEqual(self.get('/api/movies/trending/', page=4)[1], [4])
+
+    def test_prefetch_claims(self):
+        fetch = mock.Mock()
+        with mock.patch.object(tmdb, '_get_prefetch_executor') as executor:
+            self.assertTrue(TMDbAPI.prefetch('trending_day_p9', fetch))
+            self.assertFalse(TMDbAPI.prefetch('trending_day_p9', fetch))
+        self.assertEqual(executor.return_value.submit.call_count, 1)
+
+        cache.set('trending_day_p8', [{'id': 1}])
+        self.assertFalse(TMDbAPI.prefetch('trending_day_p8', fetch))
+        fetch.assert_not_called()
+
+    def test_failed_prefetch_is_not_retried_until_the_claim_expires(self):
+        fetch = mock.Mock(side_effect=requests.ConnectionError('down'))
+        with self.assertLogs('movies.tmdb', 'WARNING'):
+            self.assertTrue(TMDbAPI.prefetch('trending_day_p7', fetch))
+        self.assertFalse(TMDbAPI.prefetch('trending_day_p7', fetch))
+        self.assertEqual(fetch.call_count, 1)
+        cache.delete('prefetching_trending_day_p7')
+        fetch.side_effect = None
+        self.assertTrue(TMDbAPI.prefetch('trending_day_p7', fetch))
+        self.assertTrue(TMDbAPI.prefetch('trending_day_p7', fetch))
+
+    def test_upstream_calls_have_a_timeout(self):
+        response = mock.Mock(status_code=200, json=mock.Mock(return_value={'results': []}))
+        with mock.patch('movies.tmdb.requests.get', return_value=response) as get:
+            TMDbAPI.get_trending_movies('day', 1)
+        self.assertEqual(get.call_args.kwargs['timeout'], TMDbAPI.TIMEOUT)
+
+
+class FakePosterFetcher:
+    def __init__(self):
+        self.calls = []
+
+    def fetch(self, width, name):
+        self.calls.append((width, name))
+        if name.startswith('missing'):
+            raise posters.PosterNotFound(f"{width}/{name}")
+        return f"{width}/{name}".encode() * 100
+
+
+def throttle_rates(**rates):
+    return override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates})
+
+
+class ThrottleTests(TestCase):
+    """GCRA limits, on DRF views and on the plain Django ones DRF does not see."""
+
+    def setUp(self):
+        patcher = mock.patch.object(throttling, '_limiter', throttling.MemoryLimiter())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def test_gcra_allows_burst_then_spaces_requests(self):
+        limiter = throttling.MemoryLimiter()
+        results = [limiter.hit('k', 5, 60, now=0.0) for _ in range(6)]
+        self.assertEqual([allowed for allowed, _ in results], [True] * 5 + [False])
+        self.assertAlmostEqual(results[-1][1], 12.0)
+        # One request is allowed back every period / limit seconds.
+        self.assertEqual(limiter.hit('k', 5, 60, now=11.9)[0], False)
+        self.assertEqual(limiter.hit('k', 5, 60, now=12.0)[0], True)
+        self.assertEqual(limiter.hit('other', 5, 60, now=12.0)[0], True)
+
+    @throttle_rates(request_anon='3/min')
+    def test_api_requests_are_throttled_per_client(self):
+        with mock.patch.object(TMDbAPI, 'get_trending_movies', return_value=[]):
+            codes = [self.client.get('/api/recommendations/', REMOTE_ADDR='10.0.0.1').status_code for _ in range(4)]
+            other = self.client.get('/api/recommendations/', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(codes, [200, 200, 200, 429])
+        self.assertEqual(other.status_code, 200)
+
+    @throttle_rates(request_anon='2/min')
+    def test_plain_views_are_throttled(self):
+        with mock.patch('movies.schema.get_document', return_value=None), self.assertLogs('movies.views', 'ERROR'):
+            codes = [self.client.get('/swagger.json').status_code for _ in range(3)]
+        self.assertEqual(codes, [503, 503, 429])
+
+    @throttle_rates(request_anon='100/min', upstream_anon='1/min')
+    def test_poster_misses_are_charged_to_upstream_budget(self):
+        fetcher = FakePosterFetcher()
+        with tempfile.TemporaryDirectory() as root, \
+                mock.patch.object(posters, '_cache', posters.PosterCache(root, 2 ** 20, fetcher)):
+            first = self.client.get('/api/posters/w92/a.jpg')
+            hit = self.client.get('/api/posters/w92/a.jpg')
+            miss = self.client.get('/api/posters/w92/b.jpg')
+        self.assertEqual((first.status_code, hit.status_code), (200, 200))
+        self.assertEqual(miss.status_code, 429)
+        self.assertIn('Retry-After', miss)
+        self.assertEqual(fetcher.calls, [('w92', 'a.jpg')])
+
+
+@override_settings(LOAD_SHED_MAX_QUEUE_MS=500, LOAD_SHED_MAX_IN_FLIGHT=0, LOAD_SHED_LATENCY_MS=0)
+class LoadSheddingTests(SimpleTestCase):
+    def setUp(self):
+        self.middleware = LoadSheddingMiddleware(lambda request: HttpResponse('ok'))
+        self.factory = RequestFactory()
+
+    def get(self, path='/api/movies/', **headers):
+        return self.middleware(self.factory.get(path, headers=headers))
+
+    def test_queue_time_formats(self):
+        now = 1700000000.0
+        for header in ('t=1699999999.75', 't=1699999999750', '1699999999750000'):
+            request = self.factory.get('/', headers={'X-Request-Start': header})
+            self.assertAlmostEqual(LoadSheddingMiddleware.queue_time(request, now=now), 0.25, places=3)
+        self.assertIsNone(LoadSheddingMiddleware.queue_time(self.factory.get('/'), now=now))
+        request = self.factory.get('/', headers={'X-Request-Start': 'garbage'})
+        self.assertIsNone(LoadSheddingMiddleware.queue_time(request, now=now))
+
+    def test_sheds_requests_queued_too_long(self):
+        self.assertEqual(self.get(**{'X-Request-Start': f"t={time.time() - 0.1:.3f}"}).status_code, 200)
+        self.assertEqual(self.get().status_code, 200)
+        response = self.get(**{'X-Request-Start': f"t={time.time() - 2:.3f}"})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.get('/metrics', **{'X-Request-Start': f"t={time.time() - 2:.3f}"}).status_code, 200)
+
+    @override_settings(LOAD_SHED_MAX_IN_FLIGHT=1)
+    def test_sheds_past_max_in_flight(self):
+        inner = []
+        middleware = LoadSheddingMiddleware(lambda request: inner.append(middleware(request)) or HttpResponse('ok'))
+        self.assertEqual(middleware(self.factory.get('/api/movies/')).status_code, 200)
+        self.assertEqual(inner[0].status_code, 503)
+
+
+@override_settings(DEBUG=False, OPENAPI_SCHEMA_MAX_AGE=3600)
+class OpenAPISchemaTests(TestCase):
+    """The schema is generated at deploy time and served from memory with an ETag."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'openapi.json'
+        overrides = override_settings(OPENAPI_SCHEMA_PATH=str(self.path))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        for patcher in (
+            mock.patch.object(schema, '_documents', {}),
+            mock.patch.object(throttling, '_limiter', throttling.MemoryLimiter()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def test_unavailable_until_generated(self):
+        with self.assertLogs('movies.views', 'ERROR'):
+            self.assertEqual(self.client.get('/swagger.json').status_code, 503)
+
+    def test_etag_and_not_modified(self):
+        call_command('generate_openapi_schema', stdout=StringIO())
+        response = self.client.get('/swagger.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/movies/', json.loads(response.content)['paths'])
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+
+        response = self.client.get('/swagger.json', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get('/swagger.json', HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+        yaml = self.client.get('/swagger.yaml')
+        self.assertEqual(yaml.status_code, 200)
+        self.assertNotEqual(yaml['ETag'], response['ETag'])
+
+    def test_reloads_when_file_changes(self):
+        call_command('generate_openapi_schema', stdout=StringIO())
+        etag = self.client.get('/swagger.json')['ETag']
+        self.path.write_bytes(b'{"swagger": "2.0", "paths": {}}')
+        os.utime(self.path, (time.time() + 10, time.time() + 10))
+        response = self.client.get('/swagger.json')
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['paths'], {})
+        with self.assertRaisesMessage(CommandError, 'out of date'):
+            call_command('generate_openapi_schema', '--check', stdout=StringIO())
+
+
+class PartitionRatingsCommandTests(SimpleTestCase):
+
+    def test_needs_postgresql(self):
+        # SimpleTestCase fails on any query, so the command must stop before touching the database.
+        with mock.patch.object(connections['default'], 'vendor', 'sqlite'):
+            with self.assertRaisesMessage(CommandError, 'needs PostgreSQL'):
+                call_command('partition_ratings', swap=True, stdout=StringIO())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Rating is only partitioned on PostgreSQL.')
+class PartitionRatingsTests(TransactionTestCase):
+    """
+    The online backfill and swap, run on a plain Rating table rebuilt from the
+    model while another connection keeps writing to it.
+    """
+
+    def setUp(self):
+        # Migration 0003 partitioned the empty test table; start again from a plain one.
+        with connection.schema_editor() as editor:
+            editor.execute(f'DROP TABLE {partitioning.TABLE}')
+            editor.create_model(Rating)
+        self.addCleanup(self.restore_partitioned)
+        self.users = User.objects.bulk_create(
+            User(username=f"rater{i}", email=f"rater{i}@example.com") for i in range(20)
+        )
+        Rating.objects.bulk_create(
+            Rating(user=user, tmdb_id=tmdb_id, rating=tmdb_id % 10 + 1) for user in self.users for tmdb_id in range(1, 31)
+        )
+
+    def restore_partitioned(self):
+        """Leave the table as migration 0003 does on a fresh database."""
+        if partitioning.state(connection) == 'backfilling':
+            partitioning.drop_shadow(connection)
+        with connection.schema_editor() as editor:
+            editor.execute(f'DROP TABLE IF EXISTS {partitioning.OLD}')
+            editor.execute(f'DROP TABLE {partitioning.TABLE}')
+            editor.create_model(Rating)
+        partitioning.create_shadow(connection, settings.RATING_PARTITIONS)
+        partitioning.swap(connection)
+        partitioning.drop_old(connection)
+
+    def rows(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {partitioning.COLUMNS} FROM {table} ORDER BY id')
+            return cursor.fetchall()
+
+    def write(self, stop, writes):
+        """Insert, update and delete ratings on this thread's own connection until `stop` is set."""
+        rng = random.Random(7)
+        high = Rating.objects.order_by('-id').values_list('id', flat=True).first()
+        try:
+            while not stop.is_set():
+                tmdb_id = 1000 + len(writes)
+                op = rng.choice(['create', 'rate', 'move', 'delete'])
+                ratings = Rating.objects.filter(id=rng.randint(1, high))
+                if op == 'create':
+                    Rating.objects.create(user=rng.choice(self.users), tmdb_id=tmdb_id, rating=5)
+                elif op == 'rate':
+                    ratings.update(rating=rng.randint(1, 10))
+                elif op == 'move':
+                    ratings.update(tmdb_id=tmdb_id)
+                else:
+                    ratings.delete()
+                writes.append(op)
+        finally:
+            connection.close()
+
+    def test_backfill_and_swap(self):
+        stop, writes = threading.Event(), []
+        writer = threading.Thread(target=self.write, args=(stop, writes))
+        writer.start()
+        try:
+            while len(writes) < 10 and writer.is_alive():
+                time.sleep(0.01)
+            # Small, paced batches so writes land on rows before and after the copy position.
+            call_command('partition_ratings', batch_size=40, pause_ms=20, stdout=StringIO())
+            copying = len(writes)
+        finally:
+            stop.set()
+            writer.join()
+        self.assertGreater(copying, 10)
+        self.assertEqual(set(writes), {'create', 'rate', 'move', 'delete'})
+        self.assertEqual(partitioning.state(connection), 'backfilling')
+
+        out = StringIO()
+        call_command('partition_ratings', swap=True, stdout=out)
+        self.assertIn(f"{partitioning.TABLE} is now partitioned", out.getvalue())
+        self.assertEqual(partitioning.state(connection), 'partitioned')
+        old_rows = self.rows(partitioning.OLD)
+        self.assertEqual(self.rows(partitioning.TABLE), old_rows)
+
+        # New ids continue after the old table's, and the old table can go.
+        rating = Rating.objects.create(user=self.users[0], tmdb_id=999999, rating=7)
+        self.assertGreater(rating.id, old_rows[-1][0])
+        self.assertEqual(Rating.objects.get(id=rating.id), rating)
+        call_command('partition_ratings', drop_old=True, stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [partitioning.OLD])
+            self.assertIsNone(cursor.fetchone()[0])
+
+    def test_swap_gives_up_on_lock(self):
+        call_command('partition_ratings', stdout=StringIO())
+        held, release = threading.Event(), threading.Event()
+
+        def hold_table():
+            try:
+                with transaction.atomic():
+                    list(Rating.objects.all()[:1])
+                    held.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        reader = threading.Thread(target=hold_table)
+        reader.start()
+        try:
+            held.wait(10)
+            with self.assertRaisesMessage(CommandError, 'did not get its lock'):
+                call_command('partition_ratings', swap=True, lock_timeout='100ms', stdout=StringIO())
+        finally:
+            release.set()
+            reader.join()
+        self.assertEqual(partitioning.state(connection), 'backfilling')
+        self.assertEqual(len(self.rows(partitioning.SHADOW)), 600)
+
+
+class PosterProxyTests(TestCase):
+    """Posters are fetched once per width into the content-addressed disk cache."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.fetcher = FakePosterFetcher()
+        self.cache = posters.PosterCache(self.root, 2 ** 20, self.fetcher)
+        for patcher in (
+            mock.patch.object(posters, '_cache', self.cache),
+            mock.patch.object(throttling, '_limiter', throttling.MemoryLimiter()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def test_poster_urls(self):
+        base = posters.base_url()
+        self.assertEqual(posters.poster_urls('/abc.jpg', base)['w92'], f"{base}w92/abc.jpg")
+        self.assertIsNone(posters.poster_urls(None, base))
+        self.assertIsNone(posters.poster_urls('/../etc/passwd', base))
+
+    def test_hits_are_served_from_disk(self):
+        first = self.client.get('/api/posters/w185/a.jpg')
+        second = self.client.get('/api/posters/w185/a.jpg')
+        other_width = self.client.get('/api/posters/w92/a.jpg')
+        self.assertEqual(b''.join(first.streaming_content), b'w185/a.jpg' * 100)
+        self.assertEqual(b''.join(second.streaming_content), b'w185/a.jpg' * 100)
+        self.assertEqual(other_width.status_code, 200)
+        self.assertEqual(self.fetcher.calls, [('w185', 'a.jpg'), ('w92', 'a.jpg')])
+        self.assertEqual(first['Content-Type'], 'image/jpeg')
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn('immutable', first['Cache-Control'])
+
+        response = self.client.get('/api/posters/w185/a.jpg', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(self.fetcher.calls), 2)
+
+    def test_not_found(self):
+        for path in ('/api/posters/w1000/a.jpg', '/api/posters/w92/a.gif', '/api/posters/w92/missing.jpg'):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path).status_code, 404)
+        self.assertEqual(self.fetcher.calls, [('w92', 'missing.jpg')])
+
+    def test_upstream_errors_are_503(self):
+        with mock.patch.object(self.fetcher, 'fetch', side_effect=requests.ConnectionError('down')), \
+                self.assertLogs('movies.views', 'ERROR'):
+            self.assertEqual(self.client.get('/api/posters/w92/a.jpg').status_code, 503)
+
+    def test_eviction_drops_least_recently_used(self):
+        cache = posters.PosterCache(self.root, 3500, self.fetcher)
+        for age, name in ((300, 'a.jpg'), (200, 'b.jpg'), (100, 'c.jpg')):
+            poster = cache.get('w92', name)
+            for path in (cache._ref_path('w92', name), poster.path):
+                os.utime(path, (time.time() - age, time.time() - age))
+        # The fourth poster puts the cache over its limit and evicts the oldest one.
+        with self.assertLogs('movies.posters', 'INFO'):
+            cache.get('w92', 'd.jpg')
+        self.assertLessEqual(sum(size for _, size, _ in cache._entries()), 3500 * posters.LOW_WATER)
+        cache.get('w92', 'b.jpg')
+        cache.get('w92', 'd.jpg')
+        cache.get('w92', 'a.jpg')
+        self.assertEqual([name for _, name in self.fetcher.calls], ['a.jpg', 'b.jpg', 'c.jpg', 'd.jpg', 'a.jpg'])
@@ -0,0 +1,215 @@
+import functools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from movies import instrumentation
+
+
+logger = logging.getLogger(__name__)
+
+RATE_UNITS = {
+    's': 1, 'sec': 1, 'second': 1,
+    'm': 60, 'min': 60, 'minute': 60,
+    'h': 3600, 'hour': 3600,
+    'd': 24 * 3600, 'day': 24 * 3600,
+}
+
+
+def parse_rate(rate):
+    """'60/min' -> (60, 60.0); None -> None."""
+    if rate is None:
+        return None
+    count, unit = rate.split('/')
+    return int(count), float(RATE_UNITS[unit.strip().lower()])
+
+
+class RedisLimiter:
+    """
+    GCRA (generic cell rate algorithm) limits shared by every worker through Redis.
+
+    - One key per client and scope holding its theoretical arrival time (TAT);
+      a check is one EVALSHA, so it is atomic across workers.
+    - Time comes from the Redis server, so worker clocks do not have to agree.
+    - Keys expire once the client is back to a full burst.
+    """
+
+    HIT_SCRIPT = """
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local interval = tonumber(ARGV[1])
+    local period = tonumber(ARGV[2])
+    local tat = tonumber(redis.call('GET', KEYS[1]))
+    if not tat or tat < now then
+        tat = now
+    end
+    local new_tat = tat + interval
+    if new_tat - now > period then
+        return {0, tostring(new_tat - period - now)}
+    end
+    redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+    return {1, '0'}
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self._hit = self.client.register_script(self.HIT_SCRIPT)
+
+    def hit(self, key, limit, period):
+        allowed, wait = self._hit(keys=[key], args=[period / limit, period])
+        return bool(allowed), float(wait)
+
+
+class MemoryLimiter:
+    """
+    In-process GCRA, for development and single-worker deployments.
+
+    - Same algorithm as RedisLimiter, one dict entry per client and scope.
+    - Limits are per process; use Redis when running several workers.
+    - Entries for clients back to a full burst are pruned once `max_keys` is reached.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._tats = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, period, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tat = max(self._tats.get(key, now), now)
+            new_tat = tat + period / limit
+            if new_tat - now > period:
+                return False, new_tat - period - now
+            if len(self._tats) >= self.max_keys and key not in self._tats:
+                self._tats = {k: v for k, v in self._tats.items() if v > now}
+            self._tats[key] = new_tat
+            return True, 0.0
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                url = getattr(settings, 'THROTTLE_REDIS_URL', None)
+                _limiter = RedisLimiter(url) if url else MemoryLimiter()
+    return _limiter
+
+
+def is_authenticated(request):
+    """Works for DRF requests and for plain Django ones, with or without a user."""
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_authenticated)
+
+
+class GCRAThrottle(BaseThrottle):
+    """
+    Base for the GCRA throttles.
+
+    - Anonymous clients are keyed by IP (honouring NUM_PROXIES), authenticated
+      ones by user id, and each has its own rate: `<scope>_anon` or `<scope>_user`
+      in DEFAULT_THROTTLE_RATES.
+    - A rate of None disables the throttle for that kind of client.
+    - If the limiter is unreachable, requests are let through and the error logged.
+    """
+
+    scope = None
+    _wait = None
+
+    def get_rate(self, request):
+        kind = 'user' if is_authenticated(request) else 'anon'
+        return f"{self.scope}_{kind}", api_settings.DEFAULT_THROTTLE_RATES.get(f"{self.scope}_{kind}")
+
+    def get_cache_key(self, request):
+        if is_authenticated(request):
+            return f"throttle:{self.scope}:user:{request.user.pk}"
+        return f"throttle:{self.scope}:anon:{self.get_ident(request)}"
+
+    def applies(self, request, view):
+        return True
+
+    def allow_request(self, request, view):
+        self._wait = None
+        return not self.applies(request, view) or self.check(request)
+
+    def check(self, request):
+        """Charge one request to the client's budget; False if it is over."""
+        scope, rate = self.get_rate(request)
+        parsed = parse_rate(rate)
+        if parsed is None:
+            return True
+        try:
+            allowed, wait = get_limiter().hit(self.get_cache_key(request), *parsed)
+        except Exception as e:
+            logger.error(f"Throttle check failed for {scope}: {str(e)}")
+            return True
+        if not allowed:
+            self._wait = wait
+            instrumentation.THROTTLED_REQUESTS.inc((scope,))
+        return allowed
+
+    def wait(self):
+        return self._wait
+
+
+class RequestRateThrottle(GCRAThrottle):
+    """Overall request budget per client, on every API endpoint."""
+
+    scope = 'request'
+
+
+class UpstreamRateThrottle(GCRAThrottle):
+    """
+    Tighter budget for actions that can call TMDb: those a view lists in
+    `upstream_actions`, plus uncached detail reads through throttle_upstream().
+    """
+
+    scope = 'upstream'
+
+    def applies(self, request, view):
+        return getattr(view, 'action', None) in getattr(view, 'upstream_actions', ())
+
+
+def throttle_upstream(request):
+    """
+    Charge one request against the upstream budget from inside a view, for
+    paths that only call TMDb on a cache miss. Raises Throttled when over it.
+    """
+    throttle = UpstreamRateThrottle()
+    if not throttle.check(request):
+        raise Throttled(wait=throttle.wait())
+
+
+def throttled_response(exc):
+    """The 429 DRF sends for `exc` (a Throttled), for plain Django views."""
+    response = JsonResponse({'detail': str(exc.detail)}, status=exc.status_code)
+    if exc.wait is not None:
+        response['Retry-After'] = str(exc.wait)
+    return response
+
+
+def throttle_view(view):
+    """
+    Hold a plain Django view, which DRF's throttles never see, to the overall
+    request budget. Views that can call TMDb also charge throttle_upstream().
+    """
+    @functools.wraps(view)
+    def wrapped(request, *args, **kwargs):
+        throttle = RequestRateThrottle()
+        if not throttle.check(request):
+            return throttled_response(Throttled(wait=throttle.wait()))
+        return view(request, *args, **kwargs)
+    return wrapped
@@ -1,7 +1,15 @@
+import logging
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 from django.core.cache import cache
 from datetime import timedelta
+from movies import instrumentation
+
+
+logger = logging.getLogger(__name__)
 
 
 class TMDbAPI:
@@ -18,30 +26,58 @@ class TMDbAPI:
     #     self.access_token = settings.TMDB_API_KEY
     #     self.base_url = "https://api.themoviedb.org/3/"
 
-    BASE_URL = "https://api.themoviedb.org/3"
+    BASE_URL = getattr(settings, 'TMDB_BASE_URL', "https://api.themoviedb.org/3")
+    TIMEOUT = getattr(settings, 'TMDB_TIMEOUT', 10)
     CACHE_TIMEOUT = timedelta(hours=24).total_seconds()
+    # The genre list changes almost never.
+    GENRES_CACHE_TIMEOUT = timedelta(days=7).total_seconds()
 
 
     @staticmethod
-    def get_movie_details(tmdb_id):
+    def _cache_get(cache_key):
         """
-        Fetch movie details from TMDb API.
+        Read from the cache and record the hit or miss for /metrics.
         """
-        cache_key = f"movie_{tmdb_id}"
         cached = cache.get(cache_key)
-        if cached:
-            return cached
-        
+        instrumentation.record_cache(cache_key, bool(cached))
+        return cached
 
-        url = f"{TMDbAPI.BASE_URL}/movie/{tmdb_id}"
+    @staticmethod
+    def _get(endpoint, path, **params):
+        """
+        Issue a GET against TMDb and return the decoded JSON body.
+        Records the call count and latency under `endpoint` for /metrics.
+        """
+        url = f"{TMDbAPI.BASE_URL}{path}"
         params = {
             'api_key': settings.TMDB_API_KEY,
-            'language': 'en-US'
+            'language': 'en-US',
+            **params,
         }
 
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            response = requests.get(url, params=params, timeout=TMDbAPI.TIMEOUT)
+            status = response.status_code
+            response.raise_for_status()
+            return response.json()
+        finally:
+            instrumentation.record_upstream(endpoint, status, time.perf_counter() - started)
+
+
+    @staticmethod
+    def get_movie_details(tmdb_id, refresh=False):
+        """
+        Fetch movie details from TMDb API.
+        With refresh=True the cached copy is bypassed and replaced.
+        """
+        cache_key = f"movie_{tmdb_id}"
+        cached = None if refresh else TMDbAPI._cache_get(cache_key)
+        if cached:
+            return cached
+
+        data = TMDbAPI._get('movie', f"/movie/{tmdb_id}")
 
         cache.set(cache_key, data, TMDbAPI.CACHE_TIMEOUT)
         return data
@@ -49,50 +85,119 @@ class TMDbAPI:
 
     
     @staticmethod
-    def get_trending_movies(time_window='day'):
+    def get_genres():
         """
-        Fetch trending movies from TMDb API.
+        Fetch the movie genre list ([{'id', 'name'}]) from TMDb API.
         """
+        from movies.genres import GENRES_CACHE_KEY
 
-        cache_key = f"trending_{time_window}"
-        cached = cache.get(cache_key)
+        cached = TMDbAPI._cache_get(GENRES_CACHE_KEY)
         if cached:
             return cached
-        
 
-        url = f"{TMDbAPI.BASE_URL}/trending/movie/{time_window}"
-        params = {
-            'api_key': settings.TMDB_API_KEY,
-            'language': 'en-US'
-        }
+        data = TMDbAPI._get('genres', "/genre/movie/list")['genres']
+        cache.set(GENRES_CACHE_KEY, data, TMDbAPI.GENRES_CACHE_TIMEOUT)
+        return data
+
 
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()['results']
+    @staticmethod
+    def prefetch(cache_key, fetch):
+        """
+        Warm `cache_key` in the background by calling `fetch`, unless it is
+        already cached or another request is already fetching it.
+        """
+        if cache.get(cache_key) is not None:
+            return False
+        if not cache.add(f"prefetching_{cache_key}", 1, PREFETCH_CLAIM_SECONDS):
+            return False
+        _get_prefetch_executor().submit(_run_prefetch, cache_key, fetch)
+        return True
+
+
+    @staticmethod
+    def _trending_key(time_window, page):
+        return f"trending_{time_window}_p{page}"
+
+    @staticmethod
+    def get_trending_movies(time_window='day', page=1):
+        """
+        Fetch one page of trending movies from TMDb API.
+        """
+
+        cache_key = TMDbAPI._trending_key(time_window, page)
+        cached = TMDbAPI._cache_get(cache_key)
+        if cached:
+            return cached
+
+        data = TMDbAPI._get('trending', f"/trending/movie/{time_window}", page=page)['results']
         cache.set(cache_key, data, TMDbAPI.CACHE_TIMEOUT)
         return data
 
+    @staticmethod
+    def prefetch_trending(time_window='day', page=1):
+        return TMDbAPI.prefetch(
+            TMDbAPI._trending_key(time_window, page),
+            lambda: TMDbAPI.get_trending_movies(time_window, page),
+        )
+
 
     @staticmethod
-    def discover_movies(genre_ids=None):
-        """Discover movies based on genre IDs."""
+    def _discover_key(genre_ids, page):
+        genres = '-'.join(map(str, sorted(genre_ids))) if genre_ids else 'all'
+        return f"discover_genres_{genres}_p{page}"
 
-        cache_key = f"discover_genres_{genre_ids}" if genre_ids else "discover_all"
-        cached = cache.get(cache_key)
+    @staticmethod
+    def discover_movies(genre_ids=None, page=1):
+        """Discover one page of movies based on genre IDs."""
+
+        cache_key = TMDbAPI._discover_key(genre_ids, page)
+        cached = TMDbAPI._cache_get(cache_key)
         if cached:
             return cached
-        
-        url = f"{TMDbAPI.BASE_URL}/discover/movie"
-        params = {
-            'api_key': settings.TMDB_API_KEY,
-            'language': 'en-US',
-        }
 
+        params = {'page': page}
         if genre_ids:
             params['with_genres'] = ','.join(map(str, genre_ids))
-        
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()['results']
+
+        data = TMDbAPI._get('discover', "/discover/movie", **params)['results']
         cache.set(cache_key, data, TMDbAPI.CACHE_TIMEOUT)
-        return data
\ No newline at end of file
+        return data
+
+    @staticmethod
+    def prefetch_discover(genre_ids=None, page=1):
+        return TMDbAPI.prefetch(
+            TMDbAPI._discover_key(genre_ids, page),
+            lambda: TMDbAPI.discover_movies(genre_ids, page),
+        )
+
+
+# TMDb serves at most this many pages of any list, PAGE_SIZE results each.
+MAX_PAGE = 500
+PAGE_SIZE = 20
+# A prefetch claim expires after this long, so a failed prefetch is retried later.
+PREFETCH_CLAIM_SECONDS = 30
+
+_prefetch_executor = None
+_prefetch_lock = threading.Lock()
+
+
+def _get_prefetch_executor():
+    global _prefetch_executor
+    if _prefetch_executor is None:
+        with _prefetch_lock:
+            if _prefetch_executor is None:
+                _prefetch_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'TMDB_PREFETCH_CONCURRENCY', 2),
+                    thread_name_prefix='tmdb-prefetch',
+                )
+    return _prefetch_executor
+
+
+def _run_prefetch(cache_key, fetch):
+    try:
+        fetch()
+    except Exception as e:
+        # The claim is left to expire, so a failing page is not refetched on every request.
+        logger.warning(f"Prefetch of {cache_key} failed: {str(e)}")
+    else:
+        cache.delete(f"prefetching_{cache_key}")
\ No newline at end of file
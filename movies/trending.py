@@ -0,0 +1,228 @@
+import json
+import logging
+import math
+import threading
+import time
+from heapq import nlargest
+from pathlib import Path
+
+from django.conf import settings
+
+from movies.snapshots import PeriodicSnapshot, write_atomic
+
+
+logger = logging.getLogger(__name__)
+
+# Decay time constants: an event's weight falls by 1/e after one window.
+WINDOWS = {
+    'hour': 3600,
+    'day': 24 * 3600,
+    'week': 7 * 24 * 3600,
+}
+
+# Weight of each activity type in the trending score.
+EVENT_WEIGHTS = {
+    'rating': 1.0,
+    'watchlist': 1.5,
+}
+
+# Stored scores are weight * exp((t - epoch) / tau) ("forward decay"), so an event
+# is a single increment and ranking never needs every score decayed. Scores are
+# rebased onto a new epoch before the exponent gets large enough to overflow.
+MAX_EXPONENT = 50.0
+# Scores that decay below this are dropped on rebase.
+MIN_SCORE = 1e-6
+
+
+class RedisTrendingStore:
+    """
+    Trending scores kept in one Redis sorted set per window.
+
+    - record: one ZINCRBY per window in a Lua script, O(log n).
+    - top: ZREVRANGE, O(log n + k).
+    - Each set is capped at `max_members`, dropping the lowest scores.
+    """
+
+    RECORD_SCRIPT = """
+    local epoch = tonumber(redis.call('GET', KEYS[2]))
+    local now = tonumber(ARGV[3])
+    local tau = tonumber(ARGV[4])
+    if not epoch then
+        epoch = now
+        redis.call('SET', KEYS[2], now)
+    end
+    local exponent = (now - epoch) / tau
+    if exponent > tonumber(ARGV[5]) then
+        local factor = math.exp(-exponent)
+        local items = redis.call('ZRANGE', KEYS[1], 0, -1, 'WITHSCORES')
+        for i = 1, #items, 2 do
+            local score = tonumber(items[i + 1]) * factor
+            if score < tonumber(ARGV[6]) then
+                redis.call('ZREM', KEYS[1], items[i])
+            else
+                redis.call('ZADD', KEYS[1], score, items[i])
+            end
+        end
+        redis.call('SET', KEYS[2], now)
+        exponent = 0
+    end
+    redis.call('ZINCRBY', KEYS[1], tonumber(ARGV[2]) * math.exp(exponent), ARGV[1])
+    local size = redis.call('ZCARD', KEYS[1])
+    local cap = tonumber(ARGV[7])
+    if size > cap then
+        redis.call('ZREMRANGEBYRANK', KEYS[1], 0, size - cap - 1)
+    end
+    return 1
+    """
+
+    def __init__(self, url, max_members):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.max_members = max_members
+        self._record = self.client.register_script(self.RECORD_SCRIPT)
+
+    def _keys(self, window):
+        return [f"trending:{window}", f"trending:{window}:epoch"]
+
+    def record(self, tmdb_id, weight, now):
+        pipe = self.client.pipeline(transaction=False)
+        for window, tau in WINDOWS.items():
+            self._record(
+                keys=self._keys(window),
+                args=[tmdb_id, weight, now, tau, MAX_EXPONENT, MIN_SCORE, self.max_members],
+                client=pipe,
+            )
+        pipe.execute()
+
+    def top(self, window, k, now):
+        key, epoch_key = self._keys(window)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zrevrange(key, 0, k - 1, withscores=True)
+        pipe.get(epoch_key)
+        items, epoch = pipe.execute()
+        if not items:
+            return []
+        factor = math.exp(-(now - float(epoch)) / WINDOWS[window])
+        return [(int(member), score * factor) for member, score in items]
+
+
+class MemoryTrendingStore:
+    """
+    In-process fallback for when no Redis is configured, for a single process only.
+
+    - Per window, a dict of scores: an event is one dict update, O(1).
+    - top: heapq.nlargest over the dict at read time, O(n log k).
+    - At most `max_members` are ranked. The dict may grow to twice that before
+      it is pruned back to the top `max_members`, so pruning is amortized O(1)
+      per event.
+    - State is saved to `path` as JSON by a background thread every
+      `persist_interval` seconds (see movies/snapshots.py) and reloaded on start.
+    - Scores are per process, and processes sharing `path` overwrite each
+      other's saves; use Redis when running several workers.
+    """
+
+    def __init__(self, path, max_members, persist_interval=60):
+        self.path = Path(path) if path else None
+        self.max_members = max_members
+        self._lock = threading.Lock()
+        self._windows = {window: {'epoch': None, 'scores': {}} for window in WINDOWS}
+        self.snapshot = PeriodicSnapshot(self.save, persist_interval, name='trending-snapshot') if self.path else None
+        self._load()
+
+    def _load(self):
+        if not self.path or not self.path.exists():
+            return
+        try:
+            state = json.loads(self.path.read_text())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load trending state from {self.path}: {str(e)}")
+            return
+        for window, data in state.items():
+            if window in self._windows:
+                self._windows[window] = {
+                    'epoch': data['epoch'],
+                    'scores': {int(k): v for k, v in data['scores'].items()},
+                }
+
+    def save(self):
+        """Write the scores to `path`; only the copy is taken under the lock."""
+        with self._lock:
+            state = {
+                window: {'epoch': data['epoch'], 'scores': dict(data['scores'])}
+                for window, data in self._windows.items()
+            }
+        write_atomic(self.path, json.dumps(state).encode())
+
+    def _rebase(self, data, exponent):
+        factor = math.exp(-exponent)
+        data['scores'] = {
+            tmdb_id: score * factor
+            for tmdb_id, score in data['scores'].items()
+            if score * factor >= MIN_SCORE
+        }
+
+    def _prune(self, data):
+        data['scores'] = dict(nlargest(self.max_members, data['scores'].items(), key=lambda item: item[1]))
+
+    def record(self, tmdb_id, weight, now):
+        with self._lock:
+            for window, tau in WINDOWS.items():
+                data = self._windows[window]
+                if data['epoch'] is None:
+                    data['epoch'] = now
+                exponent = (now - data['epoch']) / tau
+                if exponent > MAX_EXPONENT:
+                    self._rebase(data, exponent)
+                    data['epoch'] = now
+                    exponent = 0.0
+
+                scores = data['scores']
+                scores[tmdb_id] = scores.get(tmdb_id, 0.0) + weight * math.exp(exponent)
+                if len(scores) > 2 * self.max_members:
+                    self._prune(data)
+        if self.snapshot:
+            self.snapshot.mark()
+
+    def top(self, window, k, now):
+        with self._lock:
+            data = self._windows[window]
+            if data['epoch'] is None:
+                return []
+            ranked = nlargest(min(k, self.max_members), data['scores'].items(), key=lambda item: item[1])
+            factor = math.exp(-(now - data['epoch']) / WINDOWS[window])
+        return [(tmdb_id, score * factor) for tmdb_id, score in ranked]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                max_members = getattr(settings, 'TRENDING_MAX_MEMBERS', 10000)
+                url = getattr(settings, 'TRENDING_REDIS_URL', None)
+                if url:
+                    _store = RedisTrendingStore(url, max_members)
+                else:
+                    _store = MemoryTrendingStore(getattr(settings, 'TRENDING_STATE_PATH', None), max_members)
+    return _store
+
+
+def record_event(tmdb_id, kind):
+    """
+    Feed one rating or watchlist event into every trending window.
+    Failures are logged and never break the write that triggered them.
+    """
+    try:
+        get_store().record(int(tmdb_id), EVENT_WEIGHTS[kind], time.time())
+    except Exception as e:
+        logger.error(f"Failed to record trending event for movie {tmdb_id}: {str(e)}")
+
+
+def top_movies(window='day', k=20):
+    """Return [(tmdb_id, decayed score)] for the k highest-scoring movies in a window."""
+    return get_store().top(window, k, time.time())
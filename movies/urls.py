@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from movies.views import MovieViewSet, RatingViewSet, RecommendationViewSet, UserViewSet, WatchlistViewSet
+from movies.views import MovieViewSet, ProfileViewSet, RatingViewSet, RecommendationViewSet, UserViewSet, WatchlistViewSet, poster
 
 router = DefaultRouter()
 
@@ -9,7 +9,9 @@ router.register(r'movies', MovieViewSet, basename='movie')
 router.register(r'ratings', RatingViewSet, basename='rating')
 router.register(r'watchlist', WatchlistViewSet, basename='watchlist')
 router.register(r'recommendations', RecommendationViewSet, basename='recommendation')
+router.register(r'profiles', ProfileViewSet, basename='profile')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('posters/<str:width>/<str:name>', poster, name='poster'),
 ]
\ No newline at end of file
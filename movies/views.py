@@ -1,22 +1,39 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.utils.urls import replace_query_param
 from django.utils import timezone
 from datetime import timedelta
 from django.db.models import Avg
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
 import requests
 import logging
 from movies.models import Movie, Rating, Recommendation, User, Watchlist
 from movies.serializers import MovieSerializer, RatingSerializer, RecommendationSerializer,  UserSerializer, WatchlistSerializer
+from movies import tmdb
 from movies.tmdb import TMDbAPI
-from rest_framework.exceptions import PermissionDenied
+from movies.ingest import build_movies, enqueue_movies, movie_fields
+from movies.hydration import hydrate_missing
+from movies import genres
+from movies import trending as local_trending
+from movies.recommender import embeddings, itemitem, precompute
+from movies import instrumentation
+from movies import posters, schema
+from movies.profiling import ProfiledViewMixin, request_profiler
+from movies.routers import ReplicaRoutingMixin, pin_to_primary
+from rest_framework.exceptions import PermissionDenied, Throttled
 from movies.permissions import IsAuthenticatedOrReadOnlyForMovies, MovieAccessPermission
+from movies.pagination import MovieCursorPagination, MoviePageNumberPagination
+from movies.auth import get_full_user
+from movies.throttling import throttle_upstream, throttle_view, throttled_response
 
 
 # Create your views here.
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ProfiledViewMixin, ReplicaRoutingMixin, viewsets.ModelViewSet):
     """
     A simple ViewSet for viewing and editing users.
     - Allows users to retrieve their own profile information.
@@ -37,6 +54,9 @@ class UserViewSet(viewsets.ModelViewSet):
         """
         Restrict regular users to their own profile; admins can see all users.
         """
+        # Schema generation runs without a request user
+        if getattr(self, 'swagger_fake_view', False):
+            return User.objects.none()
         if self.request.user.is_staff:
             return User.objects.all()
         return User.objects.filter(user_id=self.request.user.user_id)
@@ -57,6 +77,8 @@ class UserViewSet(viewsets.ModelViewSet):
             str(self.request.user.user_id) != str(self.kwargs.get('pk')):
             raise PermissionDenied("You can only update your own profile.")
         serializer.save()
+        if 'preferences' in serializer.validated_data:
+            genres.update_preferences(serializer.instance.user_id, serializer.instance.preferences)
 
     def perform_destroy(self, instance):
         """
@@ -70,21 +92,56 @@ class UserViewSet(viewsets.ModelViewSet):
 # Set up logging
 logger = logging.getLogger(__name__)
 
-class MovieViewSet(viewsets.ReadOnlyModelViewSet):
+
+def rerank_by_affinity(request, movies, base_scores=None):
+    """
+    Re-rank movies by the requesting user's genre affinity when the request
+    asks for it with ?personalize=true; ?min_affinity= also drops weak matches.
+    Returns (movies, affinity scores or None).
+    """
+    if request.query_params.get('personalize', '').lower() not in ('1', 'true', 'yes'):
+        return movies, None
+    if not request.user.is_authenticated:
+        return movies, None
+    try:
+        min_affinity = float(request.query_params['min_affinity'])
+    except (KeyError, ValueError):
+        min_affinity = None
+    return genres.rerank(movies, genres.get_affinity(request.user.id), base_scores, min_affinity=min_affinity)
+
+class MovieViewSet(ProfiledViewMixin, ReplicaRoutingMixin, viewsets.ReadOnlyModelViewSet):
     """
     A ViewSet for viewing movies fetched from TMDb.
     - Uses TMDb ID as the lookup field
     - Automatically caches movie details for 24 hours
     - Handles all TMDb API interactions transparently
+    - Actions that call TMDb are held to the tighter upstream throttle
     """
     
     queryset = Movie.objects.all()
     serializer_class = MovieSerializer
+    pagination_class = MoviePageNumberPagination
     lookup_field = 'tmdb_id'
     permission_classes = [
         permissions.IsAuthenticated,
         MovieAccessPermission,
         ]
+    # Charged to the upstream throttle budget; uncached retrieves are charged in get_object
+    upstream_actions = ['trending', 'discover']
+
+    @property
+    def paginator(self):
+        """
+        Page-number envelope by default; cursor pagination for clients that
+        opt in with ?cursor=, which skips the count and deep offsets.
+        """
+        if not hasattr(self, '_paginator'):
+            request = getattr(self, 'request', None)
+            if request is not None and 'cursor' in request.query_params:
+                self._paginator = MovieCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_object(self):
         """
@@ -100,38 +157,29 @@ class MovieViewSet(viewsets.ReadOnlyModelViewSet):
             raise status.HTTP_404_NOT_FOUND("Invalid TMDb ID format")
 
         try:
-            # Check for cached version (less than 24 hours old)
+            # One read covers both the freshness check and the stored average rating
+            movie = Movie.objects.filter(tmdb_id=tmdb_id).first()
             cache_threshold = timezone.now() - timedelta(hours=24)
-            movie = Movie.objects.filter(
-                tmdb_id=tmdb_id, 
-                cached_at__gte=cache_threshold
-            ).first()
 
-            if not movie:
+            # Rows ingested from list results lack genre names until hydrated
+            if not movie or movie.cached_at < cache_threshold or movie.hydrated_at is None:
                 # Fetch from TMDb API if not cached or cache expired
+                throttle_upstream(self.request)
                 tmdb_data = TMDbAPI.get_movie_details(tmdb_id)
                 
                 if not tmdb_data.get('genres'):
                     logger.error(f"No genres found for movie {tmdb_id}")
                     raise status.HTTP_404_NOT_FOUND("No genres found for this movie")
 
-                # Update or create the movie record
-                movie, created = Movie.objects.update_or_create(
-                    tmdb_id=tmdb_id,
-                    defaults={
-                        'title': tmdb_data.get('title', ''),
-                        'release_year': self._extract_year(tmdb_data.get('release_date')),
-                        'overview': tmdb_data.get('overview', ''),
-                        'poster_path': tmdb_data.get('poster_path', ''),
-                        'genres': [g['name'] for g in tmdb_data.get('genres', [])],
-                        'popularity': tmdb_data.get('popularity', 0.0),
-                        'cached_at': timezone.now(),
-                    }
-                )
-                logger.info(f"{'Created' if created else 'Updated'} movie: {movie.title}")
+                # Serve the TMDb data now; the row is written behind the response
+                average_rating = movie.average_rating if movie else 0.0
+                movie = Movie(tmdb_id=tmdb_id, average_rating=average_rating, **movie_fields(tmdb_data))
+                enqueue_movies([tmdb_data])
 
             return movie
 
+        except Throttled:
+            raise
         except requests.RequestException as e:
             logger.error(f"TMDb API error for movie {tmdb_id}: {str(e)}")
             raise status.HTTP_404_NOT_FOUND("Failed to fetch movie data from TMDb")
@@ -139,14 +187,38 @@ class MovieViewSet(viewsets.ReadOnlyModelViewSet):
             logger.error(f"Unexpected error retrieving movie {tmdb_id}: {str(e)}")
             raise status.HTTP_404_NOT_FOUND("Internal server error")
 
-    def _extract_year(self, release_date):
-        """Helper method to extract year from release date string."""
-        if not release_date:
-            return None
+    def _upstream_page(self, request):
+        """The requested TMDb page (default 1), or None if out of range."""
         try:
-            return int(release_date[:4])
-        except (ValueError, TypeError):
+            page = int(request.query_params.get('page', 1))
+        except ValueError:
             return None
+        return page if 1 <= page <= tmdb.MAX_PAGE else None
+
+    def _has_next(self, movies_data, page):
+        """
+        Whether page + 1 should be prefetched: this page is full and the next
+        one is within TMDB_PREFETCH_MAX_PAGE, which bounds the upstream calls
+        a sequential reader can trigger ahead of their own requests.
+        """
+        max_page = min(getattr(settings, 'TMDB_PREFETCH_MAX_PAGE', 5), tmdb.MAX_PAGE)
+        return len(movies_data) >= tmdb.PAGE_SIZE and page < max_page
+
+    def _page_response(self, request, data, page, movies_data):
+        """
+        Respond with the page as a plain list, as before, with the neighbouring
+        pages in a Link header.
+        """
+        response = Response(data)
+        url = request.build_absolute_uri()
+        links = []
+        if len(movies_data) >= tmdb.PAGE_SIZE and page < tmdb.MAX_PAGE:
+            links.append(f'<{replace_query_param(url, "page", page + 1)}>; rel="next"')
+        if page > 1:
+            links.append(f'<{replace_query_param(url, "page", page - 1)}>; rel="prev"')
+        if links:
+            response['Link'] = ', '.join(links)
+        return response
 
     @action(detail=False, methods=['get'])
     def trending(self, request):
@@ -155,27 +227,25 @@ class MovieViewSet(viewsets.ReadOnlyModelViewSet):
             time_window = request.query_params.get('time_window', 'day')
             if time_window not in ['day', 'week']:
                 time_window = 'day'
-
-            movies_data = TMDbAPI.get_trending_movies(time_window)
-            
-            # Store trending movies in database for caching
-            movies = []
-            for movie_data in movies_data[:20]:  # Limit to 20 movies
-                movie, _ = Movie.objects.update_or_create(
-                    tmdb_id=movie_data['id'],
-                    defaults={
-                        'title': movie_data.get('title', ''),
-                        'release_year': self._extract_year(movie_data.get('release_date')),
-                        'overview': movie_data.get('overview', ''),
-                        'poster_path': movie_data.get('poster_path', ''),
-                        'popularity': movie_data.get('popularity', 0.0),
-                        'cached_at': timezone.now(),
-                    }
+            page = self._upstream_page(request)
+            if page is None:
+                return Response(
+                    {'error': f"page must be between 1 and {tmdb.MAX_PAGE}"},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-                movies.append(movie)
+
+            movies_data = TMDbAPI.get_trending_movies(time_window, page=page)
+            if self._has_next(movies_data, page):
+                TMDbAPI.prefetch_trending(time_window, page + 1)
+
+            # Serve TMDb data directly; storing it is queued behind the response
+            movies_data = movies_data[:20]  # Limit to 20 movies
+            movies = build_movies(movies_data)
+            enqueue_movies(movies_data)
+            hydrate_missing(movies)
 
             serializer = self.get_serializer(movies, many=True)
-            return Response(serializer.data)
+            return self._page_response(request, serializer.data, page, movies_data)
 
         except Exception as e:
             logger.error(f"Error fetching trending movies: {str(e)}")
@@ -199,27 +269,30 @@ class MovieViewSet(viewsets.ReadOnlyModelViewSet):
                     )
             else:
                 genre_ids = None
+            page = self._upstream_page(request)
+            if page is None:
+                return Response(
+                    {'error': f"page must be between 1 and {tmdb.MAX_PAGE}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-            movies_data = TMDbAPI.discover_movies(genre_ids)
+            movies_data = TMDbAPI.discover_movies(genre_ids, page=page)
+            if self._has_next(movies_data, page):
+                TMDbAPI.prefetch_discover(genre_ids, page + 1)
             
-            # Store discovered movies in database
-            movies = []
-            for movie_data in movies_data[:20]:  # Limit to 20 movies
-                movie, _ = Movie.objects.update_or_create(
-                    tmdb_id=movie_data['id'],
-                    defaults={
-                        'title': movie_data.get('title', ''),
-                        'release_year': self._extract_year(movie_data.get('release_date')),
-                        'overview': movie_data.get('overview', ''),
-                        'poster_path': movie_data.get('poster_path', ''),
-                        'popularity': movie_data.get('popularity', 0.0),
-                        'cached_at': timezone.now(),
-                    }
-                )
-                movies.append(movie)
+            # Serve TMDb data directly; storing it is queued behind the response
+            movies_data = movies_data[:20]  # Limit to 20 movies
+            movies = build_movies(movies_data)
+            enqueue_movies(movies_data)
+            hydrate_missing(movies)
+            movies, affinities = rerank_by_affinity(request, movies)
 
             serializer = self.get_serializer(movies, many=True)
-            return Response(serializer.data)
+            data = serializer.data
+            if affinities is not None:
+                for item, affinity in zip(data, affinities):
+                    item['affinity'] = round(float(affinity), 6)
+            return self._page_response(request, data, page, movies_data)
 
         except Exception as e:
             logger.error(f"Error discovering movies: {str(e)}")
@@ -228,6 +301,77 @@ class MovieViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
 
+    @action(detail=False, methods=['get'], url_path='genres')
+    def genre_list(self, request):
+        """TMDb movie genres with the bit each one occupies in genre masks."""
+        try:
+            TMDbAPI.get_genres()
+        except requests.RequestException as e:
+            logger.warning(f"TMDb genre list unavailable, serving built-in names: {str(e)}")
+        vocabulary = genres.get_vocabulary()
+        return Response([
+            {'id': genre_id, 'name': vocabulary.names[genre_id], 'bit': vocabulary.bits[genre_id]}
+            for genre_id in genres.GENRE_IDS
+        ])
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, tmdb_id=None):
+        """Movies most similar to this one, from the item-item co-occurrence model."""
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+            tmdb_id = int(tmdb_id)
+        except ValueError:
+            return Response(
+                {'error': 'Invalid TMDb ID or limit'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        similarities = dict(itemitem.similar_items(tmdb_id, limit))
+        movies = Movie.objects.in_bulk(list(similarities))
+        ranked = sorted(movies.values(), key=lambda movie: similarities[movie.tmdb_id], reverse=True)
+        data = self.get_serializer(ranked, many=True).data
+        for item in data:
+            item['similarity'] = round(similarities[item['tmdb_id']], 6)
+        return Response(data)
+
+    @action(detail=False, methods=['get'], url_path='trending/local')
+    def local_trending(self, request):
+        """
+        Movies trending among our own users, from time-decayed rating and
+        watchlist activity. `window` is hour, day or week; `blend` (0-1) mixes
+        in TMDb popularity.
+        """
+        window = request.query_params.get('window', 'day')
+        if window not in local_trending.WINDOWS:
+            window = 'day'
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+            blend = min(max(float(request.query_params.get('blend', 0.0)), 0.0), 1.0)
+        except ValueError:
+            return Response(
+                {'error': 'Invalid limit or blend'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        scores = dict(local_trending.top_movies(window, limit))
+        movies = Movie.objects.in_bulk(list(scores))
+        if not movies:
+            return Response([])
+
+        max_score = max(scores.values()) or 1.0
+        max_popularity = max(movie.popularity for movie in movies.values()) or 1.0
+        ranked = sorted(
+            movies.values(),
+            key=lambda movie: (1 - blend) * scores[movie.tmdb_id] / max_score
+            + blend * movie.popularity / max_popularity,
+            reverse=True,
+        )
+
+        data = self.get_serializer(ranked, many=True).data
+        for item in data:
+            item['trending_score'] = round(scores[item['tmdb_id']], 6)
+        return Response(data)
+
     def list(self, request):
         """List all cached movies with pagination."""
         queryset = self.filter_queryset(self.get_queryset())
@@ -247,7 +391,7 @@ class MovieViewSet(viewsets.ReadOnlyModelViewSet):
 
 
 
-class RatingViewSet(viewsets.ModelViewSet):
+class RatingViewSet(ProfiledViewMixin, ReplicaRoutingMixin, viewsets.ModelViewSet):
     """Viewset for managing movie ratings.
     - Allows users to create, retrieve, update, and delete ratings.
     - Automatically calculates and updates the average rating for movies.
@@ -264,16 +408,55 @@ class RatingViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
   
 
+    def get_queryset(self):
+        """
+        Restrict regular users to their own ratings; admins can see all ratings.
+        """
+        # Schema generation runs without a request user
+        if getattr(self, 'swagger_fake_view', False):
+            return Rating.objects.none()
+        if self.request.user.is_staff:
+            return Rating.objects.all()
+        return Rating.objects.filter(user_id=self.request.user.id)
+
     def perform_create(self, serializer):
         """Override to set the user automatically when creating a rating."""
-        serializer.save(user=self.request.user)
+        serializer.save(user=get_full_user(self.request.user))
         # Update average rating
         tmdb_id = serializer.validated_data['tmdb_id']
         avg_rating = Rating.objects.filter(tmdb_id=tmdb_id).aggregate(Avg('rating'))['rating__avg'] or 0.0
         Movie.objects.filter(tmdb_id=tmdb_id).update(average_rating=avg_rating)
+        local_trending.record_event(tmdb_id, 'rating')
+        itemitem.record_interaction(
+            serializer.instance.user_id, tmdb_id, itemitem.signal_value(rating=serializer.instance.rating)
+        )
+        genres.record_rating(serializer.instance.user_id, tmdb_id, new_rating=serializer.instance.rating)
+
+    def perform_update(self, serializer):
+        """Save the new rating and adjust the item-item statistics."""
+        old_rating = serializer.instance.rating
+        old_tmdb_id = serializer.instance.tmdb_id
+        rating = serializer.save()
+        if rating.tmdb_id != old_tmdb_id:
+            itemitem.record_interaction(rating.user_id, old_tmdb_id, -itemitem.signal_value(rating=old_rating))
+            itemitem.record_interaction(rating.user_id, rating.tmdb_id, itemitem.signal_value(rating=rating.rating))
+            genres.record_rating(rating.user_id, old_tmdb_id, old_rating=old_rating)
+            genres.record_rating(rating.user_id, rating.tmdb_id, new_rating=rating.rating)
+        else:
+            itemitem.record_interaction(
+                rating.user_id, rating.tmdb_id,
+                itemitem.signal_value(rating=rating.rating) - itemitem.signal_value(rating=old_rating),
+            )
+            genres.record_rating(rating.user_id, rating.tmdb_id, old_rating=old_rating, new_rating=rating.rating)
+
+    def perform_destroy(self, instance):
+        """Delete the rating and remove it from the item-item statistics."""
+        instance.delete()
+        itemitem.record_interaction(instance.user_id, instance.tmdb_id, -itemitem.signal_value(rating=instance.rating))
+        genres.record_rating(instance.user_id, instance.tmdb_id, old_rating=instance.rating)
 
 
-class WatchlistViewSet(viewsets.ModelViewSet):
+class WatchlistViewSet(ProfiledViewMixin, ReplicaRoutingMixin, viewsets.ModelViewSet):
     """Viewset for managing user watchlists.
     - Allows users to add and remove movies from their watchlist.
     - Requires user authentication for all actions.
@@ -286,15 +469,37 @@ class WatchlistViewSet(viewsets.ModelViewSet):
     serializer_class = WatchlistSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        """
+        Restrict regular users to their own watchlist; admins can see all entries.
+        """
+        # Schema generation runs without a request user
+        if getattr(self, 'swagger_fake_view', False):
+            return Watchlist.objects.none()
+        if self.request.user.is_staff:
+            return Watchlist.objects.all()
+        return Watchlist.objects.filter(user_id=self.request.user.id)
+
     def perform_create(self, serializer):
         """
         Save the user as the owner of the watchlist item.
         """
-        serializer.save(user=self.request.user)
+        serializer.save(user=get_full_user(self.request.user))
+        local_trending.record_event(serializer.validated_data['tmdb_id'], 'watchlist')
+        itemitem.record_interaction(
+            serializer.instance.user_id, serializer.instance.tmdb_id, itemitem.WATCHLIST_WEIGHT
+        )
+
+    def perform_destroy(self, instance):
+        """
+        Remove the watchlist item and its contribution to the item-item statistics.
+        """
+        instance.delete()
+        itemitem.record_interaction(instance.user_id, instance.tmdb_id, -itemitem.WATCHLIST_WEIGHT)
 
 
 
-class RecommendationViewSet(viewsets.ViewSet):
+class RecommendationViewSet(ProfiledViewMixin, ReplicaRoutingMixin, viewsets.ViewSet):
     """Viewset for retrieving movie recommendations.
     - Fetches movie recommendations from TMDb API.
     - Caches results for 24 hours to reduce API calls.
@@ -305,11 +510,21 @@ class RecommendationViewSet(viewsets.ViewSet):
     - Supports listing trending movies with pagination.
     - Automatically updates the cache with new trending movies.
     - Handles errors gracefully and logs them for debugging.
+    - Serves authenticated users their nightly precomputed list when there is one.
     """
 
     permission_classes = [IsAuthenticatedOrReadOnlyForMovies]
 
     def list(self, request):
+        # Precomputed personal list: one key lookup, then the movies by primary key
+        if request.user.is_authenticated:
+            tmdb_ids = precompute.get_recommendations(request.user.id)
+            if tmdb_ids:
+                movies = Movie.objects.only('tmdb_id', 'title', 'popularity', 'cached_at').in_bulk(tmdb_ids)
+                ranked = [movies[tmdb_id] for tmdb_id in tmdb_ids if tmdb_id in movies]
+                if ranked:
+                    return Response(RecommendationSerializer(ranked, many=True).data)
+
         # Check cache
         recommend = Recommendation.objects.filter(cached_at__gte=timezone.now() - timedelta(hours=24))
         if not recommend.exists():
@@ -322,6 +537,153 @@ class RecommendationViewSet(viewsets.ViewSet):
                     title=movie['title'],
                     popularity=movie.get('popularity', 0.0)
                 )
+            # Read back from the primary; replicas may not have the new rows yet.
+            pin_to_primary()
             recommend = Recommendation.objects.all()
         serializer = RecommendationSerializer(recommend, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='for-you', permission_classes=[permissions.IsAuthenticated])
+    def for_you(self, request):
+        """
+        Personalized picks from the matrix-factorization embeddings, retrieved
+        through the approximate nearest-neighbor index.
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            return Response(
+                {'error': 'Invalid limit'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        model = embeddings.get_model()
+        if model is None:
+            return Response(
+                {'error': 'Recommendations are not available yet'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+        scores = dict(model.recommend(request.user.id, itemitem.user_item_values(request.user.id), limit))
+        movies = Movie.objects.in_bulk(list(scores))
+        ranked = sorted(movies.values(), key=lambda movie: scores[movie.tmdb_id], reverse=True)
+        ranked, affinities = rerank_by_affinity(request, ranked, [scores[movie.tmdb_id] for movie in ranked])
+        data = MovieSerializer(ranked, many=True).data
+        for item in data:
+            item['score'] = round(scores[item['tmdb_id']], 6)
+        if affinities is not None:
+            for item, affinity in zip(data, affinities):
+                item['affinity'] = round(float(affinity), 6)
+        return Response(data)
+
+
+class ProfileViewSet(viewsets.ViewSet):
+    """Viewset for browsing captured request profiles.
+    - Lists profiles kept in the on-disk ring buffer (newest first).
+    - Retrieve returns the route, timing, query list and upstream calls.
+    - The download action returns the flamegraph-compatible profile file.
+    - Restricted to admin users.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    lookup_value_regex = r'[0-9]+-[0-9]+'
+
+    def list(self, request):
+        return Response(request_profiler.store.list())
+
+    def retrieve(self, request, pk=None):
+        meta = request_profiler.store.get(pk)
+        if meta is None:
+            raise Http404("Profile not found")
+        return Response(meta)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Download the collapsed-stack (.folded) or pstats (.prof) file."""
+        path = request_profiler.store.data_path(pk)
+        if path is None:
+            raise Http404("Profile not found")
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
+
+
+def metrics(request):
+    """
+    Expose request, TMDb and cache metrics in Prometheus text format.
+    - Values are aggregated per worker process; scrape every worker.
+    - Requires `Authorization: Bearer <METRICS_TOKEN>` when METRICS_TOKEN is set.
+    - Without a token it is open in DEBUG and limited to staff sessions otherwise.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        if request.headers.get('Authorization') != f"Bearer {token}":
+            return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    elif not settings.DEBUG and not getattr(request.user, 'is_staff', False):
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    return HttpResponse(
+        instrumentation.registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+@throttle_view
+def openapi_schema(request, fmt='json'):
+    """
+    Serve the OpenAPI schema written by `manage.py generate_openapi_schema`.
+    - Held in memory and sent with an ETag; a matching If-None-Match gets a 304.
+    - Generated per request only in DEBUG.
+    - Held to the request throttle budget.
+    """
+    document = schema.get_document(fmt)
+    if document is None:
+        logger.error("OpenAPI schema requested before `manage.py generate_openapi_schema` was run")
+        return JsonResponse(
+            {'error': "API schema is not available."},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    response = get_conditional_response(request, etag=document.etag)
+    if response is None:
+        response = HttpResponse(document.content, content_type=document.media_type)
+    response['ETag'] = document.etag
+    max_age = 0 if settings.DEBUG else getattr(settings, 'OPENAPI_SCHEMA_MAX_AGE', 3600)
+    response['Cache-Control'] = f"public, max-age={max_age}"
+    return response
+
+
+@throttle_view
+def poster(request, width, name):
+    """
+    Serve a TMDb poster at one of POSTER_WIDTHS from the local cache (see movies/posters.py).
+    - The file is streamed with FileResponse, so servers with wsgi.file_wrapper use sendfile.
+    - Content never changes under a URL, so it is sent with a long-lived Cache-Control
+      and its content hash as the ETag; a matching If-None-Match gets a 304.
+    - Held to the request throttle budget; cache misses, which fetch from TMDb,
+      are also charged to the upstream budget.
+    """
+    cache = posters.get_cache()
+    try:
+        # A file evicted between the lookup and the open is fetched again.
+        for attempt in range(2):
+            image = cache.get(width, name, on_miss=lambda: throttle_upstream(request))
+            response = get_conditional_response(request, etag=image.etag)
+            if response is not None:
+                break
+            try:
+                response = FileResponse(open(image.path, 'rb'), content_type=image.media_type)
+                break
+            except FileNotFoundError:
+                if attempt:
+                    raise
+    except posters.PosterNotFound:
+        raise Http404("Poster not found.")
+    except Throttled as e:
+        return throttled_response(e)
+    except requests.RequestException as e:
+        logger.error(f"Error fetching poster {width}/{name}: {str(e)}")
+        return JsonResponse(
+            {'error': 'Failed to fetch poster'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    response['ETag'] = image.etag
+    response['Cache-Control'] = f"public, max-age={settings.POSTER_MAX_AGE}, immutable"
+    return response
+